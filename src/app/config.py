@@ -19,10 +19,13 @@ class Settings(BaseModel):
     telegram_bot_token: str
     telegram_chat_id: str
     logfire_token: str
+    # bearer token of the /metrics scraper; /metrics is disabled without it
+    metrics_token: str | None = None
 
     @field_validator("*")
     def not_empty(cls, value):
-        if not value:
+        # optional settings that are not configured are None
+        if value is not None and not value:
             raise ValueError("Field cannot be empty")
         return value
 
@@ -41,6 +44,7 @@ try:
         telegram_bot_token=os.environ["TELEGRAM_BOT_TOKEN"],
         telegram_chat_id=os.environ["TELEGRAM_CHAT_ID"],
         logfire_token=os.environ["LOGFIRE_TOKEN"],
+        metrics_token=os.environ.get("METRICS_TOKEN") or None,
     )
 except ValueError as e:
     print(f"Configuration error: {e}")
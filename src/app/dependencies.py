@@ -0,0 +1,15 @@
+"""Dependencies shared by the routes."""
+
+import functools
+
+from src.app.config import settings
+from src.database.adapter import Database
+
+
+@functools.cache
+def get_db() -> Database:
+    # one engine for all requests of this process instead of one per request
+    return Database(
+        connection_string=settings.postgres_connection_string,
+        encryption_key=settings.encryption_key,
+    )
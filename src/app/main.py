@@ -1,4 +1,8 @@
 import logging
+import threading
+import warnings
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import FileResponse, HTMLResponse
@@ -9,11 +13,12 @@ from src.app.pages import home
 import logfire
 
 
-from src.app.routes import login, webhook, authorization
+from src.app.routes import login, webhook, authorization, metrics
+from src.app.config import settings
+from src.tasks.worker import WEBHOOK_WORKER_THREADS, start_workers
 
 
 load_dotenv(override=True)
-logfire.configure()
 
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.INFO)
@@ -31,11 +36,30 @@ logging.getLogger("stravalib.util.limiter.SleepingRateLimitRule").setLevel(
 )
 
 
-app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # configuring logfire loads credentials and contacts its API; the app
+    # serves requests meanwhile (spans before it is configured are dropped)
+    threading.Thread(
+        target=logfire.configure, name="logfire-configure", daemon=True
+    ).start()
+
+    # process queued webhook events in-process; `make worker` runs more
+    stop = threading.Event()
+    if WEBHOOK_WORKER_THREADS > 0:
+        start_workers(settings=settings, threads=WEBHOOK_WORKER_THREADS, stop=stop)
+    yield
+    stop.set()
+
+
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
 
-logfire.instrument_fastapi(
-    app, excluded_urls=["/health"]
-)  # Instrument FastAPI with logfire
+# logfire is configured in the lifespan, the instrumentation applies from then
+with warnings.catch_warnings():
+    warnings.filterwarnings("ignore", message="Instrumentation will have no effect")
+    logfire.instrument_fastapi(
+        app, excluded_urls=["/health", "/metrics"]
+    )  # Instrument FastAPI with logfire
 
 templates = Jinja2Templates(directory="src/app/templates")  # Configure Jinja2
 
@@ -44,6 +68,7 @@ app.include_router(home.router)
 app.include_router(login.router)
 app.include_router(webhook.router)
 app.include_router(authorization.router)
+app.include_router(metrics.router)
 app.mount("/static", StaticFiles(directory="src/app/static"), name="static")
 
 
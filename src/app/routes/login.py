@@ -1,3 +1,4 @@
+import html
 import logging
 import datetime
 from typing import Annotated
@@ -10,11 +11,15 @@ from dotenv import load_dotenv
 from src.app.routes.authorization import AUTHORIZATION_CALLBACK
 from src.app.schemas.login_request import LoginRequest
 from src.app.config import settings
-from src.database.models import UserType
-from src.tasks.etl import AuthETL, UserETL, ActivitiesETL
+from src.database.models import OnboardingStatus
+from src.tasks.onboarding import (
+    ONBOARDING_HISTORY_DAYS,
+    backfill_activities,
+    sync_recent_activities,
+)
 
 from src.database.adapter import Database
-from src.tasks.telegram import TelegramBot
+from src.tasks.telegram import get_telegram_notifier
 
 
 load_dotenv(override=True)
@@ -50,6 +55,9 @@ async def login(
     if state != settings.state:
         raise HTTPException(status_code=400, detail="Invalid state parameter")
 
+    # the ETLs are imported here so the app starts without stravalib
+    from src.tasks.etl import AuthETL, UserETL
+
     try:
         auth_uuid = AuthETL(
             code=login_request.code,
@@ -66,10 +74,14 @@ async def login(
         user_type=user_type,
     ).run()
 
-    if user_type == UserType.NEURALTAG.value:
-        days = 365 * 3
-    elif user_type == UserType.HISTORY.value:
-        days = 90
+    days = ONBOARDING_HISTORY_DAYS[user_type]
+
+    # webhooks arriving before the recent activities are synced wait for them
+    db = Database(
+        connection_string=settings.postgres_connection_string,
+        encryption_key=settings.encryption_key,
+    )
+    db.set_onboarding_status(auth_uuid, OnboardingStatus.PENDING.value)
 
     # fetch and load historic activities
     background_tasks.add_task(run_historic_activity_etl, auth_uuid=auth_uuid, days=days)
@@ -79,17 +91,19 @@ async def login(
 
 def run_historic_activity_etl(auth_uuid, days:int):
     logger.info(f"Starting historic activity ETL | auth_uuid: {auth_uuid}")
+    db = Database(
+        connection_string=settings.postgres_connection_string,
+        encryption_key=settings.encryption_key,
+    )
     try:
-        # days = 365 * 5
         before: datetime.datetime = datetime.datetime.now()
         after: datetime.datetime = before - datetime.timedelta(days=days)
-        activities_etl = ActivitiesETL(
-            auth_uuid=auth_uuid,
-            settings=settings,
-            after=after,
-            before=before,
+
+        # recent activities first so the athlete can be named right away,
+        # then the rest of the history
+        recent_after = sync_recent_activities(
+            settings=settings, db=db, auth_uuid=auth_uuid, now=before
         )
-        activities_etl.run()
 
         try:
             send_new_user_message(auth_uuid=auth_uuid)
@@ -98,6 +112,14 @@ def run_historic_activity_etl(auth_uuid, days:int):
                 f"Error new user message to telegram bot | auth_uuid: {auth_uuid}"
             )
 
+        backfill_activities(
+            settings=settings,
+            db=db,
+            auth_uuid=auth_uuid,
+            after=after,
+            before=recent_after,
+        )
+
     except:
         logger.exception(f"Error during historic activity ETL | auth_uuid: {auth_uuid}")
         # reraise
@@ -116,11 +138,12 @@ def send_new_user_message(auth_uuid: str):
     )
     user = db.get_user_by_auth_id(auth_uuid)
 
-    tb = TelegramBot(
-        token=settings.telegram_bot_token,
-        chat_id=settings.telegram_chat_id,
-        parse_mode="HTML",
-    )
-    tb.send_message(
-        message=f"New {user.user_type} user: {user.name} {user.lastname} ({user.athlete_id})\n",
+    # sent in the background, onboarding waves as one message
+    get_telegram_notifier(
+        token=settings.telegram_bot_token, chat_id=settings.telegram_chat_id
+    ).notify(
+        html.escape(
+            f"New {user.user_type} user: {user.name} {user.lastname} ({user.athlete_id})"
+        ),
+        digest_key="New users",
     )
@@ -0,0 +1,230 @@
+"""Prometheus metrics of the pools, queues and caches of this process.
+
+Counters of every `Counters` group, the stage duration histograms, the
+Strava rate budget, Strava connection reuse, database pool activity and the
+webhook job queue are rendered in the Prometheus text exposition format.
+
+The scraper authenticates with the `METRICS_TOKEN` bearer token; without a
+configured token the endpoint is disabled.
+"""
+
+import logging
+import secrets
+import sys
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from src.app.config import settings
+from src.app.dependencies import get_db
+from src.database.adapter import Database
+from src.metrics_registry import COUNTERS, HISTOGRAMS, Counters
+from src.tasks.rate_budget import rate_budget
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+METRIC_PREFIX = "neuraltag"
+
+# Cache name -> (counters group, hit key, miss key)
+CACHE_COUNTERS = {
+    "strava_client": ("strava_client_pool", "clients_reused", "clients_created"),
+    "strava_token": ("strava_tokens", "reused", "refreshed"),
+    "stream_render": ("stream_render", "hits", "misses"),
+}
+
+# Connection pool activity of all engines of this process
+pool_counters = Counters("db_pool")
+
+
+@event.listens_for(Pool, "connect")
+def _count_pool_connect(dbapi_connection, connection_record):
+    pool_counters.incr("connects")
+
+
+@event.listens_for(Pool, "checkout")
+def _count_pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_counters.incr("checkouts")
+
+
+@event.listens_for(Pool, "checkin")
+def _count_pool_checkin(dbapi_connection, connection_record):
+    pool_counters.incr("checkins")
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def require_metrics_token(
+    credentials: Annotated[HTTPAuthorizationCredentials | None, Depends(_bearer)],
+):
+    if settings.metrics_token is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if credentials is None or not secrets.compare_digest(
+        credentials.credentials.encode(), settings.metrics_token.encode()
+    ):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsWriter:
+    """Collects samples grouped by metric, in the Prometheus text format."""
+
+    def __init__(self):
+        self._lines: list[str] = []
+
+    def metric(self, name: str, metric_type: str, help_text: str):
+        name = f"{METRIC_PREFIX}_{name}"
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} {metric_type}")
+
+    def sample(self, name: str, value, **labels):
+        if value is None:
+            return
+        label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        if label_text:
+            label_text = f"{{{label_text}}}"
+        value = float(value)
+        value_text = str(int(value)) if value.is_integer() else repr(value)
+        self._lines.append(f"{METRIC_PREFIX}_{name}{label_text} {value_text}")
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+
+def _write_counters(writer: MetricsWriter):
+    writer.metric("counter_total", "counter", "Process-wide event counters.")
+    for group_name, group in sorted(COUNTERS.items()):
+        for key, value in sorted(group.snapshot().items()):
+            writer.sample("counter_total", value, group=group_name, key=key)
+
+    writer.metric("cache_hit_ratio", "gauge", "Share of cache lookups that were hits.")
+    for cache, (group_name, hit_key, miss_key) in CACHE_COUNTERS.items():
+        group = COUNTERS.get(group_name)
+        if group is None:
+            continue
+        hits, misses = group.get(hit_key), group.get(miss_key)
+        if hits + misses:
+            writer.sample("cache_hit_ratio", hits / (hits + misses), cache=cache)
+
+
+def _write_histograms(writer: MetricsWriter):
+    for name, histograms in sorted(HISTOGRAMS.items()):
+        writer.metric(name, "histogram", histograms.description)
+        for series in histograms.snapshot():
+            labels = {histograms.key_label: series["key"], **series["labels"]}
+            cumulative = 0
+            bounds = [*histograms.buckets, "+Inf"]
+            for bound, count in zip(bounds, series["counts"]):
+                cumulative += count
+                writer.sample(f"{name}_bucket", cumulative, **labels, le=bound)
+            writer.sample(f"{name}_sum", series["sum"], **labels)
+            writer.sample(f"{name}_count", series["count"], **labels)
+
+
+def _write_pool(writer: MetricsWriter):
+    pool = pool_counters.snapshot()
+    writer.metric(
+        "db_pool_checked_out", "gauge", "Database connections currently checked out."
+    )
+    writer.sample(
+        "db_pool_checked_out", pool.get("checkouts", 0) - pool.get("checkins", 0)
+    )
+
+
+def _write_strava_connections(writer: MetricsWriter):
+    # importing the Strava module pulls in stravalib; before anything used it
+    # there are no connections to report
+    strava = sys.modules.get("src.tasks.strava")
+    if strava is None:
+        return
+    stats = strava.client_pool.connection_stats()
+    writer.metric(
+        "strava_connections_opened",
+        "gauge",
+        "Connections opened by the shared Strava HTTP session.",
+    )
+    writer.sample("strava_connections_opened", stats["connections_opened"])
+    writer.metric(
+        "strava_requests", "gauge", "Requests sent over the shared Strava HTTP session."
+    )
+    writer.sample("strava_requests", stats["requests"])
+    writer.metric(
+        "strava_connection_reuse_ratio",
+        "gauge",
+        "Share of Strava requests sent over an already open connection.",
+    )
+    writer.sample("strava_connection_reuse_ratio", stats["connection_reuse_ratio"])
+
+
+def _write_rate_budget(writer: MetricsWriter):
+    remaining = rate_budget.remaining()
+    writer.metric(
+        "strava_rate_remaining", "gauge", "Remaining app-wide Strava requests."
+    )
+    writer.sample("strava_rate_remaining", remaining["short_remaining"], window="15m")
+    writer.sample("strava_rate_remaining", remaining["long_remaining"], window="day")
+    writer.metric("strava_rate_limit", "gauge", "App-wide Strava request limit.")
+    writer.sample("strava_rate_limit", remaining["short_limit"], window="15m")
+    writer.sample("strava_rate_limit", remaining["long_limit"], window="day")
+
+
+def _write_queue(writer: MetricsWriter, db: Database):
+    try:
+        stats = db.get_webhook_queue_stats()
+    except Exception:
+        # the other metrics are still worth reporting without the database
+        logger.exception("Could not read the webhook job queue stats")
+        return
+
+    writer.metric("webhook_jobs", "gauge", "Webhook jobs by status.")
+    for status, count in sorted(stats["jobs"].items()):
+        writer.sample("webhook_jobs", count, status=status)
+    writer.metric(
+        "webhook_job_oldest_age_seconds", "gauge", "Age of the oldest webhook job."
+    )
+    for status, age in sorted(stats["oldest_age_seconds"].items()):
+        writer.sample("webhook_job_oldest_age_seconds", age, status=status)
+    writer.metric("webhook_jobs_due", "gauge", "Pending webhook jobs past run_after.")
+    writer.sample("webhook_jobs_due", stats["due_jobs"])
+    writer.metric(
+        "webhook_job_due_lag_seconds",
+        "gauge",
+        "How long the oldest due webhook job has been waiting for a worker.",
+    )
+    writer.sample("webhook_job_due_lag_seconds", stats["max_due_lag_seconds"])
+
+
+def render_metrics(db: Database) -> str:
+    writer = MetricsWriter()
+    _write_counters(writer)
+    _write_histograms(writer)
+    _write_pool(writer)
+    _write_rate_budget(writer)
+    _write_strava_connections(writer)
+    _write_queue(writer, db)
+    return writer.render()
+
+
+@router.get(
+    "/metrics",
+    include_in_schema=False,
+    response_class=PlainTextResponse,
+    dependencies=[Depends(require_metrics_token)],
+)
+def metrics(db: Annotated[Database, Depends(get_db)]):
+    return PlainTextResponse(
+        render_metrics(db), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,14 +1,20 @@
 import logging
 from typing import Annotated
 
-from fastapi import APIRouter, Query, Request, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, Query, Request, HTTPException
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 
 from src.app.schemas.webhook_get_request import WebhookGetRequest
 from src.app.schemas.webhook_post_request import WebhookPostRequest
 from src.app.config import settings
-from src.tasks.post_event import process_post_request
+from src.app.dependencies import get_db
+from src.database.adapter import Database
+from src.tasks.webhook_events import (
+    WEBHOOK_DEBOUNCE,
+    WEBHOOK_MAX_DEBOUNCE,
+    record_enqueue,
+)
 
 load_dotenv(override=True)
 
@@ -18,13 +24,19 @@ router = APIRouter()
 
 
 @router.post("/webhook")
-async def handle_post_event(
-    content: WebhookPostRequest, background_tasks: BackgroundTasks
+def handle_post_event(
+    content: WebhookPostRequest, db: Annotated[Database, Depends(get_db)]
 ):
     """
     Handles the webhook event from Strava.
+
+    The event is queued and processed by the webhook workers.
     """
-    background_tasks.add_task(process_post_request, content, settings=settings)
+    outcome = db.enqueue_webhook_job(
+        content.model_dump(), debounce=WEBHOOK_DEBOUNCE, max_debounce=WEBHOOK_MAX_DEBOUNCE
+    )
+    logger.info(f"Webhook event {outcome}: {content}")
+    record_enqueue(outcome, content)
 
     return JSONResponse(content={"message": "Received webhook event"}, status_code=200)
 
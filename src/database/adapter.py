@@ -9,17 +9,33 @@ import base64
 
 from src.database.models import (
     Activity,
+    ActivitySyncCheckpoint,
     Auth,
     Base,
     NameSuggestion,
+    OnboardingStatus,
     PromptResponse,
     RenameHistory,
+    RuntimeFlag,
+    SlowQueryLog,
     User,
+    WebhookJob,
+    WebhookJobStatus,
 )
-from sqlalchemy import insert
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from src.database.runtime_flags import runtime_flags
+from src.database.webhook_merge import event_key, merge_webhook_events
+
+# registers the statement timing hooks on all engines
+import src.database.slow_queries  # noqa: F401
 
 logger = logging.getLogger(__name__)
 
+# Advisory lock namespace serializing the enqueueing of events per object
+WEBHOOK_ENQUEUE_LOCK = 1
+
 USER_ENCRYPTED_COLUMNS = [
     "name",
     "lastname",
@@ -51,6 +67,7 @@ class Database:
     def __init__(self, connection_string: str, encryption_key: bytes):
         engine = create_engine(connection_string)
         Base.metadata.create_all(engine)  # create the tables.
+        self.engine = engine
         self.Session = sessionmaker(bind=engine)
 
         self.encryption_key = encryption_key
@@ -174,8 +191,17 @@ class Database:
             auth.refresh_token = decrypt_token(auth.refresh_token, self.encryption_key)
             return auth
 
-    def add_activity(self, activity: Activity):
-        with self.Session() as session:
+    def add_activity(
+        self, activity: Activity, preserve_columns: list[str] | None = None
+    ) -> Activity:
+        """Insert or update an activity and return it as stored.
+
+        Columns listed in `preserve_columns` keep their stored value when the
+        activity already exists.
+        """
+        preserve_columns = preserve_columns or []
+        # the stored activity is returned, so keep it loaded after the commit
+        with self.Session(expire_on_commit=False) as session:
             existing_activity = (
                 session.query(Activity)
                 .filter(Activity.activity_id == activity.activity_id)
@@ -185,13 +211,17 @@ class Database:
                 session.add(activity)
                 session.commit()
                 logger.info(f"Added activity {activity.activity_id} to the database")
+                return activity
             else:
                 # update all fields with a loop
                 for key, value in activity.dict().items():
+                    if key in preserve_columns:
+                        continue
                     if key not in ["uuid", "activity_id", "created_at", "updated_at"]:
                         setattr(existing_activity, key, value)
                 existing_activity.updated_at = datetime.datetime.now()
                 session.commit()
+                return existing_activity
 
     def add_activities_bulk(self, activities: list[Activity]):
         with self.Session() as session:
@@ -214,6 +244,109 @@ class Database:
             session.commit()
             logger.info(f"Added {len(activities)} activities to the database")
 
+    def insert_new_activity_rows(self, rows: list[dict]) -> int:
+        """Insert rows of activity column values that are not stored yet.
+
+        Returns how many were added. Activities that already exist are left
+        untouched, they may hold richer data from the webhook pipeline than a
+        summary.
+        """
+        if not rows:
+            return 0
+
+        now = datetime.datetime.now()
+        rows = [
+            {
+                **row,
+                "uuid": row.get("uuid") or uuid.uuid4(),
+                "created_at": now,
+                "updated_at": now,
+            }
+            for row in rows
+        ]
+
+        with self.Session() as session:
+            result = session.execute(
+                pg_insert(Activity)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=[Activity.activity_id])
+            )
+            session.commit()
+            return result.rowcount
+
+    def get_latest_activity_start_date(
+        self, athlete_id: int
+    ) -> datetime.datetime | None:
+        with self.Session() as session:
+            return (
+                session.query(func.max(Activity.start_date))
+                .filter(Activity.athlete_id == athlete_id)
+                .scalar()
+            )
+
+    def get_activity_start_date_range(
+        self, athlete_id: int
+    ) -> tuple[datetime.datetime | None, datetime.datetime | None]:
+        """Start dates of the oldest and the newest stored activity."""
+        with self.Session() as session:
+            oldest, newest = (
+                session.query(
+                    func.min(Activity.start_date), func.max(Activity.start_date)
+                )
+                .filter(Activity.athlete_id == athlete_id)
+                .one()
+            )
+            return oldest, newest
+
+    def get_activity_ids_by_start_date(
+        self, athlete_id: int, after: datetime.datetime, before: datetime.datetime
+    ) -> set[int]:
+        """Ids of the stored activities that started strictly between the dates."""
+        with self.Session() as session:
+            rows = (
+                session.query(Activity.activity_id)
+                .filter(
+                    Activity.athlete_id == athlete_id,
+                    Activity.start_date > after,
+                    Activity.start_date < before,
+                )
+                .all()
+            )
+            return {row[0] for row in rows}
+
+    def get_auth_uuids(self) -> list[str]:
+        with self.Session() as session:
+            rows = session.query(User.auth_uuid).filter(User.auth_uuid.isnot(None)).all()
+            return [row[0] for row in rows]
+
+    def get_activity_sync_checkpoints(
+        self, auth_uuid: str
+    ) -> list[ActivitySyncCheckpoint]:
+        with self.Session() as session:
+            return (
+                session.query(ActivitySyncCheckpoint)
+                .filter(ActivitySyncCheckpoint.auth_uuid == auth_uuid)
+                .order_by(ActivitySyncCheckpoint.window_after)
+                .all()
+            )
+
+    def add_activity_sync_checkpoint(
+        self,
+        auth_uuid: str,
+        window_after: datetime.datetime,
+        window_before: datetime.datetime,
+        activity_count: int,
+    ):
+        checkpoint = ActivitySyncCheckpoint(
+            auth_uuid=auth_uuid,
+            window_after=window_after,
+            window_before=window_before,
+            activity_count=activity_count,
+        )
+        with self.Session() as session:
+            session.add(checkpoint)
+            session.commit()
+
     def get_activities_by_date_range(
         self, athlete_id: int, before: datetime.datetime, after: datetime.datetime
     ) -> list[Activity]:
@@ -241,6 +374,35 @@ class Database:
                 logger.info(f"Activity {activity_id} not found")
                 raise ValueError(f"Activity {activity_id} not found")
 
+    def get_activity_workout_state(self, activity_id: int):
+        """The stored plot key and whether a plot and a lap summary are stored.
+
+        None when the activity is not stored.
+        """
+        with self.Session() as session:
+            return (
+                session.query(
+                    Activity.stream_data_hash,
+                    Activity.stream_data.isnot(None).label("has_stream_data"),
+                    Activity.lap_summary.isnot(None).label("has_lap_summary"),
+                )
+                .filter(Activity.activity_id == activity_id)
+                .first()
+            )
+
+    def update_activity_name(self, activity_id: int, name: str, description: str):
+        with self.Session() as session:
+            activity = (
+                session.query(Activity)
+                .filter(Activity.activity_id == activity_id)
+                .first()
+            )
+            if activity:
+                activity.name = name
+                activity.description = description
+                activity.updated_at = datetime.datetime.now()
+                session.commit()
+
     def delete_user(self, athlete_id: int):
         with self.Session() as session:
             user = session.query(User).filter(User.athlete_id == athlete_id).first()
@@ -288,6 +450,49 @@ class Database:
                 prompt_response
             )  # Refresh to keep it attached and up-to-date
 
+    def get_llm_usage_stats(
+        self,
+        after: datetime.datetime | None = None,
+        before: datetime.datetime | None = None,
+    ) -> list[dict]:
+        """Latency, token and retry statistics of the naming LLM calls.
+
+        Grouped by naming strategy version and the model that served the
+        call. Prompt responses recorded without usage are left out.
+        """
+        latency = PromptResponse.latency_ms
+        with self.Session() as session:
+            query = session.query(
+                PromptResponse.naming_strategy_version,
+                PromptResponse.served_model,
+                func.count().label("calls"),
+                func.avg(latency).label("avg_latency_ms"),
+                func.percentile_cont(0.5).within_group(latency).label("p50_latency_ms"),
+                func.percentile_cont(0.95).within_group(latency).label("p95_latency_ms"),
+                func.avg(PromptResponse.request_tokens).label("avg_request_tokens"),
+                func.avg(PromptResponse.response_tokens).label("avg_response_tokens"),
+                func.sum(PromptResponse.request_tokens).label("request_tokens"),
+                func.sum(PromptResponse.response_tokens).label("response_tokens"),
+                func.avg(PromptResponse.image_bytes).label("avg_image_bytes"),
+                func.avg(PromptResponse.retry_count).label("avg_retry_count"),
+            ).filter(latency.isnot(None))
+            if after is not None:
+                query = query.filter(PromptResponse.created_at >= after)
+            if before is not None:
+                query = query.filter(PromptResponse.created_at < before)
+            rows = query.group_by(
+                PromptResponse.naming_strategy_version, PromptResponse.served_model
+            ).order_by(
+                PromptResponse.naming_strategy_version, PromptResponse.served_model
+            )
+            stats = [row._asdict() for row in rows]
+            # averages are returned as Decimal
+            for row in stats:
+                for key, value in row.items():
+                    if key.startswith("avg_") and value is not None:
+                        row[key] = float(value)
+            return stats
+
     def add_rename_history(self, old_name: str, new_name: str, activity_id: int):
         rename_history = RenameHistory(
             old_name=old_name,
@@ -343,6 +548,14 @@ class Database:
                 return "v1"
             return naming_strategy_version
         
+    def get_naming_strategy_version_by_athlete_id(self, athlete_id: int) -> str:
+        with self.Session() as session:
+            user = session.query(User).filter(User.athlete_id == athlete_id).first()
+            if not user or not user.naming_strategy_version:
+                logger.info(f"No prompt version found for athlete {athlete_id}")
+                return "v1"
+            return user.naming_strategy_version
+
     def get_user_type(self,athlete_id: int) -> str | None:
         with self.Session() as session:
             user = session.query(User).filter(User.athlete_id == athlete_id).first()
@@ -352,6 +565,342 @@ class Database:
             return user.user_type if user.user_type else None
 
 
+    def set_onboarding_status(
+        self,
+        auth_uuid: str,
+        status: str,
+        synced_after: datetime.datetime | None = None,
+    ):
+        with self.Session() as session:
+            user = session.query(User).filter(User.auth_uuid == auth_uuid).first()
+            if not user:
+                logger.info(f"User with auth id {auth_uuid} not found")
+                return
+            user.onboarding_status = status
+            user.onboarding_status_updated_at = datetime.datetime.now()
+            if synced_after is not None:
+                user.onboarding_synced_after = synced_after
+            session.commit()
+
+    def get_onboarding_status(
+        self, athlete_id: int
+    ) -> tuple[str | None, datetime.datetime | None]:
+        """The onboarding status of a user and when it was last set."""
+        with self.Session() as session:
+            row = (
+                session.query(User.onboarding_status, User.onboarding_status_updated_at)
+                .filter(User.athlete_id == athlete_id)
+                .first()
+            )
+            return (row[0], row[1]) if row else (None, None)
+
+    def get_unfinished_onboardings(self, stale_before: datetime.datetime) -> list:
+        """Onboardings not complete whose status wasn't updated since `stale_before`.
+
+        Rows of (auth_uuid, user_type, onboarding_status, onboarding_synced_after).
+        """
+        unfinished = [
+            status.value
+            for status in OnboardingStatus
+            if status != OnboardingStatus.COMPLETE
+        ]
+        with self.Session() as session:
+            return (
+                session.query(
+                    User.auth_uuid,
+                    User.user_type,
+                    User.onboarding_status,
+                    User.onboarding_synced_after,
+                )
+                .filter(
+                    User.auth_uuid.isnot(None),
+                    User.onboarding_status.in_(unfinished),
+                    or_(
+                        User.onboarding_status_updated_at.is_(None),
+                        User.onboarding_status_updated_at < stale_before,
+                    ),
+                )
+                .all()
+            )
+
+    def enqueue_webhook_job(
+        self,
+        payload: dict,
+        debounce: datetime.timedelta,
+        max_debounce: datetime.timedelta,
+    ) -> str:
+        """Queue a webhook event, merging it into a pending job for the same object.
+
+        Returns "queued" for a new job, "coalesced" when the event was merged
+        into a pending job and "duplicate" for a redelivered event.
+        """
+        now = datetime.datetime.now()
+        key = event_key(payload)
+        with self.Session() as session:
+            # concurrent events of the same object are enqueued one at a time
+            session.execute(
+                select(
+                    func.pg_advisory_xact_lock(
+                        WEBHOOK_ENQUEUE_LOCK, payload["object_id"] & 0x7FFFFFFF
+                    )
+                )
+            )
+            jobs = (
+                session.query(WebhookJob)
+                .filter(
+                    WebhookJob.object_type == payload["object_type"],
+                    WebhookJob.object_id == payload["object_id"],
+                    WebhookJob.owner_id == payload["owner_id"],
+                )
+                .order_by(WebhookJob.created_at)
+                .all()
+            )
+            if any(key in job.event_keys for job in jobs):
+                return "duplicate"
+
+            pending = [
+                job for job in jobs if job.status == WebhookJobStatus.PENDING.value
+            ]
+            if pending:
+                job = pending[-1]
+                job.payload = merge_webhook_events(job.payload, payload)
+                job.aspect_type = job.payload["aspect_type"]
+                job.event_time = job.payload["event_time"]
+                job.event_keys = [*job.event_keys, key]
+                job.run_after = max(
+                    job.run_after, min(now + debounce, job.created_at + max_debounce)
+                )
+                job.updated_at = now
+                session.commit()
+                return "coalesced"
+
+            session.add(
+                WebhookJob(
+                    object_type=payload["object_type"],
+                    object_id=payload["object_id"],
+                    aspect_type=payload["aspect_type"],
+                    owner_id=payload["owner_id"],
+                    event_time=payload.get("event_time"),
+                    payload=payload,
+                    event_keys=[key],
+                    run_after=now + debounce,
+                )
+            )
+            session.commit()
+            return "queued"
+
+    def claim_webhook_job(
+        self,
+        lock_timeout: datetime.timedelta,
+        worker_id: str | None = None,
+        candidates: int = 10,
+    ) -> WebhookJob | None:
+        """Claim the next due job of an athlete that has no job running.
+
+        Jobs whose lock was not refreshed for `lock_timeout` belong to a
+        worker that died and are claimed again.
+        """
+        now = datetime.datetime.now()
+        stale_before = now - lock_timeout
+        running = and_(
+            WebhookJob.status == WebhookJobStatus.RUNNING.value,
+            WebhookJob.locked_at >= stale_before,
+        )
+        claimable = or_(
+            WebhookJob.status == WebhookJobStatus.PENDING.value,
+            and_(
+                WebhookJob.status == WebhookJobStatus.RUNNING.value,
+                WebhookJob.locked_at < stale_before,
+            ),
+        )
+        busy_owners = select(WebhookJob.owner_id).where(running)
+
+        with self.Session() as session:
+            jobs = (
+                session.query(WebhookJob)
+                .filter(
+                    claimable,
+                    WebhookJob.run_after <= now,
+                    WebhookJob.owner_id.not_in(busy_owners),
+                )
+                .order_by(WebhookJob.run_after, WebhookJob.created_at)
+                .limit(candidates)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            for job in jobs:
+                # another worker may be claiming a job of the same athlete at
+                # the same time; the advisory lock serializes the claims and
+                # the re-check sees claims committed since the query above
+                locked = session.execute(
+                    select(func.pg_try_advisory_xact_lock(job.owner_id))
+                ).scalar()
+                if not locked:
+                    continue
+                busy = (
+                    session.query(WebhookJob.uuid)
+                    .filter(running, WebhookJob.owner_id == job.owner_id)
+                    .first()
+                )
+                if busy:
+                    continue
+
+                job.status = WebhookJobStatus.RUNNING.value
+                job.attempts += 1
+                job.locked_at = now
+                job.locked_by = worker_id
+                job.updated_at = now
+                session.commit()
+                session.refresh(job)
+                return job
+            return None
+
+    def heartbeat_webhook_job(self, job_uuid: str, worker_id: str | None) -> bool:
+        """Refresh the lock of a running job, returning False if it was lost."""
+        with self.Session() as session:
+            updated = (
+                session.query(WebhookJob)
+                .filter(
+                    WebhookJob.uuid == job_uuid,
+                    WebhookJob.status == WebhookJobStatus.RUNNING.value,
+                    WebhookJob.locked_by == worker_id,
+                )
+                .update({WebhookJob.locked_at: datetime.datetime.now()})
+            )
+            session.commit()
+            return updated > 0
+
+    def release_webhook_jobs(self, worker_id: str) -> int:
+        """Requeue the jobs a worker left running, e.g. when its process died."""
+        now = datetime.datetime.now()
+        with self.Session() as session:
+            released = (
+                session.query(WebhookJob)
+                .filter(
+                    WebhookJob.status == WebhookJobStatus.RUNNING.value,
+                    WebhookJob.locked_by == worker_id,
+                )
+                .update(
+                    {
+                        WebhookJob.status: WebhookJobStatus.PENDING.value,
+                        WebhookJob.run_after: now,
+                        WebhookJob.locked_at: None,
+                        WebhookJob.locked_by: None,
+                        WebhookJob.updated_at: now,
+                    }
+                )
+            )
+            session.commit()
+            return released
+
+    def complete_webhook_job(self, job_uuid: str):
+        with self.Session() as session:
+            job = session.query(WebhookJob).filter(WebhookJob.uuid == job_uuid).first()
+            job.status = WebhookJobStatus.DONE.value
+            job.locked_at = None
+            job.locked_by = None
+            job.last_error = None
+            job.updated_at = datetime.datetime.now()
+            session.commit()
+
+    def fail_webhook_job(
+        self, job_uuid: str, error: str, retry_at: datetime.datetime | None
+    ):
+        """Schedule a failed job for a retry, or give up if `retry_at` is None."""
+        with self.Session() as session:
+            job = session.query(WebhookJob).filter(WebhookJob.uuid == job_uuid).first()
+            if retry_at is None:
+                job.status = WebhookJobStatus.FAILED.value
+            else:
+                job.status = WebhookJobStatus.PENDING.value
+                job.run_after = retry_at
+            job.locked_at = None
+            job.locked_by = None
+            job.last_error = error
+            job.updated_at = datetime.datetime.now()
+            session.commit()
+
+    def delete_done_webhook_jobs(self, before: datetime.datetime) -> int:
+        with self.Session() as session:
+            deleted = (
+                session.query(WebhookJob)
+                .filter(
+                    WebhookJob.status == WebhookJobStatus.DONE.value,
+                    WebhookJob.updated_at < before,
+                )
+                .delete()
+            )
+            session.commit()
+            return deleted
+
+    def get_webhook_queue_stats(self) -> dict:
+        """Webhook jobs per status with the age of the oldest, and the due backlog.
+
+        Ages are in seconds. `due_jobs` are pending jobs past their
+        `run_after`, `max_due_lag_seconds` how long the oldest of them has
+        been waiting for a worker.
+        """
+        now = datetime.datetime.now()
+        with self.Session() as session:
+            rows = (
+                session.query(
+                    WebhookJob.status, func.count(), func.min(WebhookJob.created_at)
+                )
+                .group_by(WebhookJob.status)
+                .all()
+            )
+            due_jobs, oldest_due = (
+                session.query(func.count(), func.min(WebhookJob.run_after))
+                .filter(
+                    WebhookJob.status == WebhookJobStatus.PENDING.value,
+                    WebhookJob.run_after <= now,
+                )
+                .one()
+            )
+
+        return {
+            "jobs": {status: count for status, count, _ in rows},
+            "oldest_age_seconds": {
+                status: (now - oldest).total_seconds() for status, _, oldest in rows
+            },
+            "due_jobs": due_jobs,
+            "max_due_lag_seconds": (
+                (now - oldest_due).total_seconds() if oldest_due else 0.0
+            ),
+        }
+
+    def set_runtime_flag(self, name: str, enabled: bool, value: str | None = None):
+        now = datetime.datetime.now()
+        with self.Session() as session:
+            flag = session.get(RuntimeFlag, name)
+            if flag is None:
+                flag = RuntimeFlag(name=name, created_at=now)
+                session.add(flag)
+            flag.enabled = enabled
+            flag.value = value
+            flag.updated_at = now
+            session.commit()
+        # other processes pick the change up when their cached value expires
+        runtime_flags.invalidate(name)
+
+    def get_runtime_flag(self, name: str) -> tuple[bool, str | None]:
+        """(enabled, value) of a flag, read at most every `RUNTIME_FLAG_TTL` seconds."""
+        return runtime_flags.get(self.engine, name)
+
+    def get_runtime_flags(self) -> list[RuntimeFlag]:
+        with self.Session() as session:
+            return session.query(RuntimeFlag).order_by(RuntimeFlag.name).all()
+
+    def get_slow_queries(self, limit: int = 20) -> list[SlowQueryLog]:
+        with self.Session() as session:
+            return (
+                session.query(SlowQueryLog)
+                .order_by(SlowQueryLog.created_at.desc())
+                .limit(limit)
+                .all()
+            )
+
+
 if __name__ == "__main__":
     # Example usage
     from src.app.config import settings
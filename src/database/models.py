@@ -9,7 +9,9 @@ from sqlalchemy import (
     Column,
     Date,
     Float,
+    Index,
     Integer,
+    JSON,
     String,
     DateTime,
     ForeignKey,
@@ -34,6 +36,29 @@ class UserType(Enum):
     def __str__(self):
         return self.value
 
+
+class WebhookJobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __str__(self):
+        return self.value
+
+
+class OnboardingStatus(Enum):
+    PENDING = "pending"
+    SYNCING_RECENT = "syncing_recent"
+    # recent activities are stored, deeper history is backfilled in the background
+    READY = "ready"
+    COMPLETE = "complete"
+    FAILED = "failed"
+
+    def __str__(self):
+        return self.value
+
+
 class Auth(Base):
     __tablename__ = "auth"
     uuid = Column(UUID, primary_key=True, nullable=False, default=uuid.uuid4)
@@ -42,6 +67,9 @@ class Auth(Base):
     expires_at = Column(Integer)
     scope = Column(String)
     user = relationship("User", back_populates="auth")
+    sync_checkpoints = relationship(
+        "ActivitySyncCheckpoint", back_populates="auth", cascade="all, delete-orphan"
+    )
 
     created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
     updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
@@ -71,6 +99,10 @@ class User(Base):
     )
     naming_strategy_version = Column(String, nullable=False, default=DEFAULT_NAMING_STRATEGY_VERSION)
     user_type = Column(String, nullable=False, default="neuraltag")
+    # null for athletes onboarded before onboarding was tracked
+    onboarding_status = Column(String, nullable=True)
+    onboarding_synced_after = Column(DateTime, nullable=True)
+    onboarding_status_updated_at = Column(DateTime, nullable=True)
 
 
 class Activity(Base):
@@ -82,6 +114,9 @@ class Activity(Base):
     prompt_responses = relationship(
         "PromptResponse", back_populates="activity", cascade="all, delete-orphan"
     )
+    rename_history = relationship(
+        "RenameHistory", back_populates="activity", cascade="all, delete-orphan"
+    )
 
     activity_id = Column(BigInteger, unique=True)
     description = Column(String, nullable=True)
@@ -149,6 +184,9 @@ class Activity(Base):
     map_centroid_lon = Column(Float)
     map_area = Column(Float)
     stream_data = Column(LargeBinary, nullable=True)
+    # key of the render config `stream_data` was rendered with
+    stream_data_hash = Column(String, nullable=True)
+    lap_summary = Column(String, nullable=True)
 
     created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
     updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
@@ -169,6 +207,14 @@ class PromptResponse(Base):
     response = Column(String)
     llm_model = Column(String)
     temperature = Column(Float)
+    # model of the fallback chain that answered, and what the call cost
+    served_model = Column(String, nullable=True)
+    request_tokens = Column(Integer, nullable=True)
+    response_tokens = Column(Integer, nullable=True)
+    image_bytes = Column(Integer, nullable=True)
+    latency_ms = Column(Integer, nullable=True)
+    retry_count = Column(Integer, nullable=True)
+    naming_strategy_version = Column(String, nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
     updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
 
@@ -206,8 +252,71 @@ class RenameHistory(Base):
     __tablename__ = "rename_history"
     uuid = Column(UUID, primary_key=True, nullable=False, default=uuid.uuid4)
     activity_id = Column(BigInteger, ForeignKey("activity.activity_id"))
-    activity = relationship(Activity.__name__)
+    activity = relationship(Activity.__name__, back_populates="rename_history")
     old_name = Column(String)
     new_name = Column(String)
     created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
     updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+
+
+class ActivitySyncCheckpoint(Base):
+    """A date window of an athlete's activities that has been fully synced."""
+
+    __tablename__ = "activity_sync_checkpoint"
+    uuid = Column(UUID, primary_key=True, nullable=False, default=uuid.uuid4)
+    auth_uuid = Column(UUID, ForeignKey("auth.uuid"), nullable=False, index=True)
+    auth = relationship("Auth", back_populates="sync_checkpoints")
+    window_after = Column(DateTime, nullable=False)
+    window_before = Column(DateTime, nullable=False)
+    activity_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+    updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+
+
+class WebhookJob(Base):
+    """A Strava webhook event waiting to be (or being) processed by a worker."""
+
+    __tablename__ = "webhook_job"
+    __table_args__ = (Index("ix_webhook_job_status_run_after", "status", "run_after"),)
+    uuid = Column(UUID, primary_key=True, nullable=False, default=uuid.uuid4)
+    object_type = Column(String, nullable=False)
+    object_id = Column(BigInteger, nullable=False)
+    aspect_type = Column(String, nullable=False)
+    owner_id = Column(BigInteger, nullable=False, index=True)
+    event_time = Column(BigInteger)
+    payload = Column(JSON, nullable=False)
+    # (event_time, aspect_type) of every event merged into this job
+    event_keys = Column(JSON, nullable=False, default=list, server_default="[]")
+    status = Column(String, nullable=False, default=WebhookJobStatus.PENDING.value)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.datetime.now)
+    # refreshed by the worker running the job, see `Database.heartbeat_webhook_job`
+    locked_at = Column(DateTime, nullable=True)
+    locked_by = Column(String, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+    updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+
+
+class RuntimeFlag(Base):
+    """An operational switch that can be changed without a restart."""
+
+    __tablename__ = "runtime_flag"
+    name = Column(String, primary_key=True, nullable=False)
+    enabled = Column(Boolean, nullable=False, default=False)
+    value = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+    updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+
+
+class SlowQueryLog(Base):
+    """A statement that took longer than the slow query threshold."""
+
+    __tablename__ = "slow_query_log"
+    uuid = Column(UUID, primary_key=True, nullable=False, default=uuid.uuid4)
+    method = Column(String, nullable=True, index=True)
+    statement = Column(String, nullable=False)
+    duration_ms = Column(Float, nullable=False)
+    explain = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
+    updated_at = Column(DateTime, nullable=False, default=datetime.datetime.now)
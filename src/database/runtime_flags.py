@@ -0,0 +1,60 @@
+"""Cached reads of the `runtime_flag` table.
+
+Flags are checked on hot paths (every SQL statement, every webhook job), so
+they are read at most once per `RUNTIME_FLAG_TTL` seconds per process. A
+changed flag therefore takes effect within that time, without a restart.
+"""
+
+import threading
+import time
+
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+
+from src.database.models import RuntimeFlag
+
+RUNTIME_FLAG_TTL = 30.0
+
+
+class RuntimeFlagCache:
+    def __init__(self, ttl: float = RUNTIME_FLAG_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._flags: dict[str, tuple[float, tuple[bool, str | None]]] = {}
+
+    def get(self, engine: Engine, name: str) -> tuple[bool, str | None]:
+        """Return (enabled, value) of a flag, (False, None) when it is not set."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._flags.get(name)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        flag = (False, None)
+        try:
+            with Session(bind=engine) as session:
+                row = session.execute(
+                    select(RuntimeFlag.enabled, RuntimeFlag.value).where(
+                        RuntimeFlag.name == name
+                    )
+                ).first()
+            if row is not None:
+                flag = (bool(row.enabled), row.value)
+        except Exception:
+            # e.g. the table does not exist yet; keep the previous value
+            if cached is not None:
+                flag = cached[1]
+
+        with self._lock:
+            self._flags[name] = (now + self.ttl, flag)
+        return flag
+
+    def invalidate(self, name: str | None = None):
+        with self._lock:
+            if name is None:
+                self._flags.clear()
+            else:
+                self._flags.pop(name, None)
+
+
+runtime_flags = RuntimeFlagCache()
@@ -0,0 +1,158 @@
+"""Slow query logging with EXPLAIN capture.
+
+While the `slow_query_log` runtime flag is enabled, every statement is timed
+and attributed to the `Database` method that issued it. The durations are
+recorded in the `db_query_duration_seconds` histograms (reported on
+/metrics); statements slower than the threshold (the flag's value, in
+milliseconds) are stored in the `slow_query_log` table together with their
+`EXPLAIN (ANALYZE, BUFFERS)` plan.
+
+    uv run python -m src.scripts.runtime_flag enable slow_query_log --value 200
+    uv run python -m src.scripts.slow_queries
+"""
+
+import contextlib
+import logging
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session
+
+from src.database.models import SlowQueryLog
+from src.database.runtime_flags import runtime_flags
+from src.metrics_registry import Histograms
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_FLAG = "slow_query_log"
+DEFAULT_SLOW_QUERY_THRESHOLD_MS = 250.0
+
+_ADAPTER_MODULE = "src.database.adapter"
+
+# ANALYZE executes the statement; locks would be taken a second time (and
+# waited for, while the slow statement's transaction still holds them)
+_LOCKING_STATEMENT = re.compile(
+    r"\bFOR\s+(UPDATE|NO\s+KEY\s+UPDATE|SHARE|KEY\s+SHARE)\b|\bpg_(try_)?advisory",
+    re.IGNORECASE,
+)
+
+query_durations = Histograms(
+    "db_query_duration_seconds",
+    description="Durations of SQL statements by Database method.",
+    key_label="method",
+)
+
+# EXPLAIN runs on its own connection, off the thread of the slow statement
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query")
+
+_internal = threading.local()
+
+
+@contextlib.contextmanager
+def _untracked():
+    """Statements run in this context (flag reads, EXPLAIN, logging) are not timed."""
+    _internal.active = True
+    try:
+        yield
+    finally:
+        _internal.active = False
+
+
+def slow_query_threshold_ms(engine: Engine) -> float | None:
+    """The slow query threshold, or None while slow query logging is off."""
+    with _untracked():
+        enabled, value = runtime_flags.get(engine, SLOW_QUERY_FLAG)
+    if not enabled:
+        return None
+    try:
+        return float(value) if value else DEFAULT_SLOW_QUERY_THRESHOLD_MS
+    except ValueError:
+        return DEFAULT_SLOW_QUERY_THRESHOLD_MS
+
+
+def calling_database_method() -> str | None:
+    """The innermost `Database` method on the current stack, e.g. "Database.get_activity_by_id"."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_globals.get("__name__") == _ADAPTER_MODULE:
+            qualname = frame.f_code.co_qualname
+            if qualname.startswith("Database."):
+                return qualname
+        frame = frame.f_back
+    return None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_internal, "active", False) or context is None:
+        return
+    threshold_ms = slow_query_threshold_ms(conn.engine)
+    if threshold_ms is not None:
+        context._slow_query_timer = (time.perf_counter(), threshold_ms)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _stop_timer(conn, cursor, statement, parameters, context, executemany):
+    timer = getattr(context, "_slow_query_timer", None)
+    if timer is None:
+        return
+    start, threshold_ms = timer
+    elapsed = time.perf_counter() - start
+    method = calling_database_method()
+    query_durations.observe(method or "unknown", elapsed)
+
+    duration_ms = elapsed * 1000
+    if duration_ms < threshold_ms:
+        return
+    logger.warning(f"Slow query ({duration_ms:.0f} ms) in {method}: {statement}")
+    _explain_executor.submit(
+        _log_slow_query,
+        engine=conn.engine,
+        method=method,
+        statement=statement,
+        parameters=None if executemany else parameters,
+        duration_ms=duration_ms,
+    )
+
+
+def explain(engine: Engine, statement: str, parameters) -> str | None:
+    """The plan of a SELECT statement, None for other statements."""
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return None
+    options = "ANALYZE, BUFFERS"
+    if _LOCKING_STATEMENT.search(statement):
+        options = "COSTS"
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN ({options}) {statement}", parameters)
+        plan = "\n".join(row[0] for row in rows)
+        conn.rollback()
+    return plan
+
+
+def _log_slow_query(
+    engine: Engine, method: str | None, statement: str, parameters, duration_ms: float
+):
+    with _untracked():
+        plan = None
+        if parameters is not None:
+            try:
+                plan = explain(engine, statement, parameters)
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+        try:
+            with Session(bind=engine) as session:
+                session.add(
+                    SlowQueryLog(
+                        method=method,
+                        statement=statement,
+                        duration_ms=duration_ms,
+                        explain=plan,
+                    )
+                )
+                session.commit()
+        except Exception:
+            logger.exception("Could not store slow query")
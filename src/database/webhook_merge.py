@@ -0,0 +1,37 @@
+"""Merging of webhook events queued for the same object.
+
+Used by `Database.enqueue_webhook_job` under the per-object enqueue lock, see
+`src.tasks.webhook_events` for the debounce and the coalescing counters.
+"""
+
+
+def event_key(payload: dict) -> list:
+    """Identifies redeliveries of the same event (a list, as stored in JSON)."""
+    return [payload.get("event_time"), payload["aspect_type"]]
+
+
+def merge_webhook_events(pending: dict, new: dict) -> dict:
+    """Merge a new event into the pending event for the same object.
+
+    Events are merged in event time order, whatever order they arrived in: a
+    create followed by updates stays a create, a delete wins over everything
+    before it, and newer update values take precedence.
+    """
+    older, newer = pending, new
+    if (new.get("event_time") or 0) < (pending.get("event_time") or 0):
+        older, newer = new, pending
+
+    if newer["aspect_type"] == "delete":
+        return {**newer, "updates": {}}
+    if older["aspect_type"] == "delete":
+        # the object was re-created after the delete
+        return {**newer}
+
+    aspect_type = "update"
+    if "create" in (older["aspect_type"], newer["aspect_type"]):
+        aspect_type = "create"
+    return {
+        **newer,
+        "aspect_type": aspect_type,
+        "updates": {**(older.get("updates") or {}), **(newer.get("updates") or {})},
+    }
@@ -0,0 +1,106 @@
+"""Process-wide counters and histograms, reported on /metrics.
+
+Shared by the app, the database layer and the background tasks, so it
+depends on none of them.
+"""
+
+import bisect
+import threading
+
+# Upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)
+
+
+class Counters:
+    """A named, thread-safe group of integer counters.
+
+    Every group registers itself in `COUNTERS` so the values can be reported
+    from a single place.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._values: dict[str, int] = {}
+        COUNTERS[name] = self
+
+    def incr(self, key: str, amount: int = 1):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+COUNTERS: dict[str, Counters] = {}
+
+
+class Histograms:
+    """A named, thread-safe group of histograms keyed by name and labels.
+
+    Every group registers itself in `HISTOGRAMS` so the values can be reported
+    from a single place.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        key_label: str = "key",
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        # label the key is reported under
+        self.key_label = key_label
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values: dict[tuple, dict] = {}
+        HISTOGRAMS[name] = self
+
+    def observe(self, key: str, value: float, labels: dict[str, str] | None = None):
+        series = (key, tuple(sorted((labels or {}).items())))
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._values.get(series)
+            if histogram is None:
+                histogram = self._values[series] = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            histogram["counts"][idx] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def snapshot(self) -> list[dict]:
+        """Every series with its non-cumulative bucket counts, sum and count."""
+        with self._lock:
+            return [
+                {
+                    "key": key,
+                    "labels": dict(labels),
+                    "counts": list(histogram["counts"]),
+                    "sum": histogram["sum"],
+                    "count": histogram["count"],
+                }
+                for (key, labels), histogram in self._values.items()
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+HISTOGRAMS: dict[str, Histograms] = {}
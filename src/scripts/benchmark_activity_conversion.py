@@ -0,0 +1,73 @@
+"""Benchmark batch conversion of summary activities against the per-activity one.
+
+    uv run python -m src.scripts.benchmark_activity_conversion 5000
+"""
+
+import datetime
+import random
+import sys
+import time
+
+import numpy as np
+import polyline
+from stravalib.model import SummaryActivity
+
+from src.tasks.data import (
+    columns_to_rows,
+    summary_activities_to_columns,
+    summary_activity_to_activity_model,
+)
+
+
+def make_summary_activity(activity_id: int) -> SummaryActivity:
+    start = datetime.datetime(2024, 1, 1) + datetime.timedelta(hours=activity_id)
+    lat, lng = random.uniform(-60, 60), random.uniform(-170, 170)
+    points = [
+        (lat + random.gauss(0, 0.02), lng + random.gauss(0, 0.02))
+        for _ in range(random.randint(50, 400))
+    ]
+    return SummaryActivity(
+        id=activity_id,
+        name=f"Activity {activity_id}",
+        sport_type="Run",
+        type="Run",
+        elapsed_time=3600,
+        moving_time=3500,
+        distance=random.uniform(1000, 30000),
+        start_date=start,
+        start_date_local=start,
+        start_latlng=list(points[0]),
+        end_latlng=list(points[-1]),
+        athlete={"id": 1},
+        map={"summary_polyline": polyline.encode(points)},
+    )
+
+
+def main(n_activities: int):
+    random.seed(0)
+    summary_activities = [make_summary_activity(i) for i in range(n_activities)]
+
+    start = time.perf_counter()
+    models = [summary_activity_to_activity_model(x) for x in summary_activities]
+    per_activity_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows = columns_to_rows(summary_activities_to_columns(summary_activities))
+    batch_seconds = time.perf_counter() - start
+
+    for model, row in zip(models, rows):
+        expected = model.dict()
+        for column, value in row.items():
+            if isinstance(value, float):
+                assert np.isclose(value, expected[column], rtol=1e-9), column
+            else:
+                assert value == expected[column], column
+
+    print(f"{n_activities} activities")
+    print(f"per activity: {per_activity_seconds:.3f}s")
+    print(f"batch:        {batch_seconds:.3f}s")
+    print(f"speedup:      {per_activity_seconds / batch_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
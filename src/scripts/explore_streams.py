@@ -25,13 +25,7 @@ etl.load()
 
 auth = etl.db.get_auth_by_athlete_id(etl.athlete_id)
 
-client = get_strava_client(
-    access_token=auth.access_token,
-    refresh_token=auth.refresh_token,
-    expires_at=auth.expires_at,
-    strava_client_id=etl.settings.strava_client_id,
-    strava_client_secret=etl.settings.strava_client_secret,
-)
+client = get_strava_client(auth=auth, db=etl.db, settings=etl.settings)
 
 # get activity streams
 activity_streams = client.get_activity_streams(
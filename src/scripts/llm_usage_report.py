@@ -0,0 +1,35 @@
+"""Compare latency and token usage of the naming LLM calls per strategy version.
+
+    uv run python -m src.scripts.llm_usage_report --days 30
+"""
+
+import argparse
+import datetime
+
+import pandas as pd
+
+from src.app.config import settings
+from src.database.adapter import Database
+
+
+def main(days: int):
+    db = Database(
+        connection_string=settings.postgres_connection_string,
+        encryption_key=settings.encryption_key,
+    )
+    stats = db.get_llm_usage_stats(
+        after=datetime.datetime.now() - datetime.timedelta(days=days)
+    )
+    if not stats:
+        print(f"No LLM calls with usage recorded in the last {days} days")
+        return
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(pd.DataFrame(stats).round(1).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    main(args.days)
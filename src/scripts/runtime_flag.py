@@ -0,0 +1,43 @@
+"""Switch runtime flags on and off without a restart.
+
+    uv run python -m src.scripts.runtime_flag list
+    uv run python -m src.scripts.runtime_flag enable slow_query_log --value 200
+    uv run python -m src.scripts.runtime_flag disable slow_query_log
+
+Running processes pick a change up within `RUNTIME_FLAG_TTL` seconds.
+"""
+
+import argparse
+
+from src.app.config import settings
+from src.database.adapter import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage runtime flags")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    enable = commands.add_parser("enable")
+    enable.add_argument("name")
+    enable.add_argument("--value", default=None)
+    disable = commands.add_parser("disable")
+    disable.add_argument("name")
+    args = parser.parse_args()
+
+    db = Database(
+        connection_string=settings.postgres_connection_string,
+        encryption_key=settings.encryption_key,
+    )
+    if args.command == "enable":
+        db.set_runtime_flag(args.name, enabled=True, value=args.value)
+    elif args.command == "disable":
+        db.set_runtime_flag(args.name, enabled=False)
+
+    for flag in db.get_runtime_flags():
+        state = "on" if flag.enabled else "off"
+        value = f" = {flag.value}" if flag.value is not None else ""
+        print(f"{flag.name}: {state}{value} (updated {flag.updated_at:%Y-%m-%d %H:%M:%S})")
+
+
+if __name__ == "__main__":
+    main()
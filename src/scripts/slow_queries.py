@@ -0,0 +1,36 @@
+"""Show the most recent slow queries with their plans.
+
+    uv run python -m src.scripts.slow_queries --limit 10
+
+Slow query logging is switched on with the `slow_query_log` runtime flag, see
+`src/database/slow_queries.py`.
+"""
+
+import argparse
+
+from src.app.config import settings
+from src.database.adapter import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show recent slow queries")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--no-plan", action="store_true", help="omit the plans")
+    args = parser.parse_args()
+
+    db = Database(
+        connection_string=settings.postgres_connection_string,
+        encryption_key=settings.encryption_key,
+    )
+    for query in db.get_slow_queries(limit=args.limit):
+        print(
+            f"{query.created_at:%Y-%m-%d %H:%M:%S}  {query.duration_ms:8.0f} ms  {query.method}"
+        )
+        print(f"  {query.statement}")
+        if query.explain and not args.no_plan:
+            print("  " + query.explain.replace("\n", "\n  "))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import numpy as np
 import polyline
 from stravalib.model import SummaryActivity
 from shapely.geometry import Polygon
@@ -5,6 +6,25 @@ from shapely.geometry import Polygon
 from src.database.models import Activity
 
 
+# Activity columns, computed once rather than for every converted activity
+ACTIVITY_COLUMNS = frozenset(Activity.__table__.columns.keys())
+
+# Activity columns copied as they are from a SummaryActivity
+SUMMARY_ACTIVITY_COLUMNS = sorted(ACTIVITY_COLUMNS & set(SummaryActivity.model_fields))
+
+# Only the SummaryActivity fields used for the activity columns are dumped
+_SUMMARY_ACTIVITY_DUMP = {
+    **{column: True for column in SUMMARY_ACTIVITY_COLUMNS},
+    "id": True,
+    "athlete": {"id"},
+    "map": {"summary_polyline"},
+    "start_latlng": True,
+    "end_latlng": True,
+}
+
+POLYLINE_PRECISION = 5
+
+
 def summary_activity_to_activity_model(summary_activity: SummaryActivity) -> Activity:
     activity_dict = summary_activity.model_dump()
 
@@ -61,9 +81,151 @@ def summary_activity_to_activity_model(summary_activity: SummaryActivity) -> Act
     del activity_dict["map"]
 
     activity_dict = {
-        k: v for k, v in activity_dict.items() if k in Activity.__table__.columns.keys()
+        k: v for k, v in activity_dict.items() if k in ACTIVITY_COLUMNS
     }
 
     activity = Activity(**activity_dict)
 
     return activity
+
+
+def decode_polylines(polylines: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Decode many encoded polylines at once, matching `polyline.decode`.
+
+    Returns the (lat, lng) points of all polylines stacked in one array and
+    the offsets of each polyline in it: polyline `i` is
+    `points[offsets[i]:offsets[i + 1]]`.
+    """
+    lengths = np.array([len(x) for x in polylines], dtype=np.int64)
+    chars = np.frombuffer("".join(polylines).encode("ascii"), dtype=np.uint8)
+    if len(chars) == 0:
+        return np.zeros((0, 2)), np.zeros(len(polylines) + 1, dtype=np.int64)
+    chunks = chars.astype(np.int64) - 63
+
+    # each value is a run of 5 bit chunks, ending at a chunk without 0x20 set
+    is_last = chunks < 0x20
+    values_seen = np.cumsum(is_last)
+    value_starts = np.concatenate(([0], np.flatnonzero(is_last)[:-1] + 1))
+    chunk_index = np.arange(len(chunks)) - value_starts[values_seen - is_last]
+    values = np.add.reduceat((chunks & 0x1F) << (5 * chunk_index), value_starts)
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1).reshape(-1, 2)
+
+    # a polyline holds two values (lat and lng deltas) per point
+    values_at_end = np.concatenate(([0], values_seen))[np.cumsum(lengths)]
+    values_per_polyline = np.diff(values_at_end, prepend=0)
+    offsets = np.concatenate(([0], np.cumsum(values_per_polyline // 2)))
+
+    # deltas accumulate within each polyline only
+    totals = np.vstack((np.zeros((1, 2), dtype=np.int64), np.cumsum(deltas, axis=0)))
+    starts = np.repeat(offsets[:-1], np.diff(offsets))
+    coordinates = totals[1:] - totals[starts]
+    return coordinates / float(10**POLYLINE_PRECISION), offsets
+
+
+def polygon_centroids_and_areas(
+    points: np.ndarray, offsets: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Centroid and area of the polygon closed by each polyline (shoelace).
+
+    Matches shapely's `Polygon(points).centroid` and `.area`, including its
+    fallback to the centroid of the outline for polygons without area.
+    Polylines of fewer than 3 points have no polygon and give NaN.
+    """
+    n_polygons = len(offsets) - 1
+    counts = np.diff(offsets)
+    centroid_x = np.full(n_polygons, np.nan)
+    centroid_y = np.full(n_polygons, np.nan)
+    area = np.full(n_polygons, np.nan)
+    if len(points) == 0:
+        return centroid_x, centroid_y, area
+
+    # relative to the first point of each polygon for precision, like GEOS
+    polygon_ids = np.repeat(np.arange(n_polygons), counts)
+    base = points[np.minimum(offsets[:-1], len(points) - 1)]
+    relative = points - base[polygon_ids]
+    next_index = np.arange(1, len(points) + 1)
+    next_index[offsets[1:][counts > 0] - 1] = offsets[:-1][counts > 0]
+    x, y = relative[:, 0], relative[:, 1]
+    next_x, next_y = relative[next_index, 0], relative[next_index, 1]
+
+    def polygon_sum(weights: np.ndarray) -> np.ndarray:
+        return np.bincount(polygon_ids, weights=weights, minlength=n_polygons)
+
+    cross = x * next_y - next_x * y
+    area2 = polygon_sum(cross)
+    segment_length = np.hypot(next_x - x, next_y - y)
+    outline_length = polygon_sum(segment_length)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        area_x = polygon_sum((x + next_x) * cross) / (3 * area2)
+        area_y = polygon_sum((y + next_y) * cross) / (3 * area2)
+        outline_x = polygon_sum((x + next_x) / 2 * segment_length) / outline_length
+        outline_y = polygon_sum((y + next_y) / 2 * segment_length) / outline_length
+
+    has_area = area2 != 0
+    has_outline = ~has_area & (outline_length > 0)
+    is_point = ~has_area & ~has_outline
+    offset_x = np.select([has_area, has_outline, is_point], [area_x, outline_x, 0.0])
+    offset_y = np.select([has_area, has_outline, is_point], [area_y, outline_y, 0.0])
+
+    is_polygon = counts >= 3
+    centroid_x[is_polygon] = (base[:, 0] + offset_x)[is_polygon]
+    centroid_y[is_polygon] = (base[:, 1] + offset_y)[is_polygon]
+    area[is_polygon] = (np.abs(area2) / 2)[is_polygon]
+    return centroid_x, centroid_y, area
+
+
+def _nan_to_none(values: np.ndarray) -> list:
+    return [None if np.isnan(x) else x for x in values.tolist()]
+
+
+def summary_activities_to_columns(
+    summary_activities: list[SummaryActivity],
+) -> dict[str, list]:
+    """Batch version of `summary_activity_to_activity_model`.
+
+    Returns the activity columns as lists (one value per activity) instead of
+    `Activity` models. Polylines are decoded and their polygons measured for
+    all activities at once.
+    """
+    dumps = [x.model_dump(include=_SUMMARY_ACTIVITY_DUMP) for x in summary_activities]
+    columns = {
+        column: [dump[column] for dump in dumps] for column in SUMMARY_ACTIVITY_COLUMNS
+    }
+    columns["activity_id"] = [dump["id"] for dump in dumps]
+    columns["athlete_id"] = [dump["athlete"]["id"] for dump in dumps]
+
+    for prefix in ("start", "end"):
+        latlngs = [dump[f"{prefix}_latlng"] or None for dump in dumps]
+        columns[f"{prefix}_lat"] = [x[0] if x else None for x in latlngs]
+        columns[f"{prefix}_lng"] = [x[1] if x else None for x in latlngs]
+
+    starts = columns["start_date_local"]
+    columns["date"] = [x.date() for x in starts]
+    columns["time"] = [x.time() for x in starts]
+    columns["day_of_week"] = [x.strftime("%A") for x in starts]
+
+    moving_time_minutes = np.array(columns["moving_time"], dtype=float) / 60
+    distance_km = np.array(columns["distance"], dtype=float) / 1000
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pace = np.where(distance_km != 0, moving_time_minutes / distance_km, np.nan)
+    columns["moving_time_minutes"] = moving_time_minutes.tolist()
+    columns["distance_km"] = distance_km.tolist()
+    columns["pace_min_per_km"] = _nan_to_none(pace)
+
+    polylines = [dump["map"]["summary_polyline"] or "" for dump in dumps]
+    # shapely's Polygon takes the (lat, lng) points as (x, y)
+    centroid_lat, centroid_lon, area = polygon_centroids_and_areas(
+        *decode_polylines(polylines)
+    )
+    columns["map_centroid_lat"] = _nan_to_none(centroid_lat)
+    columns["map_centroid_lon"] = _nan_to_none(centroid_lon)
+    columns["map_area"] = _nan_to_none(area)
+    columns["map_summary_polyline"] = [dump["map"]["summary_polyline"] for dump in dumps]
+
+    return columns
+
+
+def columns_to_rows(columns: dict[str, list]) -> list[dict]:
+    """Turn column lists into row dicts for a bulk insert."""
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
@@ -1,5 +1,26 @@
-from src.tasks.etl.auth_etl import AuthETL  # noqa: F401
-from src.tasks.etl.single_activity_etl import SingleActivityETL  # noqa: F401
-from src.tasks.etl.user_etl import UserETL  # noqa: F401
-from src.tasks.etl.historic_activities_etl import ActivitiesETL  # noqa: F401
-from src.tasks.etl.naming_etl import run_name_activity_etl  # noqa: F401
+"""The ETLs, imported on first use.
+
+Importing them pulls in stravalib, pandas, matplotlib and pydantic_ai, which
+the web app does not need to start.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "AuthETL": "src.tasks.etl.auth_etl",
+    "SingleActivityETL": "src.tasks.etl.single_activity_etl",
+    "UserETL": "src.tasks.etl.user_etl",
+    "ActivitiesETL": "src.tasks.etl.historic_activities_etl",
+    "run_name_activity_etl": "src.tasks.etl.naming_etl",
+    "ActivityReconciliationETL": "src.tasks.etl.reconcile_activities_etl",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
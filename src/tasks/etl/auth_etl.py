@@ -5,6 +5,7 @@ from stravalib import Client
 from src.app.config import Settings
 from src.database.models import Auth
 from src.tasks.etl.base import ETL
+from src.tasks.strava import client_pool
 
 
 class AuthETL(ETL):
@@ -14,7 +15,7 @@ class AuthETL(ETL):
         self.scope = scope
 
     def extract(self):
-        client = Client()
+        client = Client(requests_session=client_pool.session)
         self._token_response = client.exchange_code_for_token(
             client_id=self.settings.strava_client_id,
             client_secret=self.settings.strava_client_secret,
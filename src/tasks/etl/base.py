@@ -1,13 +1,41 @@
+import contextvars
+import itertools
+import queue
+import threading
 from abc import ABC, abstractmethod
+from typing import Any, Iterable, Iterator
+
 from src.app.config import Settings
 from src.database.adapter import Database
+from src.tasks.instrumentation import stage_span
+from src.tasks.profiling import sampled_thread
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def put_unless_stopped(
+    target: queue.Queue, item: Any, stop: threading.Event, poll_seconds: float = 0.5
+) -> bool:
+    """Put an item on a bounded queue, giving up once `stop` is set."""
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=poll_seconds)
+            return True
+        except queue.Full:
+            continue
+    return False
 
 
 class ETL(ABC):
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, db: Database | None = None):
         self.settings = settings
 
-        self.db = Database(
+        # pipelines pass their database so the stages share it
+        self.db = db or Database(
             connection_string=settings.postgres_connection_string,
             encryption_key=settings.encryption_key,
         )
@@ -24,6 +52,91 @@ class ETL(ABC):
 
     def run(self):
         """Run the ETL process."""
-        self.extract()
-        self.transform()
-        return self.load()
+        etl = type(self).__name__
+        with stage_span("etl.extract", etl=etl):
+            self.extract()
+        with stage_span("etl.transform", etl=etl):
+            self.transform()
+        with stage_span("etl.load", etl=etl):
+            return self.load()
+
+
+_END_OF_STREAM = object()
+
+
+class StreamingETL(ETL):
+    """ETL that streams its data in batches instead of holding all of it in memory.
+
+    `extract_batches` yields batches, `transform_batch` is mapped over them
+    lazily and `load_batch` consumes the result re-chunked to `chunk_size`
+    items. Extract and transform run on a producer thread that blocks once
+    `max_pending_chunks` chunks are waiting to be loaded. `extract` can still
+    be used for setup before streaming starts.
+    """
+
+    chunk_size: int = 200
+    max_pending_chunks: int = 2
+
+    @abstractmethod
+    def extract_batches(self) -> Iterator[list]:
+        """Yield batches of data from the source."""
+
+    def transform_batch(self, batch: list) -> list:
+        """Transform one batch."""
+        return batch
+
+    @abstractmethod
+    def load_batch(self, chunk: list):
+        """Load one chunk into the target."""
+
+    def load(self) -> list:
+        """Stream all batches through transform and load, returning the load results."""
+        chunks: queue.Queue = queue.Queue(maxsize=self.max_pending_chunks)
+        stop = threading.Event()
+
+        def produce():
+            # whatever was extracted before an error is still loaded, then the
+            # error is raised in the caller
+            batches = self.extract_batches()
+            chunk, error = [], None
+            try:
+                for batch in batches:
+                    for item in self.transform_batch(batch):
+                        chunk.append(item)
+                        if len(chunk) == self.chunk_size:
+                            if not put_unless_stopped(chunks, chunk, stop):
+                                return
+                            chunk = []
+            except BaseException as e:
+                error = e
+            finally:
+                batches.close()
+            if chunk and not put_unless_stopped(chunks, chunk, stop):
+                return
+            put_unless_stopped(
+                chunks, error if error is not None else _END_OF_STREAM, stop
+            )
+
+        def run_producer():
+            with sampled_thread():
+                produce()
+
+        producer = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(run_producer,),
+            name=f"{type(self).__name__}-producer",
+            daemon=True,
+        )
+        producer.start()
+
+        results = []
+        try:
+            while (chunk := chunks.get()) is not _END_OF_STREAM:
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                results.append(self.load_batch(chunk))
+        finally:
+            stop.set()
+            producer.join()
+
+        return results
@@ -1,45 +1,305 @@
+import contextvars
 import datetime
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator
 
+from stravalib import Client
 
 from src.app.config import Settings
-from src.database.models import Activity
-from src.tasks.data import summary_activity_to_activity_model
-from src.tasks.etl.base import ETL
+from src.database.models import ActivitySyncCheckpoint
+from src.tasks.data import columns_to_rows, summary_activities_to_columns
+from src.tasks.etl.base import StreamingETL, chunked, put_unless_stopped
+from src.tasks.rate_budget import current_priority, rate_budget
 from src.tasks.strava import get_strava_client
 
+logger = logging.getLogger(__name__)
 
-class ActivitiesETL(ETL):
+# The date range is synced in windows of this many days, aligned to the epoch
+# so that windows line up between runs and completed ones can be skipped
+SYNC_WINDOW_DAYS = 90
+
+# Windows fetched at the same time
+SYNC_MAX_WORKERS = 3
+
+# Activities converted and inserted at a time (one page of the Strava API)
+SYNC_CHUNK_SIZE = 200
+
+# Incremental syncs start this long before the latest stored activity, to pick
+# up activities uploaded late (e.g. from a device synced after a newer one)
+SYNC_WATERMARK_OVERLAP = datetime.timedelta(days=2)
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+SyncWindow = tuple[datetime.datetime, datetime.datetime]
+
+
+def paced(pages: Iterator[list]) -> Iterator[list]:
+    """Wait for backfill capacity before each page is requested from Strava.
+
+    Activities are requested a page at a time as the iterator is consumed, so
+    a long window of a backfill checks the budget before every request.
+    """
+    while True:
+        if current_priority() == "backfill":
+            rate_budget.wait_for_backfill_capacity()
+        page = next(pages, None)
+        if page is None:
+            return
+        yield page
+
+
+def sync_windows(
+    after: datetime.datetime, before: datetime.datetime, window_days: int
+) -> list[SyncWindow]:
+    """Split [after, before] into epoch aligned windows, clipped to the range."""
+    size = datetime.timedelta(days=window_days)
+    start = _EPOCH + ((after - _EPOCH) // size) * size
+    windows = []
+    while start < before:
+        end = start + size
+        windows.append((max(start, after), min(end, before)))
+        start = end
+    return windows
+
+
+def is_window_synced(
+    window: SyncWindow, checkpoints: list[ActivitySyncCheckpoint]
+) -> bool:
+    """Whether the window is covered by the union of the checkpointed windows."""
+    window_after, window_before = window
+    covered_until = window_after
+    for checkpoint in sorted(checkpoints, key=lambda x: x.window_after):
+        if checkpoint.window_after > covered_until:
+            break
+        covered_until = max(covered_until, checkpoint.window_before)
+    return covered_until >= window_before
+
+
+def has_sync_gap(
+    checkpoints: list[ActivitySyncCheckpoint],
+    until: datetime.datetime,
+    window_days: int,
+) -> bool:
+    """Whether an earlier windowed sync left windows before `until` unsynced.
+
+    Only the range of the checkpoints is checked; activities after the last
+    checkpoint are stored by the webhooks, not by a windowed sync.
+    """
+    if not checkpoints:
+        return False
+    start = min(checkpoint.window_after for checkpoint in checkpoints)
+    until = min(until, max(checkpoint.window_before for checkpoint in checkpoints))
+    return any(
+        not is_window_synced(window, checkpoints)
+        for window in sync_windows(start, until, window_days)
+    )
+
+
+def stored_window(
+    checkpoints: list[ActivitySyncCheckpoint],
+    oldest: datetime.datetime | None,
+    newest: datetime.datetime | None,
+    window_days: int,
+) -> SyncWindow | None:
+    """The range the stored activities cover beyond the checkpointed windows.
+
+    Activities after the last checkpoint were stored by the webhooks, the
+    same assumption the incremental sync makes. Athletes synced before
+    checkpoints existed have no checkpoints; their stored history is taken
+    as complete from the oldest stored activity on.
+    """
+    if oldest is None or newest is None:
+        return None
+    newest = newest - SYNC_WATERMARK_OVERLAP
+    if checkpoints:
+        if has_sync_gap(checkpoints, newest, window_days):
+            return None
+        oldest = max(checkpoint.window_before for checkpoint in checkpoints)
+    if oldest >= newest:
+        return None
+    return oldest, newest
+
+
+@dataclass
+class SyncedWindow:
+    """Streamed after the last page of a window, once all of it was fetched."""
+
+    window: SyncWindow
+    activity_count: int
+
+
+class ActivitiesETL(StreamingETL):
     def __init__(
         self,
         settings: Settings,
         auth_uuid: int,
         before: datetime.datetime,
         after: datetime.datetime,
+        window_days: int = SYNC_WINDOW_DAYS,
+        max_workers: int = SYNC_MAX_WORKERS,
+        chunk_size: int = SYNC_CHUNK_SIZE,
+        incremental: bool = False,
+        skip_stored: bool = False,
     ):
         super().__init__(settings=settings)
         self.auth_uuid = auth_uuid
         self.before = before
         self.after = after
+        self.window_days = window_days
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.incremental = incremental
+        self.skip_stored = skip_stored
 
     def extract(self):
         auth = self.db.get_auth(self.auth_uuid)
-        client = get_strava_client(
-            access_token=auth.access_token,
-            refresh_token=auth.refresh_token,
-            expires_at=auth.expires_at,
-            strava_client_id=self.settings.strava_client_id,
-            strava_client_secret=self.settings.strava_client_secret,
+        self._client = get_strava_client(auth=auth, db=self.db, settings=self.settings)
+
+        # windows completed by an earlier (possibly crashed) run are skipped
+        checkpoints = self.db.get_activity_sync_checkpoints(self.auth_uuid)
+        covered = list(checkpoints)
+        if self.incremental or self.skip_stored:
+            athlete_id = self.db.get_user_by_auth_id(self.auth_uuid).athlete_id
+        if self.incremental:
+            self._apply_watermark(athlete_id, checkpoints)
+        if self.skip_stored:
+            stored = stored_window(
+                checkpoints,
+                *self.db.get_activity_start_date_range(athlete_id),
+                window_days=self.window_days,
+            )
+            if stored is not None:
+                # not saved, the stored activities are checked on every run
+                window_after, window_before = stored
+                covered.append(
+                    ActivitySyncCheckpoint(
+                        window_after=window_after, window_before=window_before
+                    )
+                )
+        windows = sync_windows(self.after, self.before, self.window_days)
+        self._windows = [
+            window for window in windows if not is_window_synced(window, covered)
+        ]
+        logger.info(
+            f"Syncing {len(self._windows)} of {len(windows)} windows | auth_uuid: {self.auth_uuid}"
+        )
+
+    def _apply_watermark(
+        self, athlete_id: int, checkpoints: list[ActivitySyncCheckpoint]
+    ):
+        """Only sync activities newer than the latest stored one.
+
+        Falls back to the full range when an earlier sync crashed before
+        finishing, as the stored history has gaps below the watermark then.
+        """
+        watermark = self.db.get_latest_activity_start_date(athlete_id)
+        if watermark is None:
+            logger.info(f"No stored activities, syncing full range | auth_uuid: {self.auth_uuid}")
+            return
+        if has_sync_gap(checkpoints, watermark, self.window_days):
+            logger.info(
+                f"Earlier sync did not finish, syncing full range | auth_uuid: {self.auth_uuid}"
+            )
+            return
+        self.after = max(self.after, watermark - SYNC_WATERMARK_OVERLAP)
+        logger.info(
+            f"Syncing activities after {self.after:%Y-%m-%d %H:%M} | auth_uuid: {self.auth_uuid}"
         )
-        self._summary_activities = client.get_activities(
-            after=self.after, before=self.before
+
+    def extract_batches(self) -> Iterator[list]:
+        # windows are fetched concurrently into a bounded queue of pages, so
+        # fetchers pause while the loader catches up
+        pages: queue.Queue = queue.Queue(maxsize=self.max_workers)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="activity-sync"
         )
-        self._summary_activities = [x for x in self._summary_activities]
+        for window in self._windows:
+            executor.submit(
+                contextvars.copy_context().run,
+                self._fetch_window,
+                self._client,
+                window,
+                pages,
+                stop,
+            )
+        try:
+            # a failed window doesn't stop the others; the first error is
+            # raised once they are done
+            error = None
+            pending = len(self._windows)
+            while pending:
+                batch = pages.get()
+                if isinstance(batch, BaseException):
+                    error = error or batch
+                    pending -= 1
+                elif isinstance(batch, SyncedWindow):
+                    pending -= 1
+                    yield [batch]
+                else:
+                    yield batch
+            if error is not None:
+                raise error
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _fetch_window(
+        self,
+        client: Client,
+        window: SyncWindow,
+        pages: queue.Queue,
+        stop: threading.Event,
+    ):
+        window_after, window_before = window
+
+        count = 0
+        try:
+            summary_activities = client.get_activities(
+                after=window_after, before=window_before
+            )
+            for page in paced(chunked(summary_activities, self.chunk_size)):
+                if not put_unless_stopped(pages, page, stop):
+                    return
+                count += len(page)
+        except Exception as e:
+            put_unless_stopped(pages, e, stop)
+            return
+        put_unless_stopped(
+            pages, SyncedWindow(window=window, activity_count=count), stop
+        )
+
+    def transform_batch(self, batch: list) -> list:
+        if isinstance(batch[0], SyncedWindow):
+            return batch
+        return columns_to_rows(summary_activities_to_columns(batch))
+
+    def load_batch(self, chunk: list) -> int:
+        # a window's marker comes after all of its activities, so by the time
+        # it is seen they are inserted (in this chunk or an earlier one)
+        rows = [x for x in chunk if not isinstance(x, SyncedWindow)]
+        added = self.db.insert_new_activity_rows(rows)
 
-    def transform(self):
-        self._activities: list[Activity] = []
-        for summary_activity in self._summary_activities:
-            activity = summary_activity_to_activity_model(summary_activity)
-            self._activities.append(activity)
+        for synced in chunk:
+            if not isinstance(synced, SyncedWindow):
+                continue
+            window_after, window_before = synced.window
+            self.db.add_activity_sync_checkpoint(
+                auth_uuid=self.auth_uuid,
+                window_after=window_after,
+                window_before=window_before,
+                activity_count=synced.activity_count,
+            )
+            logger.info(
+                f"Synced {synced.activity_count} activities from {window_after:%Y-%m-%d} to {window_before:%Y-%m-%d} | auth_uuid: {self.auth_uuid}"
+            )
+        return added
 
-    def load(self):
-        self.db.add_activities_bulk(self._activities)
+    def load(self) -> int:
+        added = sum(super().load())
+        logger.info(f"Added {added} activities | auth_uuid: {self.auth_uuid}")
+        return added
@@ -1,13 +1,16 @@
 from __future__ import annotations
 import datetime
 import re
-from typing import Literal
+from typing import Callable, Literal
 
 import pandas as pd
 
 from src.app.config import Settings
-from src.database.models import NameSuggestion
+from src.database.models import Activity, NameSuggestion
 from src.tasks.etl.base import ETL
+from src.tasks.etl.naming_strategies.agent import NameResult
+from src.tasks.instrumentation import stage_tags
+from src.tasks.pipeline_context import PipelineContext
 
 import logging
 
@@ -17,6 +20,11 @@ from src.tasks.etl.naming_strategies.v2.naming_strategy_v2 import NamingStrategy
 
 logger = logging.getLogger(__name__)
 
+NAMING_STRATEGIES = {"v1": NamingStrategyV1, "v2": NamingStrategyV2}
+
+# names Strava gives activities by default
+BASE_STRAVA_NAME_REGEX = r"(Morning|Lunch|Afternoon|Evening|Night) (Run|Ride|Swim|Pilates|Mountain Bike Ride|Workout|Weight Training|Trail Run|HIIT)"
+
 
 def run_name_activity_etl(
     llm_model: str,
@@ -25,6 +33,8 @@ def run_name_activity_etl(
     naming_strategy_version: str | None = None,
     days: int = 365,
     temperature: float = 2.0,
+    context: PipelineContext | None = None,
+    on_name_result: Callable[[NameResult], None] | None = None,
 ):
     etl = NameSuggestionETL(
         llm_model=llm_model,
@@ -33,6 +43,8 @@ def run_name_activity_etl(
         days=days,
         temperature=temperature,
         naming_strategy_version=naming_strategy_version,
+        context=context,
+        on_name_result=on_name_result,
     )
     return etl.run()
 
@@ -52,22 +64,37 @@ class NameSuggestionETL(ETL):
         temperature: float,
         naming_strategy_version: str | None = None,
         number_of_options: int = 10,
+        context: PipelineContext | None = None,
+        on_name_result: Callable[[NameResult], None] | None = None,
     ):
-        super().__init__(settings=settings)
+        super().__init__(settings=settings, db=context.db if context else None)
         self.llm_model = llm_model
         self.activity_id = activity_id
         self.days = days
         self.temperature = temperature
         self.number_of_options = number_of_options
         self.naming_strategy_version = naming_strategy_version
+        self.context = context
+        self.on_name_result = on_name_result
 
         if self.naming_strategy_version is None:
-            self.naming_strategy_version = (
-                self.db.get_naming_strategy_version_by_activity_id(self.activity_id)
-            )
+            if self.context is not None:
+                self.naming_strategy_version = (
+                    self.context.get_naming_strategy_version()
+                )
+            else:
+                self.naming_strategy_version = (
+                    self.db.get_naming_strategy_version_by_activity_id(
+                        self.activity_id
+                    )
+                )
 
     def extract(self):
-        self._activity = self.db.get_activity_by_id(activity_id=self.activity_id)
+        if self.context is not None:
+            # a copy, as transform blanks out names of the activities it is given
+            self._activity = Activity(**self.context.get_activity().dict())
+        else:
+            self._activity = self.db.get_activity_by_id(activity_id=self.activity_id)
         athlete_id = self._activity.athlete_id
 
         before = self._activity.start_date_local + datetime.timedelta(days=1)
@@ -88,14 +115,13 @@ class NameSuggestionETL(ETL):
 
     def transform(self):
         # blank out activities that have been named with NeuralTag 🤖 or match base strava names
-        base_strava_name_regex = r"(Morning|Lunch|Afternoon|Evening|Night) (Run|Ride|Swim|Pilates|Mountain Bike Ride|Workout|Weight Training|Trail Run|HIIT)"
         blanked_out_count = 0
         for idx, activity in enumerate(self._activities):
             activity.description = str(activity.description)
             if (
                 str(activity.description)
                 and "named with NeuralTag 🤖" in activity.description
-                or re.search(base_strava_name_regex, activity.name)
+                or re.search(BASE_STRAVA_NAME_REGEX, activity.name)
             ):
                 activity.name = ""
                 activity.description = ""
@@ -132,7 +158,8 @@ class NameSuggestionETL(ETL):
             "map_centroid_lon",
             "map_area",
             "suffer_score",
-            "stream_data"
+            "stream_data",
+            "lap_summary",
         ]
 
         activities_df = activities_df[
@@ -145,13 +172,11 @@ class NameSuggestionETL(ETL):
         self._activities_df = activities_df.rename({"activity_id": "id"}, axis=1)
 
     def load(self):
-        mapping = {"v1": NamingStrategyV1, "v2": NamingStrategyV2}
-
         try:
-            cls = mapping[self.naming_strategy_version]
+            cls = NAMING_STRATEGIES[self.naming_strategy_version]
         except KeyError:
             raise ValueError(
-                f"Prompt version {self.naming_strategy_version} not supported. Supported versions are: {', '.join(mapping.keys())}"
+                f"Prompt version {self.naming_strategy_version} not supported. Supported versions are: {', '.join(NAMING_STRATEGIES.keys())}"
             )
 
         naming_strategy = cls(
@@ -161,11 +186,13 @@ class NameSuggestionETL(ETL):
             number_of_options=self.number_of_options,
             temperature=self.temperature,
             settings=self.settings,
+            on_name_result=self.on_name_result,
         )
 
-        name_results, prompt_response = naming_strategy.run()
-
+        with stage_tags(naming_strategy_version=self.naming_strategy_version):
+            name_results, prompt_response = naming_strategy.run()
 
+        prompt_response.naming_strategy_version = self.naming_strategy_version
         self.db.add_prompt_response(prompt_response)
 
         # sort names descending by probability
@@ -183,6 +210,8 @@ class NameSuggestionETL(ETL):
             self.db.add_name_suggestion(name_suggestion)
             name_suggestions.append(name_suggestion)
 
+        if self.context is not None:
+            self.context.name_suggestions = name_suggestions
         return name_suggestions
 
 
@@ -1,14 +1,28 @@
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from src.database.models import PromptResponse
+from src.tasks.instrumentation import stage_span
 # from google import genai
 
 from pydantic_ai.models.fallback import FallbackModel
-from pydantic_ai import Agent
+from pydantic_ai import Agent, BinaryContent
+from pydantic_ai.exceptions import UnexpectedModelBehavior
+from pydantic_ai.messages import ModelResponse
 from pydantic_ai.settings import ModelSettings
 
+logger = logging.getLogger(__name__)
+
+# Seconds the streamed output is buffered before it is validated again
+STREAM_DEBOUNCE = 0.1
+
 
 class NameResult(BaseModel):
     name: str
@@ -16,9 +30,68 @@ class NameResult(BaseModel):
     probability: float
 
 
+async def _stream_name_results(
+    naming_agent: Agent, rendered_prompt, on_name_result: Callable[[NameResult], None]
+):
+    """Run the agent with streamed output, passing on each name once it is complete.
+
+    The callbacks run one at a time on a thread of their own, so the stream
+    is read on while they run (e.g. publish to Strava), and are all done
+    when this returns or raises.
+    """
+    loop = asyncio.get_running_loop()
+    callbacks = []
+    completed = 0
+    with ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="name-results"
+    ) as callback_executor:
+        try:
+            async with naming_agent.run_stream(rendered_prompt) as result:
+                async for message, is_last in result.stream_structured(
+                    debounce_by=STREAM_DEBOUNCE
+                ):
+                    try:
+                        name_results = await result.validate_structured_output(
+                            message, allow_partial=not is_last
+                        )
+                    except ValidationError:
+                        if is_last:
+                            raise
+                        continue
+                    # until the output is complete the last name may still be streaming
+                    if not is_last:
+                        name_results = name_results[:-1]
+                    for name_result in name_results[completed:]:
+                        callbacks.append(
+                            loop.run_in_executor(
+                                callback_executor,
+                                contextvars.copy_context().run,
+                                on_name_result,
+                                name_result,
+                            )
+                        )
+                    completed = max(completed, len(name_results))
+        finally:
+            await asyncio.gather(*callbacks)
+    return result, name_results
+
+
 def run_naming_agent(
-    *, activity_id: int, rendered_prompt: str, temperature: float, llm_model: str
+    *,
+    activity_id: int,
+    rendered_prompt: str,
+    temperature: float,
+    llm_model: str,
+    on_name_result: Callable[[NameResult], None] | None = None,
 ) -> tuple[PromptResponse, list[NameResult]]:
+    """Ask the naming agent for names.
+
+    With `on_name_result` the output is streamed, and the callback is called
+    with each name as soon as it has been validated, in the order the model
+    gives them. If the streamed output turns out invalid, the names are asked
+    for again without streaming; names already passed to the callback may
+    then not be among the names returned.
+    """
     # ollama_model = OpenAIModel(
     #     model_name='deepseek-r1:latest', provider=OpenAIProvider(base_url='http://localhost:11434/v1')
     # )
@@ -38,9 +111,45 @@ def run_naming_agent(
         ),
     )
 
-    result = naming_agent.run_sync(
-        rendered_prompt,
+    image_bytes = 0
+    if isinstance(rendered_prompt, list):
+        image_bytes = sum(
+            len(x.data) for x in rendered_prompt if isinstance(x, BinaryContent)
+        )
+
+    start = time.perf_counter()
+    streamed_retries = 0
+    with stage_span("llm.naming_agent", llm_model=llm_model):
+        result = None
+        if on_name_result is not None:
+            try:
+                result, name_results = asyncio.run(
+                    _stream_name_results(naming_agent, rendered_prompt, on_name_result)
+                )
+            except (ValidationError, UnexpectedModelBehavior):
+                # a streamed run can't retry invalid output; run_sync can
+                logger.warning(
+                    f"Streamed names for activity {activity_id} were invalid, asking again",
+                    exc_info=True,
+                )
+                streamed_retries = 1
+        if result is None:
+            result = naming_agent.run_sync(
+                rendered_prompt,
+            )
+            name_results = result.data
+    latency_ms = round((time.perf_counter() - start) * 1000)
+
+    # the fallback model that answered is recorded on its response
+    served_model = next(
+        (
+            message.model_name
+            for message in reversed(result.all_messages())
+            if isinstance(message, ModelResponse)
+        ),
+        None,
     )
+    usage = result.usage()
 
     # if rendered_prompt is a list, take the first element (string, discard binary content)
     if isinstance(rendered_prompt, list):
@@ -48,10 +157,17 @@ def run_naming_agent(
     prompt_response = PromptResponse(
         activity_id=activity_id,
         prompt=rendered_prompt,
-        response=str(result.data),
+        response=str(name_results),
         llm_model=llm_model,
         temperature=temperature,
+        served_model=served_model,
+        request_tokens=usage.request_tokens,
+        response_tokens=usage.response_tokens,
+        image_bytes=image_bytes,
+        latency_ms=latency_ms,
+        # every request after the first retried an invalid output
+        retry_count=max(usage.requests - 1, 0) + streamed_retries,
     )
 
     # parse response
-    return prompt_response, result.data
+    return prompt_response, name_results
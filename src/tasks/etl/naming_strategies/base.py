@@ -1,5 +1,6 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from typing import Callable
 
 import pandas as pd
 
@@ -13,6 +14,13 @@ from src.tasks.etl.naming_strategies.agent import NameResult, run_naming_agent
 
 
 class BaseNamingStrategy(ABC):
+    # Strava stream types used to build the prompt. No streams are fetched for
+    # strategies that leave this empty.
+    stream_types: list[str] = []
+    # Whether the strategy can describe the workout from the activity laps. The
+    # streams are then only fetched when the laps are uninformative.
+    uses_laps: bool = False
+
     def __init__(
         self,
         activity_id: int,
@@ -21,6 +29,7 @@ class BaseNamingStrategy(ABC):
         number_of_options: int,
         temperature: float,
         settings: Settings,
+        on_name_result: Callable[[NameResult], None] | None = None,
     ):
         self.activity_id = activity_id
         self.llm_model = llm_model
@@ -28,6 +37,8 @@ class BaseNamingStrategy(ABC):
         self.number_of_options = number_of_options
         self.temperature = temperature
         self.settings = settings
+        # called with each name as it is streamed from the model
+        self.on_name_result = on_name_result
 
     def run(self) -> tuple[list[NameResult], PromptResponse]:
         self._preprocess_data()
@@ -47,6 +58,7 @@ class BaseNamingStrategy(ABC):
             llm_model=self.llm_model,
             rendered_prompt=rendered_prompt,
             temperature=self.temperature,
+            on_name_result=self.on_name_result,
         )
 
         return results, prompt_response
@@ -21,6 +21,10 @@ PROMPT_V2 = j2.Template(
 
 
 class NamingStrategyV2(BaseNamingStrategy):
+    # streams drawn on the attached activity plot
+    stream_types = ["time", "velocity_smooth", "heartrate", "altitude", "cadence"]
+    uses_laps = True
+
     def _preprocess_data(self):
         self.data["avg_elevation_gain_per_km"] = (
             1.0 * self.data["total_elevation_gain"] / self.data["distance_km"]
@@ -45,12 +49,15 @@ class NamingStrategyV2(BaseNamingStrategy):
     def _create_prompt(self, input: pd.Series, context_data: pd.DataFrame) -> str:
         binary_content = None
         
-        if input["stream_data"] is not None:
+        if input.get("stream_data") is not None:
             binary_content = BinaryContent(input["stream_data"], media_type='image/png')
 
-        # remove binary content from input and context data
-        input = input.drop("stream_data")
-        context_data = context_data.drop("stream_data", axis=1)
+        # remove binary content from input and context data, the lap summary is
+        # only relevant for the input activity
+        input = input.drop("stream_data", errors="ignore")
+        context_data = context_data.drop(
+            ["stream_data", "lap_summary"], axis=1, errors="ignore"
+        )
 
         rendered_prompt = PROMPT_V2.render(
             context_data=context_data.to_string(index=False),
@@ -0,0 +1,64 @@
+import datetime
+import logging
+
+from src.app.config import Settings
+from src.tasks.data import columns_to_rows, summary_activities_to_columns
+from src.tasks.etl.base import ETL
+from src.tasks.strava import get_strava_client
+
+logger = logging.getLogger(__name__)
+
+# Recent activities compared against Strava on every reconciliation
+RECONCILE_DAYS = 14
+
+
+class ActivityReconciliationETL(ETL):
+    """Catch up on missed webhooks by comparing recent activity ids with Strava.
+
+    Activities listed on Strava but not stored are added; stored activities
+    no longer listed on Strava (deleted while a webhook was missed) are
+    removed. Usually costs a single API call.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        auth_uuid: str,
+        days: int = RECONCILE_DAYS,
+        before: datetime.datetime | None = None,
+    ):
+        super().__init__(settings=settings)
+        self.auth_uuid = auth_uuid
+        # start dates are stored in UTC
+        self.before = before or datetime.datetime.now(datetime.timezone.utc).replace(
+            tzinfo=None
+        )
+        self.after = self.before - datetime.timedelta(days=days)
+
+    def extract(self):
+        auth = self.db.get_auth(self.auth_uuid)
+        self.athlete_id = self.db.get_user_by_auth_id(self.auth_uuid).athlete_id
+        client = get_strava_client(auth=auth, db=self.db, settings=self.settings)
+
+        self._remote_activities = list(
+            client.get_activities(after=self.after, before=self.before)
+        )
+        self._stored_ids = self.db.get_activity_ids_by_start_date(
+            athlete_id=self.athlete_id, after=self.after, before=self.before
+        )
+
+    def transform(self):
+        remote_ids = {x.id for x in self._remote_activities}
+        missing = [x for x in self._remote_activities if x.id not in self._stored_ids]
+        self._missing = columns_to_rows(summary_activities_to_columns(missing))
+        self._vanished = sorted(self._stored_ids - remote_ids)
+
+    def load(self) -> dict[str, int]:
+        added = self.db.insert_new_activity_rows(self._missing)
+        for activity_id in self._vanished:
+            self.db.delete_activity(activity_id=activity_id, athlete_id=self.athlete_id)
+
+        logger.info(
+            f"Reconciled activities: {added} added, {len(self._vanished)} deleted | auth_uuid: {self.auth_uuid}"
+        )
+        return {"added": added, "deleted": len(self._vanished)}
@@ -1,5 +1,6 @@
 import io
 import logging
+from typing import Literal
 
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
@@ -9,53 +10,182 @@ import pandas as pd
 from src.app.config import Settings
 from src.tasks.data import summary_activity_to_activity_model
 from src.tasks.etl.base import ETL
-from src.tasks.strava import get_strava_client
+from src.tasks.etl.naming_etl import NAMING_STRATEGIES
+from src.tasks.instrumentation import stage_span
+from src.tasks.laps import summarize_laps
+from src.tasks.pipeline_context import PipelineContext
+from src.tasks.render_cache import render_stream_plot
+from src.tasks.strava import fetch_concurrently
 
 logger = logging.getLogger(__name__)
 
+# Plot configuration for the activity streams chart, keyed by stream column
+STREAM_PLOT_CONFIG = {
+    "speed": {
+        "chart_title": "Speed",
+        "fillcolor": (0, 0, 1, 0.4),  # RGBA
+        "line_color": "blue",
+        "y_label": "Speed (km/h)",
+    },
+    "heartrate": {
+        "chart_title": "Heart Rate",
+        "fillcolor": (1, 0, 0, 0.4),  # RGBA
+        "line_color": "red",
+        "y_label": "Heart Rate (bpm)",
+    },
+    "altitude": {
+        "chart_title": "Altitude",
+        "fillcolor": (0, 1, 0, 0.4),  # RGBA
+        "line_color": "green",
+        "y_label": "Altitude (m)",
+    },
+    "cadence": {
+        "chart_title": "Cadence",
+        "fillcolor": (1, 1, 0, 0.4),  # RGBA
+        "line_color": "yellow",
+        "y_label": "Cadence (rpm)",
+    },
+}
+
+STREAM_PLOT_X_AXIS = "time"
+STREAM_PLOT_DPI = 300
+
+# Everything that affects the rendered image. Bump the version whenever the
+# rendering code changes so that stored plots are re-rendered: the planner
+# refetches the streams of activities whose plot has another config key.
+STREAM_RENDER_CONFIG = {
+    "version": 2,
+    "x_axis": STREAM_PLOT_X_AXIS,
+    "dpi": STREAM_PLOT_DPI,
+    "plot_config": STREAM_PLOT_CONFIG,
+}
+
+# Strava returns up to 100 ("low"), 1000 ("medium") or 10000 ("high") points
+# per stream. The plot is at most a few thousand pixels wide, so long
+# activities gain nothing from the high resolution. Ordered by the maximum
+# elapsed time (seconds) each resolution is used for.
+STREAM_RESOLUTIONS: list[tuple[int | None, Literal["low", "medium", "high"]]] = [
+    (30 * 60, "high"),
+    (None, "medium"),
+]
+
+
+def stream_resolution(elapsed_time: int | None) -> Literal["low", "medium", "high"]:
+    """Pick the stream resolution for an activity from its duration."""
+    for max_elapsed_time, resolution in STREAM_RESOLUTIONS:
+        if max_elapsed_time is None or (elapsed_time or 0) <= max_elapsed_time:
+            return resolution
+    return "high"
+
+
+def streams_to_dataframe(activity_streams: dict) -> pd.DataFrame:
+    streams_df = pd.DataFrame.from_records(
+        {k: v.data for k, v in activity_streams.items()}
+    )
+    # Strava reports speed as velocity_smooth in m/s, the plot uses km/h
+    if "velocity_smooth" in streams_df.columns:
+        streams_df["speed"] = streams_df["velocity_smooth"] * 3.6
+    return streams_df
+
 
 class SingleActivityETL(ETL):
-    def __init__(self, settings: Settings, activity_id: int, athlete_id: int):
-        super().__init__(settings=settings)
+    def __init__(
+        self,
+        settings: Settings,
+        activity_id: int,
+        athlete_id: int,
+        fetch_streams: bool = True,
+        context: PipelineContext | None = None,
+    ):
+        super().__init__(settings=settings, db=context.db if context else None)
         self.activity_id = activity_id
         self.athlete_id = athlete_id
-
-    def extract(self):
-        auth = self.db.get_auth_by_athlete_id(self.athlete_id)
-
-        client = get_strava_client(
-            access_token=auth.access_token,
-            refresh_token=auth.refresh_token,
-            expires_at=auth.expires_at,
-            strava_client_id=self.settings.strava_client_id,
-            strava_client_secret=self.settings.strava_client_secret,
+        # when False only the activity detail is refreshed and the stored
+        # workout structure (lap summary and stream plot) is kept
+        self.fetch_streams = fetch_streams
+        self.context = context or PipelineContext(
+            settings=settings,
+            db=self.db,
+            athlete_id=athlete_id,
+            activity_id=activity_id,
         )
 
-        # get activity
-        self._activity = client.get_activity(self.activity_id)
+    def extract(self):
+        client = self.context.get_client()
+
+        self._lap_summary = None
+        self._activity_streams_df = None
+        if not self.fetch_streams:
+            with stage_span("strava.activity"):
+                self._activity = client.get_activity(self.activity_id)
+            return
+
+        naming_strategy_version = self.context.get_naming_strategy_version()
+        naming_strategy = NAMING_STRATEGIES[naming_strategy_version]
+
+        # laps are a much smaller payload than the streams and describe
+        # structured workouts well enough to skip the streams and the plot, so
+        # they are fetched together with the activity and the streams after
+        requests = {"activity": lambda: client.get_activity(self.activity_id)}
+        if naming_strategy.uses_laps:
+            requests["laps"] = lambda: list(client.get_activity_laps(self.activity_id))
+        results = fetch_concurrently(**requests)
+        self._activity = results["activity"]
+
+        if naming_strategy.uses_laps:
+            sport_type = self._activity.sport_type
+            self._lap_summary = summarize_laps(
+                results["laps"], sport_type=sport_type.root if sport_type else None
+            )
+            if self._lap_summary is not None:
+                logger.info(
+                    f"Using lap structure of activity {self.activity_id}, skipping streams"
+                )
+                return
+
+        if not naming_strategy.stream_types:
+            logger.info(
+                f"Naming strategy {naming_strategy_version} uses no streams, skipping streams for activity {self.activity_id}"
+            )
+            return
 
         # get activity streams data
-        activity_streams = client.get_activity_streams(
-            activity_id=self.activity_id,
-            resolution="high",
-        )
-        self._activity_streams_df = pd.DataFrame.from_records(
-            {k: v.data for k, v in activity_streams.items()}
-        )
+        with stage_span("strava.streams"):
+            activity_streams = client.get_activity_streams(
+                activity_id=self.activity_id,
+                types=naming_strategy.stream_types,
+                resolution=stream_resolution(self._activity.elapsed_time),
+                series_type="time",
+            )
+        self._activity_streams_df = streams_to_dataframe(activity_streams)
 
     def transform(self):
         self._activity_model = summary_activity_to_activity_model(self._activity)
-
-        self._activity_model.stream_data = _make_streams_png_plot_with_matplotlib(
-            self._activity_streams_df
+        self._activity_model.lap_summary = self._lap_summary
+
+        if self._activity_streams_df is None:
+            return
+
+        (
+            self._activity_model.stream_data,
+            self._activity_model.stream_data_hash,
+        ) = render_stream_plot(
+            streams_df=self._activity_streams_df,
+            render_config=STREAM_RENDER_CONFIG,
+            render=_make_streams_png_plot_with_matplotlib,
         )
 
     def load(self):
-        self.db.add_activity(self._activity_model)
-        return self._activity_model
-
-
-
+        preserve_columns = []
+        if not self.fetch_streams:
+            preserve_columns.append("lap_summary")
+        if self._activity_streams_df is None:
+            preserve_columns += ["stream_data", "stream_data_hash"]
+        # the stored activity (with preserved columns) is handed to the next stages
+        self.context.activity = self.db.add_activity(
+            self._activity_model, preserve_columns=preserve_columns
+        )
+        return self.context.activity
 
 
 def _make_streams_png_plot_with_matplotlib(
@@ -75,7 +205,8 @@ def _make_streams_png_plot_with_matplotlib(
         None: If the 'distance' column is missing or none of the expected data columns are found.
     """
 
-    x_axis = "time"
+    x_axis = STREAM_PLOT_X_AXIS
+    plot_config = STREAM_PLOT_CONFIG
 
     # validate x_axis present
     if x_axis not in streams_df.columns:
@@ -84,34 +215,6 @@ def _make_streams_png_plot_with_matplotlib(
         )
         return None
 
-    # Define plot configuration in a dict
-    plot_config = {
-        "speed": {
-            "chart_title": "Speed",
-            "fillcolor": (0, 0, 1, 0.4),  # RGBA
-            "line_color": "blue",
-            "y_label": "Speed (km/h)",
-        },
-        "heartrate": {
-            "chart_title": "Heart Rate",
-            "fillcolor": (1, 0, 0, 0.4),  # RGBA
-            "line_color": "red",
-            "y_label": "Heart Rate (bpm)",
-        },
-        "altitude": {
-            "chart_title": "Altitude",
-            "fillcolor": (0, 1, 0, 0.4),  # RGBA
-            "line_color": "green",
-            "y_label": "Altitude (m)",
-        },
-        "cadence": {
-            "chart_title": "Cadence",
-            "fillcolor": (1, 1, 0, 0.4),  # RGBA
-            "line_color": "yellow",
-            "y_label": "Cadence (rpm)",
-        },
-    }
-
     columns_found = [col for col in plot_config if col in streams_df.columns]
     if not columns_found:
         logger.warning(
@@ -215,7 +318,7 @@ def _make_streams_png_plot_with_matplotlib(
     plt.savefig(
         filename,
         format="png",
-        dpi=300,
+        dpi=STREAM_PLOT_DPI,
         bbox_inches="tight",
         facecolor="black",
         edgecolor="none",
@@ -226,7 +329,7 @@ def _make_streams_png_plot_with_matplotlib(
     plt.savefig(
         buffer,
         format="png",
-        dpi=300,
+        dpi=STREAM_PLOT_DPI,
         bbox_inches="tight",
         facecolor="black",
         edgecolor="none",
@@ -14,13 +14,7 @@ class UserETL(ETL):
 
     def extract(self):
         auth = self.db.get_auth(self.auth_uuid)
-        client = get_strava_client(
-            access_token=auth.access_token,
-            refresh_token=auth.refresh_token,
-            expires_at=auth.expires_at,
-            strava_client_id=self.settings.strava_client_id,
-            strava_client_secret=self.settings.strava_client_secret,
-        )
+        client = get_strava_client(auth=auth, db=self.db, settings=self.settings)
         self._athlete = client.get_athlete()
 
     def load(self):
@@ -0,0 +1,58 @@
+"""Spans and duration histograms for the background pipeline stages.
+
+logfire instruments the FastAPI requests, but the webhook pipeline, the ETLs,
+Strava calls, rendering, LLM calls and publishing run outside of them.
+`stage_span` wraps such a stage in a logfire span and records its duration in
+`stage_durations`, so the time from webhook to rename can be broken down per
+stage both in logfire and in-process.
+
+Tags set with `stage_tags` (athlete, naming strategy version, model) are
+added to every span opened in that context, including spans opened on the
+threads of `fetch_concurrently` and the streaming ETLs, which copy it.
+"""
+
+import contextlib
+import contextvars
+import time
+
+import logfire
+
+from src.metrics_registry import Histograms
+
+# Tags used as histogram labels. Others (e.g. the athlete) are only added to
+# the spans, one histogram series per athlete would be too many.
+HISTOGRAM_LABELS = ("etl", "naming_strategy_version", "llm_model")
+
+_tags: contextvars.ContextVar[dict] = contextvars.ContextVar(
+    "stage_tags", default={}
+)
+
+
+stage_durations = Histograms(
+    "stage_duration_seconds",
+    description="Durations of the pipeline stages.",
+    key_label="stage",
+)
+
+
+@contextlib.contextmanager
+def stage_tags(**tags):
+    """Add tags to the stage spans opened in this context."""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+@contextlib.contextmanager
+def stage_span(stage: str, **tags):
+    """Time a pipeline stage in a logfire span and in `stage_durations`."""
+    tags = {k: v for k, v in {**_tags.get(), **tags}.items() if v is not None}
+    labels = {k: str(tags[k]) for k in HISTOGRAM_LABELS if k in tags}
+    start = time.perf_counter()
+    try:
+        with logfire.span(stage, _span_name=stage, **tags):
+            yield
+    finally:
+        stage_durations.observe(stage, time.perf_counter() - start, labels)
@@ -0,0 +1,160 @@
+"""Work out interval and repeat structure of an activity from its laps.
+
+Lap summaries are a tiny payload compared to the activity streams. For
+structured workouts (manual laps, workout files) they describe the intervals
+well enough that the streams don't need to be fetched and plotted. Laps
+without repeats of fast and easy laps, such as auto-laps (every lap the same
+distance), carry no structure and are reported as uninformative so the caller
+can fall back to the streams. Equal lap distances alone don't make auto-laps:
+8 x 400 m with 400 m jogs has them too.
+"""
+
+import statistics
+
+from stravalib.model import Lap
+
+from src.metrics_registry import Counters
+
+# Fewer laps than this can't describe repeats
+MIN_INFORMATIVE_LAPS = 3
+
+# Laps (except the last one) whose distances are within this relative spread
+# are treated as auto-laps
+AUTO_LAP_DISTANCE_TOLERANCE = 0.03
+
+# Fastest lap must be at least this much faster than the slowest lap for the
+# laps to be split into work and recovery
+INTERVAL_SPEED_RATIO = 1.15
+
+# The same for laps of equal distance, which also need to alternate
+AUTO_LAP_INTERVAL_SPEED_RATIO = 1.35
+
+PACE_SPORT_TYPES = ("Run", "TrailRun", "VirtualRun", "Walk", "Hike")
+
+lap_counters = Counters("lap_detection")
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+def _format_distance(meters: float) -> str:
+    if meters < 1000:
+        return f"{meters:.0f} m"
+    return f"{meters / 1000:.2f} km"
+
+
+def _format_speed(speed: float, sport_type: str | None) -> str:
+    if not speed:
+        return "-"
+    if sport_type in PACE_SPORT_TYPES:
+        return f"{_format_duration(1000 / speed)} /km"
+    return f"{speed * 3.6:.1f} km/h"
+
+
+def is_auto_lap(laps: list[Lap]) -> bool:
+    """Whether the laps are evenly split by distance, i.e. carry no structure."""
+    distances = [float(lap.distance or 0) for lap in laps[:-1]]
+    median_distance = statistics.median(distances)
+    if median_distance <= 0:
+        return True
+    return (max(distances) - min(distances)) / median_distance <= (
+        AUTO_LAP_DISTANCE_TOLERANCE
+    )
+
+
+def classify_work_laps(
+    laps: list[Lap], min_speed_ratio: float = INTERVAL_SPEED_RATIO
+) -> list[bool] | None:
+    """Flag the fast (work) laps, or None if there is no speed contrast."""
+    speeds = [float(lap.average_speed or 0) for lap in laps]
+    slowest, fastest = min(speeds), max(speeds)
+    if slowest <= 0 or fastest / slowest < min_speed_ratio:
+        return None
+    threshold = (slowest + fastest) / 2
+    return [speed >= threshold for speed in speeds]
+
+
+def _alternates(is_work: list[bool]) -> bool:
+    """Whether work and recovery laps take turns between the first and last work."""
+    first_work = is_work.index(True)
+    last_work = len(is_work) - 1 - is_work[::-1].index(True)
+    section = is_work[first_work : last_work + 1]
+    return all(work != previous for previous, work in zip(section, section[1:]))
+
+
+def _count_repeats(is_work: list[bool]) -> int:
+    """Number of contiguous runs of work laps."""
+    return sum(
+        1
+        for idx, work in enumerate(is_work)
+        if work and (idx == 0 or not is_work[idx - 1])
+    )
+
+
+def summarize_laps(laps: list[Lap], sport_type: str | None = None) -> str | None:
+    """Describe the lap structure of an activity for the naming prompt.
+
+    Returns None when the laps are uninformative (too few laps, or no repeats
+    of fast and easy laps).
+    """
+    if len(laps) < MIN_INFORMATIVE_LAPS:
+        lap_counters.incr("uninformative")
+        return None
+
+    # intervals often have equal work and easy distances, so equal distances
+    # only ask for stronger evidence of repeats
+    auto_lap = is_auto_lap(laps)
+    is_work = classify_work_laps(
+        laps,
+        min_speed_ratio=(
+            AUTO_LAP_INTERVAL_SPEED_RATIO if auto_lap else INTERVAL_SPEED_RATIO
+        ),
+    )
+    if is_work and auto_lap and not _alternates(is_work):
+        is_work = None
+    repeats = _count_repeats(is_work) if is_work else 0
+    if repeats < 2:
+        lap_counters.incr("auto_laps" if auto_lap else "no_repeats")
+        lap_counters.incr("uninformative")
+        return None
+    lap_counters.incr("informative")
+
+    lines = []
+    work_laps = [lap for lap, work in zip(laps, is_work) if work]
+    # recoveries sit between work laps; warm up and cool down do not count
+    first_work = is_work.index(True)
+    last_work = len(is_work) - 1 - is_work[::-1].index(True)
+    recovery_laps = [
+        lap
+        for lap, work in zip(laps[first_work:last_work], is_work[first_work:last_work])
+        if not work
+    ]
+    work_distance = statistics.median(float(lap.distance or 0) for lap in work_laps)
+    work_speed = statistics.median(float(lap.average_speed or 0) for lap in work_laps)
+    structure = (
+        f"{repeats} x {_format_distance(work_distance)}"
+        f" at {_format_speed(work_speed, sport_type)}"
+    )
+    if recovery_laps:
+        recovery_time = statistics.median(
+            int(lap.elapsed_time or 0) for lap in recovery_laps
+        )
+        structure += f" with {_format_duration(recovery_time)} recoveries"
+    lines.append(f"Intervals: {structure}")
+
+    for idx, lap in enumerate(laps):
+        kind = " (work)" if is_work[idx] else " (easy)"
+        line = (
+            f"Lap {idx + 1}{kind}: {_format_distance(float(lap.distance or 0))}"
+            f" in {_format_duration(int(lap.elapsed_time or 0))}"
+            f", {_format_speed(float(lap.average_speed or 0), sport_type)}"
+        )
+        if lap.average_heartrate:
+            line += f", HR {lap.average_heartrate:.0f}"
+        if lap.total_elevation_gain:
+            line += f", +{float(lap.total_elevation_gain):.0f} m"
+        lines.append(line)
+
+    return "\n".join(lines)
@@ -0,0 +1,227 @@
+"""Progressive onboarding of new athletes.
+
+On login the most recent activities are synced first, with live priority,
+so that the athlete's next activity can be named with good context within
+seconds. The deeper history is then backfilled with backfill priority. The
+progress is stored on the user.
+
+Onboarding runs in a background task of the app, which dies with the
+process. A status stuck before "ready" for `ONBOARDING_STALE_AFTER` is
+therefore treated as ready, and naming stops waiting for an athlete once a
+wait has timed out, until the status changes. Running onboardings refresh
+their status; the periodic reconciliation resumes the ones whose status
+went stale (`resume_unfinished_onboardings`), fetching only the windows the
+sync checkpoints don't cover yet.
+"""
+
+import datetime
+import logging
+import contextlib
+import threading
+import time
+
+from src.app.config import Settings
+from src.database.adapter import Database
+from src.database.models import OnboardingStatus, UserType
+from src.tasks.rate_budget import strava_priority
+
+logger = logging.getLogger(__name__)
+
+# Days of recent activities synced before the athlete is ready for naming
+ONBOARDING_RECENT_DAYS = 60
+
+# Naming waits at most this long (seconds) for the recent activities to sync
+ONBOARDING_READY_TIMEOUT = 120
+ONBOARDING_READY_POLL_SECONDS = 2
+
+# Recent activities sync within minutes; a status not updated for longer than
+# this belongs to an onboarding that died (e.g. with an app restart)
+ONBOARDING_STALE_AFTER = datetime.timedelta(minutes=30)
+
+# Seconds between status refreshes of a running backfill, which can take hours
+ONBOARDING_HEARTBEAT_SECONDS = 5 * 60
+
+# Days of history synced on login
+ONBOARDING_HISTORY_DAYS = {
+    UserType.NEURALTAG.value: 365 * 3,
+    UserType.HISTORY.value: 90,
+}
+
+_NOT_READY = (OnboardingStatus.PENDING.value, OnboardingStatus.SYNCING_RECENT.value)
+
+# Athletes a wait timed out for in this process, with the time their status
+# was set; later jobs don't wait again until the status changes
+_timed_out_athletes: dict[int, datetime.datetime | None] = {}
+_timed_out_lock = threading.Lock()
+
+
+def is_ready_for_naming(
+    onboarding_status: str | None,
+    updated_at: datetime.datetime | None = None,
+    now: datetime.datetime | None = None,
+) -> bool:
+    """Athletes onboarded before progress was tracked (no status) are ready."""
+    if onboarding_status not in _NOT_READY:
+        return True
+    if updated_at is None:
+        # set before status updates were timed, by a long gone process
+        return True
+    now = now or datetime.datetime.now()
+    return now - updated_at > ONBOARDING_STALE_AFTER
+
+
+def wait_until_ready_for_naming(
+    db: Database, athlete_id: int, timeout: float = ONBOARDING_READY_TIMEOUT
+) -> bool:
+    """Wait for the recent activities of a new athlete to be synced.
+
+    Returns whether the athlete is ready; naming goes ahead either way after
+    the timeout, just with less context.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        status, updated_at = db.get_onboarding_status(athlete_id)
+        if is_ready_for_naming(status, updated_at):
+            return True
+        with _timed_out_lock:
+            if athlete_id in _timed_out_athletes:
+                if _timed_out_athletes[athlete_id] == updated_at:
+                    return False
+                # onboarding (re)started since the wait timed out
+                del _timed_out_athletes[athlete_id]
+        if time.monotonic() >= deadline:
+            logger.warning(f"Athlete {athlete_id} still onboarding, naming anyway")
+            with _timed_out_lock:
+                _timed_out_athletes[athlete_id] = updated_at
+            return False
+        time.sleep(ONBOARDING_READY_POLL_SECONDS)
+
+
+def sync_recent_activities(
+    settings: Settings, db: Database, auth_uuid: str, now: datetime.datetime
+) -> datetime.datetime:
+    """Sync the recent activities and mark the athlete ready for naming."""
+    from src.tasks.etl import ActivitiesETL
+
+    after = now - datetime.timedelta(days=ONBOARDING_RECENT_DAYS)
+    db.set_onboarding_status(auth_uuid, OnboardingStatus.SYNCING_RECENT.value)
+    try:
+        with strava_priority("live"):
+            ActivitiesETL(
+                settings=settings,
+                auth_uuid=auth_uuid,
+                after=after,
+                before=now,
+                incremental=True,
+            ).run()
+    except Exception:
+        # don't hold up naming, the backfill fetches the missing windows
+        logger.exception(f"Error syncing recent activities | auth_uuid: {auth_uuid}")
+        db.set_onboarding_status(auth_uuid, OnboardingStatus.READY.value)
+        return now
+
+    db.set_onboarding_status(
+        auth_uuid, OnboardingStatus.READY.value, synced_after=after
+    )
+    logger.info(f"Recent activities synced, ready for naming | auth_uuid: {auth_uuid}")
+    return after
+
+
+@contextlib.contextmanager
+def _refreshing_status(db: Database, auth_uuid: str, status: str):
+    """Keep setting `status` while the context runs, so it doesn't go stale."""
+    done = threading.Event()
+
+    def refresh():
+        while not done.wait(ONBOARDING_HEARTBEAT_SECONDS):
+            try:
+                db.set_onboarding_status(auth_uuid, status)
+            except Exception:
+                logger.exception(
+                    f"Could not refresh onboarding status | auth_uuid: {auth_uuid}"
+                )
+
+    thread = threading.Thread(
+        target=refresh, name="onboarding-heartbeat", daemon=True
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def backfill_activities(
+    settings: Settings,
+    db: Database,
+    auth_uuid: str,
+    after: datetime.datetime,
+    before: datetime.datetime,
+):
+    """Backfill the history older than the recent activities."""
+    from src.tasks.etl import ActivitiesETL
+
+    try:
+        # backfills yield the rate limit budget to live webhook processing
+        with strava_priority("backfill"), _refreshing_status(
+            db, auth_uuid, OnboardingStatus.READY.value
+        ):
+            # windows already stored (e.g. by an earlier login) aren't fetched again
+            ActivitiesETL(
+                settings=settings,
+                auth_uuid=auth_uuid,
+                after=after,
+                before=before,
+                skip_stored=True,
+            ).run()
+    except Exception:
+        db.set_onboarding_status(auth_uuid, OnboardingStatus.FAILED.value)
+        raise
+
+    db.set_onboarding_status(
+        auth_uuid, OnboardingStatus.COMPLETE.value, synced_after=after
+    )
+    logger.info(f"History backfilled | auth_uuid: {auth_uuid}")
+
+
+def resume_onboarding(
+    settings: Settings,
+    db: Database,
+    auth_uuid: str,
+    user_type: str,
+    status: str,
+    synced_after: datetime.datetime | None,
+):
+    """Finish an onboarding whose process died, or whose backfill failed."""
+    now = datetime.datetime.now()
+    after = now - datetime.timedelta(days=ONBOARDING_HISTORY_DAYS[user_type])
+    if status in _NOT_READY or synced_after is None:
+        recent_after = sync_recent_activities(
+            settings=settings, db=db, auth_uuid=auth_uuid, now=now
+        )
+    else:
+        recent_after = synced_after
+    backfill_activities(
+        settings=settings, db=db, auth_uuid=auth_uuid, after=after, before=recent_after
+    )
+
+
+def resume_unfinished_onboardings(settings: Settings, db: Database):
+    stale_before = datetime.datetime.now() - ONBOARDING_STALE_AFTER
+    onboardings = db.get_unfinished_onboardings(stale_before=stale_before)
+    logger.info(f"Resuming {len(onboardings)} unfinished onboardings")
+    for auth_uuid, user_type, status, synced_after in onboardings:
+        if user_type not in ONBOARDING_HISTORY_DAYS:
+            continue
+        try:
+            resume_onboarding(
+                settings=settings,
+                db=db,
+                auth_uuid=auth_uuid,
+                user_type=user_type,
+                status=status,
+                synced_after=synced_after,
+            )
+        except Exception:
+            logger.exception(f"Error resuming onboarding | auth_uuid: {auth_uuid}")
@@ -0,0 +1,75 @@
+"""State handed from one webhook pipeline stage to the next.
+
+`SingleActivityETL`, `NameSuggestionETL` and `publish_new_activity_name`
+all need the activity, the athlete's auth, user and Strava client. Without a
+context each stage reads them again (and builds another client); with one
+they are read once, and what a stage writes is passed on in memory.
+"""
+
+import threading
+from dataclasses import dataclass, field
+
+from stravalib import Client
+
+from src.app.config import Settings
+from src.database.adapter import Database
+from src.database.models import Activity, Auth, NameSuggestion, User
+from src.tasks.strava import get_strava_client
+
+
+@dataclass
+class PipelineContext:
+    settings: Settings
+    db: Database
+    athlete_id: int
+    activity_id: int
+
+    # set by the stages as they load or write them
+    activity: Activity | None = None
+    name_suggestions: list[NameSuggestion] | None = None
+    # the agent's name once it is published; naming stages run in parallel
+    # with publishing, which holds `publish_lock`
+    published_name: str | None = None
+    publish_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    _auth: Auth | None = field(default=None, repr=False)
+    _client: Client | None = field(default=None, repr=False)
+    _user: User | None = field(default=None, repr=False)
+    _naming_strategy_version: str | None = field(default=None, repr=False)
+
+    def get_auth(self) -> Auth:
+        if self._auth is None:
+            self._auth = self.db.get_auth_by_athlete_id(self.athlete_id)
+        return self._auth
+
+    def get_client(self) -> Client:
+        if self._client is None:
+            self._client = get_strava_client(
+                auth=self.get_auth(), db=self.db, settings=self.settings
+            )
+        return self._client
+
+    def get_user(self) -> User | None:
+        if self._user is None:
+            self._user = self.db.get_user_by_athlete_id(self.athlete_id)
+        return self._user
+
+    def get_user_type(self) -> str | None:
+        """Like `Database.get_user_type`, "unknown" when there is no user."""
+        user = self.get_user()
+        if user is None:
+            return "unknown"
+        return user.user_type or None
+
+    def get_naming_strategy_version(self) -> str:
+        if self._naming_strategy_version is None:
+            user = self.get_user()
+            self._naming_strategy_version = (
+                user.naming_strategy_version if user else None
+            ) or "v1"
+        return self._naming_strategy_version
+
+    def get_activity(self) -> Activity:
+        if self.activity is None:
+            self.activity = self.db.get_activity_by_id(activity_id=self.activity_id)
+        return self.activity
@@ -0,0 +1,130 @@
+"""Decide which webhook pipeline stages an activity event actually needs."""
+
+from __future__ import annotations
+
+import datetime
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from src.app.schemas.webhook_post_request import WebhookPostRequest
+from src.database.models import RenameHistory, UserType
+from src.metrics_registry import Counters
+
+if TYPE_CHECKING:
+    from src.tasks.etl.naming_strategies.base import BaseNamingStrategy
+
+# Title used by athletes to request a new name for an activity
+RENAME_TRIGGER_TITLE = "Rename"
+
+# Updates to a title we published within this window are treated as the echo
+# of our own `client.update_activity` call
+RENAME_ECHO_WINDOW = datetime.timedelta(minutes=15)
+
+pipeline_counters = Counters("webhook_pipeline")
+
+
+@dataclass
+class PipelinePlan:
+    fetch_activity: bool = False
+    fetch_streams: bool = False
+    name: bool = False
+    reason: str = ""
+
+    @property
+    def strava_calls(self) -> int:
+        """Number of Strava reads needed to refresh the stored activity."""
+        return int(self.fetch_activity) + int(self.fetch_streams)
+
+    def work(self, naming_strategy: type[BaseNamingStrategy]) -> tuple[int, int]:
+        """Strava calls and renders the planned stages make at most.
+
+        With streams, `SingleActivityETL` also reads the laps of strategies
+        that use them, and fetches and renders the streams only for strategies
+        that have stream types.
+        """
+        if not self.fetch_activity:
+            return 0, 0
+        if not self.fetch_streams:
+            return 1, 0
+        uses_streams = bool(naming_strategy.stream_types)
+        strava_calls = 1 + int(naming_strategy.uses_laps) + int(uses_streams)
+        return strava_calls, int(uses_streams)
+
+
+def is_rename_echo(
+    updates: dict | None,
+    last_rename: RenameHistory | None,
+    now: datetime.datetime | None = None,
+) -> bool:
+    """Whether an update only reports the title we published ourselves."""
+    if not updates or last_rename is None:
+        return False
+    if set(updates) != {"title"}:
+        return False
+    if updates.get("title") != last_rename.new_name:
+        return False
+
+    now = now or datetime.datetime.now()
+    return now - last_rename.created_at <= RENAME_ECHO_WINDOW
+
+
+def plan_activity_event(
+    content: WebhookPostRequest,
+    user_type: str | None,
+    has_activity: bool,
+    has_current_plot: bool,
+    last_rename: RenameHistory | None,
+    has_lap_summary: bool = False,
+) -> PipelinePlan:
+    """Plan the stages to run for an activity create or update event.
+
+    Streams are only fetched (and rendered) for NeuralTag users, since the
+    plot is only used when naming, and only when the stored activity has
+    neither a lap summary nor a plot rendered with the current render config.
+    Streams and laps do not change when an activity is updated.
+    """
+    if user_type == "unknown":
+        return PipelinePlan(reason="unknown user")
+    if content.aspect_type == "delete":
+        return PipelinePlan(reason="delete")
+
+    is_neuraltag = user_type == UserType.NEURALTAG.value
+    needs_streams = is_neuraltag and not (
+        has_activity and (has_current_plot or has_lap_summary)
+    )
+
+    if content.aspect_type == "create":
+        return PipelinePlan(
+            fetch_activity=True,
+            fetch_streams=needs_streams,
+            name=is_neuraltag,
+            reason="create",
+        )
+
+    if is_rename_echo(content.updates, last_rename):
+        return PipelinePlan(reason="echo of published rename")
+
+    updates = content.updates or {}
+    requested_rename = updates.get("title") == RENAME_TRIGGER_TITLE
+    return PipelinePlan(
+        fetch_activity=True,
+        fetch_streams=needs_streams,
+        name=is_neuraltag and requested_rename,
+        reason="rename requested" if requested_rename else "update",
+    )
+
+
+def record_plan(plan: PipelinePlan, naming_strategy: type[BaseNamingStrategy]):
+    """Count the Strava calls and renders the plan skips.
+
+    The baseline is the unplanned pipeline, which fetched the activity and the
+    streams for every event, under the athlete's naming strategy.
+    """
+    strava_calls, renders = plan.work(naming_strategy)
+    full_strava_calls, full_renders = PipelinePlan(
+        fetch_activity=True, fetch_streams=True
+    ).work(naming_strategy)
+
+    pipeline_counters.incr("events")
+    pipeline_counters.incr("skipped_strava_calls", full_strava_calls - strava_calls)
+    pipeline_counters.incr("skipped_renders", full_renders - renders)
@@ -2,10 +2,9 @@ import logging
 
 from src.database.adapter import Database
 from src.app.schemas.webhook_post_request import WebhookPostRequest
-from src.database.models import UserType
-from src.tasks.etl import SingleActivityETL
-from src.tasks.etl.naming_etl import run_name_activity_etl
-from src.tasks.publish_name import publish_new_activity_name
+from src.tasks.instrumentation import stage_span, stage_tags
+from src.tasks.onboarding import wait_until_ready_for_naming
+from src.tasks.pipeline_plan import plan_activity_event, record_plan
 from src.app.config import Settings
 
 
@@ -13,55 +12,119 @@ logger = logging.getLogger(__name__)
 
 
 def process_post_request(content: WebhookPostRequest, settings: Settings):
+    with stage_tags(athlete_id=content.owner_id), stage_span(
+        "webhook.process_post_request",
+        object_type=content.object_type,
+        object_id=content.object_id,
+        aspect_type=content.aspect_type,
+    ):
+        _process_post_request(content, settings=settings)
+
+
+def _process_post_request(content: WebhookPostRequest, settings: Settings):
     logger.info(f"Received webhook event: {content}")
 
     if content.object_type == "activity":
         if content.aspect_type in ("create", "update"):
+            # the pipeline stages pull in stravalib, pandas, matplotlib and
+            # pydantic_ai, which deletes and app startup don't need
+            from src.tasks.etl import SingleActivityETL
+            from src.tasks.etl.naming_etl import NAMING_STRATEGIES
+            from src.tasks.etl.single_activity_etl import STREAM_RENDER_CONFIG
+            from src.tasks.pipeline_context import PipelineContext
+            from src.tasks.provisional_naming import (
+                run_name_activity_etl_with_deadline,
+            )
+            from src.tasks.publish_name import (
+                EarlyNamePublisher,
+                publish_new_activity_name,
+            )
+            from src.tasks.render_cache import is_current_render, record_kept_plot
+
             activity_id = content.object_id
             athlete_id = content.owner_id
 
-            logger.info(
-                f"Running single activity etl for athlete {athlete_id} for activity {activity_id}"
+            db = Database(
+                connection_string=settings.postgres_connection_string,
+                encryption_key=settings.encryption_key,
             )
-            SingleActivityETL(
+            # carries what one stage loads or writes on to the next
+            context = PipelineContext(
                 settings=settings,
-                activity_id=activity_id,
+                db=db,
                 athlete_id=athlete_id,
-            ).run()
-            logger.info(
-                f"Successfully ran single activity etl for athlete {athlete_id} for activity {activity_id}"
+                activity_id=activity_id,
             )
-
-            db = Database(
-                connection_string=settings.postgres_connection_string,
-                encryption_key=settings.encryption_key,
+            stored = db.get_activity_workout_state(activity_id=activity_id)
+            has_current_plot = (
+                stored is not None
+                and stored.has_stream_data
+                and is_current_render(stored.stream_data_hash, STREAM_RENDER_CONFIG)
             )
-            user_type = db.get_user_type(athlete_id=athlete_id)
-            if user_type == UserType.NEURALTAG.value:
-                if content.aspect_type == "create" or (
-                    content.aspect_type == "update"
-                    and content.object_type == "activity"
-                    and content.updates is not None
-                    and "title" in content.updates
-                    and content.updates.get("title") == "Rename"
-                ):
-                    logger.info(f"Running name activity etl for activity {activity_id}")
-                    run_name_activity_etl(
+            plan = plan_activity_event(
+                content=content,
+                user_type=context.get_user_type(),
+                has_activity=stored is not None,
+                has_current_plot=has_current_plot,
+                has_lap_summary=stored is not None and stored.has_lap_summary,
+                last_rename=db.get_last_rename(activity_id=activity_id),
+            )
+            record_plan(
+                plan,
+                naming_strategy=NAMING_STRATEGIES[
+                    context.get_naming_strategy_version()
+                ],
+            )
+            if has_current_plot and plan.fetch_activity and not plan.fetch_streams:
+                record_kept_plot()
+            logger.info(f"Pipeline plan for activity {activity_id}: {plan}")
+
+            with stage_tags(
+                naming_strategy_version=context.get_naming_strategy_version()
+            ):
+                if plan.fetch_activity:
+                    logger.info(
+                        f"Running single activity etl for athlete {athlete_id} for activity {activity_id}"
+                    )
+                    SingleActivityETL(
+                        settings=settings,
                         activity_id=activity_id,
+                        athlete_id=athlete_id,
+                        fetch_streams=plan.fetch_streams,
+                        context=context,
+                    ).run()
+                    logger.info(
+                        f"Successfully ran single activity etl for athlete {athlete_id} for activity {activity_id}"
+                    )
+
+                if plan.name:
+                    # a new athlete's recent activities give the naming its context
+                    wait_until_ready_for_naming(db=db, athlete_id=athlete_id)
+
+                    logger.info(f"Running name activity etl for activity {activity_id}")
+                    # publishes a provisional name if the agent is slow
+                    run_name_activity_etl_with_deadline(
                         llm_model="google-gla:gemini-2.5-pro",
                         settings=settings,
                         days=365,
                         temperature=2.0,
+                        context=context,
+                        # publishes the first confident name as it streams in
+                        on_name_result=EarlyNamePublisher(
+                            settings=settings, context=context
+                        ),
                     )
                     logger.info(
                         f"Successfully ran name activity etl for activity {activity_id}"
                     )
 
                     logger.info(f"Running rename workflow for activity {activity_id}")
-                    publish_new_activity_name(
-                        activity_id=activity_id,
-                        settings=settings,
-                    )
+                    with stage_span("publish.activity_name"):
+                        publish_new_activity_name(
+                            activity_id=activity_id,
+                            settings=settings,
+                            context=context,
+                        )
                     logger.info(
                         f"Successfully ran rename workflow for activity {activity_id}"
                     )
@@ -0,0 +1,233 @@
+"""Opt-in CPU and memory profiling of webhook jobs.
+
+Profiling is switched on for all jobs, or the jobs of some athletes, with the
+`NEURALTAG_PROFILE` environment variable ("all" or comma separated athlete
+ids) or at runtime with the `profile_athletes` flag:
+
+    uv run python -m src.scripts.runtime_flag enable profile_athletes --value 123,456
+
+Each profiled job writes two files to `NEURALTAG_PROFILE_DIR` (default
+`profiles/`): `<job>.folded`, the sampled stacks of the job's threads in the
+folded format read by flamegraph.pl and speedscope, and `<job>.allocations.txt`,
+the source lines that allocated the most memory during the job (tracemalloc).
+
+Besides the worker thread, the executor threads running requests, the naming
+agent or ETL producers for the job are sampled while they do, see
+`sampled_thread`. Each stack starts with the name of its thread.
+"""
+
+import collections
+import contextlib
+import contextvars
+import datetime
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+
+from src.database.adapter import Database
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = "NEURALTAG_PROFILE"
+PROFILE_ATHLETES_FLAG = "profile_athletes"
+PROFILE_DIR = Path(os.environ.get("NEURALTAG_PROFILE_DIR", "profiles"))
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+# Frames kept per allocation traceback, and allocation sites written
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 25
+
+# tracemalloc is process-wide; it runs while any profiled job does
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False
+
+# The profiler of the job running in this context; copied into the executor
+# threads along with the rest of the context
+_active_profiler: contextvars.ContextVar["SamplingProfiler | None"] = (
+    contextvars.ContextVar("active_profiler", default=None)
+)
+
+
+def _profiles_athlete(value: str | None, athlete_id: int) -> bool:
+    if not value:
+        return False
+    athletes = {x.strip() for x in value.split(",")}
+    return "all" in athletes or str(athlete_id) in athletes
+
+
+def should_profile(db: Database, athlete_id: int) -> bool:
+    if _profiles_athlete(os.environ.get(PROFILE_ENV), athlete_id):
+        return True
+    enabled, value = db.get_runtime_flag(PROFILE_ATHLETES_FLAG)
+    return enabled and _profiles_athlete(value, athlete_id)
+
+
+class SamplingProfiler:
+    """Samples the stacks of a set of threads from a background thread."""
+
+    def __init__(
+        self, thread_id: int, thread_name: str, interval: float = SAMPLE_INTERVAL
+    ):
+        self.interval = interval
+        self.samples: collections.Counter[str] = collections.Counter()
+        self._lock = threading.Lock()
+        # thread id -> (thread name, times added)
+        self._threads: dict[int, tuple[str, int]] = {}
+        self.add_thread(thread_id, thread_name)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+
+    def add_thread(self, thread_id: int, thread_name: str):
+        with self._lock:
+            _, count = self._threads.get(thread_id, (thread_name, 0))
+            self._threads[thread_id] = (thread_name, count + 1)
+
+    def remove_thread(self, thread_id: int):
+        with self._lock:
+            name, count = self._threads[thread_id]
+            if count == 1:
+                del self._threads[thread_id]
+            else:
+                self._threads[thread_id] = (name, count - 1)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                threads = {
+                    thread_id: name for thread_id, (name, _) in self._threads.items()
+                }
+            frames = sys._current_frames()
+            for thread_id, thread_name in threads.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    module = frame.f_globals.get("__name__", "?")
+                    stack.append(f"{module}:{frame.f_code.co_qualname}")
+                    frame = frame.f_back
+                stack.append(thread_name)
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.items())
+
+
+@contextlib.contextmanager
+def sampled_thread():
+    """Sample the current thread while it works for the profiled job, if any.
+
+    For threads run with `contextvars.copy_context()` from within `profile`.
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    thread = threading.current_thread()
+    thread_id = thread.ident
+    profiler.add_thread(thread_id, thread.name)
+    try:
+        yield
+    finally:
+        profiler.remove_thread(thread_id)
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracemalloc_started = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        # leave tracing on if someone else started it
+        if _tracemalloc_users == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+
+
+def _top_allocations(
+    before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, peak: int, limit: int
+) -> str:
+    exclude = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ]
+    stats = after.filter_traces(exclude).compare_to(
+        before.filter_traces(exclude), "lineno"
+    )
+    # other threads allocate too; while jobs overlap their allocations mix
+    header = (
+        f"peak traced memory: {peak / 2**20:.1f} MiB\n"
+        f"top {limit} allocation sites by memory still held at the end of the job:\n"
+    )
+    return header + "".join(f"{stat}\n" for stat in stats[:limit])
+
+
+@contextlib.contextmanager
+def profile(name: str, output_dir: Path | None = None):
+    """Profile the code run in this context on the current thread."""
+    output_dir = output_dir or PROFILE_DIR
+    _start_tracemalloc()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    thread = threading.current_thread()
+    profiler = SamplingProfiler(thread_id=thread.ident, thread_name=thread.name)
+    profiler.start()
+    token = _active_profiler.set(profiler)
+    started = datetime.datetime.now()
+    try:
+        yield
+    finally:
+        _active_profiler.reset(token)
+        profiler.stop()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _stop_tracemalloc()
+
+        prefix = output_dir / f"{started:%Y%m%d-%H%M%S}-{name}"
+        try:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            Path(f"{prefix}.folded").write_text(profiler.folded())
+            Path(f"{prefix}.allocations.txt").write_text(
+                _top_allocations(before, after, peak=peak, limit=TOP_ALLOCATIONS)
+            )
+            logger.info(f"Wrote profile of {name} to {prefix}.*")
+        except Exception:
+            logger.exception(f"Could not write profile of {name}")
+
+
+@contextlib.contextmanager
+def maybe_profile(db: Database, athlete_id: int, name: str):
+    """Profile the code run in this context if profiling is on for the athlete."""
+    try:
+        enabled = should_profile(db, athlete_id)
+    except Exception:
+        logger.exception("Could not read the profiling flag")
+        enabled = False
+
+    if not enabled:
+        yield
+        return
+    with profile(name):
+        yield
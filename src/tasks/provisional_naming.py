@@ -0,0 +1,296 @@
+"""Deadline-bounded naming with a local, heuristic namer.
+
+The naming agent walks a chain of fallback models and can take minutes when
+they are slow. `run_name_activity_etl_with_deadline` gives it
+`NAMING_DEADLINE` seconds (env `NAMING_DEADLINE_SECONDS`); when the deadline
+expires, or the agent fails, a provisional name built from the athlete's
+own history is published straight away, and the agent's name replaces it
+once the agent is done. A retried job doesn't publish another provisional
+name while the activity still carries the last name published for it.
+
+The provisional name reuses the name the athlete gives a route they run
+repeatedly, and otherwise describes the activity against the last year of
+the same sport, e.g. "Sunday Long Hilly Run · 21 km".
+"""
+
+import collections
+import concurrent.futures
+import contextvars
+import datetime
+import logging
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.app.config import Settings
+from src.database.models import Activity, NameSuggestion
+from src.metrics_registry import Counters
+from src.tasks.etl.naming_etl import BASE_STRAVA_NAME_REGEX, run_name_activity_etl
+from src.tasks.instrumentation import stage_span
+from src.tasks.pipeline_context import PipelineContext
+from src.tasks.profiling import sampled_thread
+from src.tasks.publish_name import NEURALTAG_SIGNATURE, publish_new_activity_name
+
+logger = logging.getLogger(__name__)
+
+NAMING_DEADLINE = float(os.environ.get("NAMING_DEADLINE_SECONDS", "60"))
+
+HISTORY_DAYS = 365
+
+# Same-sport activities needed before percentiles and weekday habits mean anything
+MIN_HISTORY = 5
+
+# Distance and climb percentiles that earn an adjective
+LONG_PERCENTILE = 0.8
+SHORT_PERCENTILE = 0.2
+HILLY_PERCENTILE = 0.8
+
+# Share of the same-sport activities on one weekday that makes it a habit
+WEEKDAY_HABIT_SHARE = 0.3
+
+# Activities whose start and end are this close, and whose distances differ by
+# at most this fraction, are on the same route
+ROUTE_RADIUS_METERS = 250
+ROUTE_DISTANCE_TOLERANCE = 0.1
+
+# Times the athlete must have used a name on a route before it is reused
+ROUTE_NAME_MIN_USES = 2
+
+naming_counters = Counters("provisional_naming")
+
+# The agent runs here while the webhook worker waits on the deadline
+_naming_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="naming")
+
+
+def _distance_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Haversine distance between two points."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * 6_371_000 * math.asin(math.sqrt(a))
+
+
+def _has_route(activity: Activity) -> bool:
+    return None not in (
+        activity.start_lat,
+        activity.start_lng,
+        activity.end_lat,
+        activity.end_lng,
+    )
+
+
+def is_same_route(activity: Activity, other: Activity) -> bool:
+    if not (_has_route(activity) and _has_route(other)):
+        return False
+    if not activity.distance or not other.distance:
+        return False
+    # relative to the longer of the two, so that the check is symmetric
+    if abs(activity.distance - other.distance) > (
+        ROUTE_DISTANCE_TOLERANCE * max(activity.distance, other.distance)
+    ):
+        return False
+    return (
+        _distance_meters(
+            activity.start_lat, activity.start_lng, other.start_lat, other.start_lng
+        )
+        <= ROUTE_RADIUS_METERS
+        and _distance_meters(
+            activity.end_lat, activity.end_lng, other.end_lat, other.end_lng
+        )
+        <= ROUTE_RADIUS_METERS
+    )
+
+
+def _is_own_name(activity: Activity) -> bool:
+    """Whether the athlete named the activity, rather than Strava or NeuralTag."""
+    if not activity.name or re.search(BASE_STRAVA_NAME_REGEX, activity.name):
+        return False
+    return NEURALTAG_SIGNATURE not in str(activity.description or "")
+
+
+def _percentile(value: float | None, values: list[float]) -> float | None:
+    """Share of `values` below `value`."""
+    if value is None or len(values) < MIN_HISTORY:
+        return None
+    return sum(v < value for v in values) / len(values)
+
+
+def _sport_label(sport_type: str | None) -> str:
+    # e.g. "TrailRun" -> "Trail Run"
+    return re.sub(r"(?<=[a-z])(?=[A-Z])", " ", sport_type or "Workout")
+
+
+def _format_distance(meters: float) -> str:
+    km = meters / 1000
+    return f"{km:.1f} km" if km < 10 else f"{km:.0f} km"
+
+
+def suggest_provisional_name(
+    activity: Activity, history: list[Activity]
+) -> NameSuggestion:
+    """Name an activity from the athlete's other activities, without an LLM."""
+    same_sport = [
+        other
+        for other in history
+        if other.sport_type == activity.sport_type
+        and other.activity_id != activity.activity_id
+    ]
+    sport = _sport_label(activity.sport_type)
+    notes = []
+
+    route = [other for other in same_sport if is_same_route(activity, other)]
+    route_names = collections.Counter(
+        other.name for other in route if _is_own_name(other)
+    )
+    if route:
+        notes.append(f"route done {len(route)} times before")
+
+    if route_names and route_names.most_common(1)[0][1] >= ROUTE_NAME_MIN_USES:
+        name, uses = route_names.most_common(1)[0]
+        notes.append(f"named `{name}` {uses} times")
+    else:
+        words = []
+        weekday = activity.start_date_local.strftime("%A")
+        weekday_count = sum(
+            other.start_date_local.strftime("%A") == weekday for other in same_sport
+        )
+        if (
+            len(same_sport) >= MIN_HISTORY
+            and weekday_count >= WEEKDAY_HABIT_SHARE * len(same_sport)
+        ):
+            words.append(weekday)
+            notes.append(f"{weekday_count} of {len(same_sport)} on a {weekday}")
+
+        distance_percentile = _percentile(
+            activity.distance, [other.distance or 0 for other in same_sport]
+        )
+        if distance_percentile is not None:
+            notes.append(f"longer than {distance_percentile:.0%}")
+            if distance_percentile >= LONG_PERCENTILE:
+                words.append("Long")
+            elif distance_percentile <= SHORT_PERCENTILE:
+                words.append("Short")
+
+        climb_percentile = None
+        if activity.distance:
+            climb_percentile = _percentile(
+                (activity.total_elevation_gain or 0) / activity.distance,
+                [
+                    (other.total_elevation_gain or 0) / other.distance
+                    for other in same_sport
+                    if other.distance
+                ],
+            )
+        if climb_percentile is not None:
+            notes.append(f"hillier than {climb_percentile:.0%}")
+            if climb_percentile >= HILLY_PERCENTILE:
+                words.append("Hilly")
+
+        name = " ".join(words + [sport])
+        if activity.distance and not activity.trainer:
+            name = f"{name} · {_format_distance(activity.distance)}"
+
+    description = f"Provisional name from the last {HISTORY_DAYS} days of {sport}"
+    if notes:
+        description += ": " + ", ".join(notes)
+    return NameSuggestion(
+        activity_id=activity.activity_id,
+        name=name,
+        description=description,
+        # ranks below every suggestion of the naming agent
+        probability=0.0,
+    )
+
+
+def publish_provisional_name(settings: Settings, context: PipelineContext):
+    if context.published_name is not None:
+        # a streamed name of the agent is already up
+        return
+    activity = context.get_activity()
+    last_rename = context.db.get_last_rename(activity_id=activity.activity_id)
+    if last_rename is not None and last_rename.new_name == activity.name:
+        # the activity still has a name we published, e.g. the provisional
+        # name of an earlier attempt of a retried job
+        naming_counters.incr("already_named")
+        return
+    before = activity.start_date_local + datetime.timedelta(days=1)
+    history = context.db.get_activities_by_date_range(
+        athlete_id=activity.athlete_id,
+        before=before,
+        after=before - datetime.timedelta(days=HISTORY_DAYS),
+    )
+    name_suggestion = suggest_provisional_name(activity, history)
+    context.db.add_name_suggestion(name_suggestion)
+
+    logger.info(
+        f"Publishing provisional name `{name_suggestion.name}` for activity {activity.activity_id}"
+    )
+    with stage_span("publish.provisional_name"):
+        publish_new_activity_name(
+            activity_id=activity.activity_id,
+            settings=settings,
+            context=context,
+            name_suggestion=name_suggestion,
+            provisional=True,
+        )
+    naming_counters.incr("published")
+
+
+def _run_name_activity_etl(started: threading.Event, **kwargs):
+    started.set()
+    with sampled_thread():
+        return run_name_activity_etl(**kwargs)
+
+
+def run_name_activity_etl_with_deadline(
+    settings: Settings,
+    context: PipelineContext,
+    deadline: float = NAMING_DEADLINE,
+    **kwargs,
+):
+    """`run_name_activity_etl`, publishing a provisional name if it misses the deadline.
+
+    Waits for the naming agent either way, so its suggestions can be
+    published after this returns. Errors of the agent are re-raised once the
+    provisional name is published. The deadline starts once the agent runs,
+    not while it waits for a free thread of `_naming_executor`.
+    """
+    started = threading.Event()
+    future = _naming_executor.submit(
+        contextvars.copy_context().run,
+        _run_name_activity_etl,
+        started,
+        settings=settings,
+        activity_id=context.activity_id,
+        context=context,
+        **kwargs,
+    )
+    started.wait()
+    try:
+        return future.result(timeout=deadline)
+    except concurrent.futures.TimeoutError:
+        naming_counters.incr("deadline_expired")
+        logger.warning(
+            f"Naming activity {context.activity_id} took longer than {deadline:g}s"
+        )
+        _publish_provisional_name_safely(settings=settings, context=context)
+        return future.result()
+    except Exception:
+        naming_counters.incr("agent_failed")
+        _publish_provisional_name_safely(settings=settings, context=context)
+        raise
+
+
+def _publish_provisional_name_safely(settings: Settings, context: PipelineContext):
+    # the agent's result (or error) matters more than the provisional name
+    try:
+        publish_provisional_name(settings=settings, context=context)
+    except Exception:
+        naming_counters.incr("failed")
+        logger.exception(
+            f"Could not publish a provisional name for activity {context.activity_id}"
+        )
@@ -1,11 +1,18 @@
+import html
 import logging
+from typing import TYPE_CHECKING
 
 
 from src.database.adapter import Database
+from src.database.models import NameSuggestion
 from src.app.config import Settings
 
-from src.tasks.strava import get_strava_client
-from src.tasks.telegram import TelegramBot
+from src.tasks.instrumentation import stage_span
+from src.tasks.pipeline_context import PipelineContext
+from src.tasks.telegram import get_telegram_notifier
+
+if TYPE_CHECKING:
+    from src.tasks.etl.naming_strategies.agent import NameResult
 
 NEURALTAG_SIGNATURE = "named with NeuralTag 🤖"
 
@@ -13,7 +20,7 @@ NEURALTAG_SIGNATURE = "named with NeuralTag 🤖"
 logger = logging.getLogger(__name__)
 
 PUBLISH_TELEGRAM_NOTIFICATION_TEMPLATE = """
-<b>Activity rename workflow completed</b>
+<b>{title}</b>
 
 <b>Activity ID:</b> {activity_id}
 <b>Athlete ID:</b> {athlete_id}
@@ -23,30 +30,98 @@ PUBLISH_TELEGRAM_NOTIFICATION_TEMPLATE = """
 <b>Probability:</b> {probability:.0f}%
 """.strip()
 
+# Names streamed from the naming agent with at least this probability are
+# published before the rest of the names have arrived
+EARLY_PUBLISH_MIN_PROBABILITY = 0.3
+
+
+def publish_new_activity_name(
+    activity_id: int,
+    settings: Settings,
+    context: PipelineContext | None = None,
+    name_suggestion: NameSuggestion | None = None,
+    provisional: bool = False,
+):
+    """Publish the most probable name suggestion, or `name_suggestion` if given.
+
+    A provisional name is published while the naming agent is still running;
+    the agent's name replaces it once it is done. Once a name of the agent
+    is published (possibly early, see `EarlyNamePublisher`) nothing else is
+    published with the same context, unless it is an early name that is not
+    among the agent's final suggestions.
+    """
+    if context is None:
+        db = Database(
+            settings.postgres_connection_string,
+            encryption_key=settings.encryption_key,
+        )
+        activity = db.get_activity_by_id(activity_id=activity_id)
+        context = PipelineContext(
+            settings=settings,
+            db=db,
+            athlete_id=activity.athlete_id,
+            activity_id=activity_id,
+            activity=activity,
+        )
 
-def publish_new_activity_name(activity_id: int, settings: Settings):
-    db = Database(
-        settings.postgres_connection_string,
-        encryption_key=settings.encryption_key,
-    )
-
-    # get details from database
-    activity = db.get_activity_by_id(activity_id=activity_id)
-    auth = db.get_auth_by_athlete_id(
-        athlete_id=activity.athlete_id,
-    )
-    name_suggestions = db.get_name_suggestions_by_activity_id(activity_id=activity_id)
-    athlete = db.get_user_by_athlete_id(
-        athlete_id=activity.athlete_id,
-    )
-
-    # get new name and description
-    name_suggestions = sorted(
-        name_suggestions, key=lambda x: x.probability, reverse=True
-    )
-    idx = 0
+    with context.publish_lock:
+        if context.published_name is not None:
+            if name_suggestion is not None or _is_suggested(
+                context.published_name, context
+            ):
+                logger.info(
+                    f"Activity {activity_id} was already renamed to `{context.published_name}`"
+                )
+                return
+            # the streamed output was invalid and the agent was asked again
+            logger.info(
+                f"Replacing streamed name `{context.published_name}` of activity {activity_id}, it is not among the agent's names"
+            )
+        new_name = _publish_name(
+            settings=settings,
+            context=context,
+            name_suggestion=name_suggestion,
+            provisional=provisional,
+        )
+        if not provisional:
+            context.published_name = new_name
+
+
+def _is_suggested(name: str, context: PipelineContext) -> bool:
+    if context.name_suggestions is None:
+        # not named with this context, nothing to compare with
+        return True
+    return any(suggestion.name == name for suggestion in context.name_suggestions)
+
+
+def _publish_name(
+    settings: Settings,
+    context: PipelineContext,
+    name_suggestion: NameSuggestion | None,
+    provisional: bool,
+) -> str:
+    activity_id = context.activity_id
+    db = context.db
+
+    # get details from the earlier pipeline stages, or the database
+    activity = context.get_activity()
+    athlete = context.get_user()
+
+    selected_name_suggestion = name_suggestion
+    if selected_name_suggestion is None:
+        name_suggestions = context.name_suggestions
+        if name_suggestions is None:
+            name_suggestions = db.get_name_suggestions_by_activity_id(
+                activity_id=activity_id
+            )
+
+        # get new name and description
+        name_suggestions = sorted(
+            name_suggestions, key=lambda x: x.probability, reverse=True
+        )
+        idx = 0
 
-    selected_name_suggestion = name_suggestions[idx]
+        selected_name_suggestion = name_suggestions[idx]
     new_name = selected_name_suggestion.name
     suggestion_description = selected_name_suggestion.description
 
@@ -62,45 +137,100 @@ def publish_new_activity_name(activity_id: int, settings: Settings):
     new_probability = selected_name_suggestion.probability
 
     # publish the new name to strava
-    client = get_strava_client(
-        access_token=auth.access_token,
-        refresh_token=auth.refresh_token,
-        expires_at=auth.expires_at,
-        strava_client_id=settings.strava_client_id,
-        strava_client_secret=settings.strava_client_secret,
+    client = context.get_client()
+    with stage_span("strava.update_activity"):
+        client.update_activity(
+            activity_id=activity_id,
+            name=new_name,
+            description=updated_activity_description,
+        )
+    logger.info(
+        f"Updated activity {activity.activity_id} for athlete {activity.athlete_id} with new name `{new_name}` and description `{updated_activity_description}`"
     )
-    client.update_activity(
+
+    # remember what we published so the resulting update webhook can be
+    # recognised, and keep the stored activity in sync without a refetch
+    db.add_rename_history(
+        old_name=activity.name, new_name=new_name, activity_id=activity_id
+    )
+    db.update_activity_name(
         activity_id=activity_id,
         name=new_name,
         description=updated_activity_description,
     )
-    logger.info(
-        f"Updated activity {activity.activity_id} for athlete {activity.athlete_id} with new name `{new_name}` and description `{updated_activity_description}`"
-    )
+    activity.name = new_name
+    activity.description = updated_activity_description
 
-    # publish notification to telegram
+    # publish notification to telegram; the message is HTML, names and the
+    # LLM's description may contain <, > and &
     telegram_message = PUBLISH_TELEGRAM_NOTIFICATION_TEMPLATE.format(
+        title=(
+            "Provisional activity name published"
+            if provisional
+            else "Activity rename workflow completed"
+        ),
         activity_id=activity.activity_id,
         athlete_id=activity.athlete_id,
-        athlete_name=athlete.name,
-        athlete_lastname=athlete.lastname,
-        name=new_name,
-        description=suggestion_description,
+        athlete_name=html.escape(str(athlete.name)),
+        athlete_lastname=html.escape(str(athlete.lastname)),
+        name=html.escape(new_name),
+        description=html.escape(str(suggestion_description)),
         probability=new_probability * 100,
     )
-
-    tb = TelegramBot(
-        token=settings.telegram_bot_token,
-        chat_id=settings.telegram_chat_id,
-        parse_mode="HTML",
-    )
-    try:
-        tb.send_message(
-            message=telegram_message,
+    # sent in the background, renames in quick succession as one message
+    get_telegram_notifier(
+        token=settings.telegram_bot_token, chat_id=settings.telegram_chat_id
+    ).notify(telegram_message, digest_key="Activity renames")
+    return new_name
+
+
+class EarlyNamePublisher:
+    """Publishes the first confident name while the naming agent streams the rest.
+
+    Pass as `on_name_result` to `run_name_activity_etl`; the suggestions
+    are saved as usual once the agent is done. If the streamed output turns
+    out invalid, `publish_new_activity_name` replaces the name with one of
+    the suggestions of the agent's second attempt.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        context: PipelineContext,
+        min_probability: float = EARLY_PUBLISH_MIN_PROBABILITY,
+    ):
+        self.settings = settings
+        self.context = context
+        self.min_probability = min_probability
+        self.published = False
+
+    def __call__(self, name_result: "NameResult"):
+        if self.published or name_result.probability < self.min_probability:
+            return
+        self.published = True
+
+        name_suggestion = NameSuggestion(
+            activity_id=self.context.activity_id,
+            name=name_result.name,
+            description=name_result.description,
+            probability=name_result.probability,
+        )
+        logger.info(
+            f"Publishing streamed name `{name_result.name}` for activity {self.context.activity_id}"
         )
-        print()
-    except Exception as e:
-        logger.error(f"Failed to send telegram message: {e}")
+        # the complete suggestions are published if this fails
+        try:
+            with stage_span("publish.early_name"):
+                publish_new_activity_name(
+                    activity_id=self.context.activity_id,
+                    settings=self.settings,
+                    context=self.context,
+                    name_suggestion=name_suggestion,
+                )
+        except Exception:
+            logger.exception(
+                f"Could not publish streamed name for activity {self.context.activity_id}"
+            )
 
 
 if __name__ == "__main__":
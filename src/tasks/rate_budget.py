@@ -0,0 +1,144 @@
+"""Process-wide scheduling of the Strava API rate limit budget.
+
+Strava enforces app-wide limits per 15 minutes and per day and reports the
+current usage in the response headers of every request. All pooled Strava
+clients report to `rate_budget`, which tracks that usage and throttles
+backfill requests so that a share of the budget always stays available for
+live webhook work. Live requests are never delayed.
+"""
+
+import contextlib
+import contextvars
+import datetime
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Literal
+
+from src.metrics_registry import Counters
+
+# stravalib takes about a second to import; it is imported where it is used
+if TYPE_CHECKING:
+    from stravalib.util.limiter import RequestRate
+
+logger = logging.getLogger(__name__)
+
+Priority = Literal["live", "backfill"]
+
+# Share of the 15 minute and daily limits that backfills may not use
+LIVE_RESERVE_FRACTION = 0.3
+
+# Waiting backfills re-check the budget at least this often (seconds)
+MAX_BACKFILL_SLEEP = 60
+
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "strava_request_priority", default="live"
+)
+
+
+@contextlib.contextmanager
+def strava_priority(priority: Priority):
+    """Run the Strava requests made in this context with the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+def _quarter_window(now: float) -> int:
+    return int(now // (15 * 60))
+
+
+def _day_window(now: float) -> datetime.date:
+    return datetime.datetime.fromtimestamp(now, tz=datetime.timezone.utc).date()
+
+
+class StravaRateBudget:
+    def __init__(self, live_reserve_fraction: float = LIVE_RESERVE_FRACTION):
+        self.live_reserve_fraction = live_reserve_fraction
+        self._lock = threading.Lock()
+        self._rates: "RequestRate | None" = None
+        self._updated_at: float | None = None
+        self.counters = Counters("strava_rate_budget")
+
+    def __call__(self, response_headers: dict[str, str], method: str):
+        """Rate limiter hook called by stravalib after every response."""
+        from stravalib.util.limiter import get_rates_from_response_headers
+
+        priority = current_priority()
+        self.counters.incr(f"{priority}_requests")
+
+        rates = get_rates_from_response_headers(response_headers, method)
+        if rates:
+            with self._lock:
+                self._rates = rates
+                self._updated_at = time.time()
+
+        if priority == "backfill":
+            self.wait_for_backfill_capacity()
+
+    def _usage(self, now: float) -> tuple[int, int] | None:
+        """Current 15 minute and daily usage, accounting for window resets."""
+        if self._rates is None:
+            return None
+        short_usage = self._rates.short_usage
+        long_usage = self._rates.long_usage
+        if _quarter_window(now) != _quarter_window(self._updated_at):
+            short_usage = 0
+        if _day_window(now) != _day_window(self._updated_at):
+            short_usage = long_usage = 0
+        return short_usage, long_usage
+
+    def backfill_wait_seconds(self) -> float:
+        """Seconds a backfill request has to wait to stay out of the live reserve."""
+        from stravalib.util.limiter import (
+            get_seconds_until_next_day,
+            get_seconds_until_next_quarter,
+        )
+
+        with self._lock:
+            usage = self._usage(time.time())
+            if usage is None:
+                return 0
+            short_usage, long_usage = usage
+            share = 1 - self.live_reserve_fraction
+            if long_usage >= self._rates.long_limit * share:
+                return get_seconds_until_next_day()
+            if short_usage >= self._rates.short_limit * share:
+                return get_seconds_until_next_quarter()
+            return 0
+
+    def wait_for_backfill_capacity(self):
+        while (wait := self.backfill_wait_seconds()) > 0:
+            self.counters.incr("backfill_waits")
+            logger.info(
+                f"Strava backfill budget used up, waiting {wait:.0f}s | {self.remaining()}"
+            )
+            time.sleep(min(wait, MAX_BACKFILL_SLEEP))
+
+    def remaining(self) -> dict[str, int | None]:
+        """Remaining app-wide requests in the current 15 minute window and day."""
+        with self._lock:
+            usage = self._usage(time.time())
+            if usage is None:
+                return {
+                    "short_remaining": None,
+                    "long_remaining": None,
+                    "short_limit": None,
+                    "long_limit": None,
+                }
+            short_usage, long_usage = usage
+            return {
+                "short_remaining": self._rates.short_limit - short_usage,
+                "long_remaining": self._rates.long_limit - long_usage,
+                "short_limit": self._rates.short_limit,
+                "long_limit": self._rates.long_limit,
+            }
+
+
+rate_budget = StravaRateBudget()
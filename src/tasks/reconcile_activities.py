@@ -0,0 +1,45 @@
+"""Periodic reconciliation of every athlete's recent activities with Strava.
+
+Also resumes the onboardings that died with the app or failed. Run from a
+timer, e.g. `make reconcile` from cron.
+"""
+
+import logging
+
+from dotenv import load_dotenv
+
+from src.app.config import settings
+from src.database.adapter import Database
+from src.tasks.etl import ActivityReconciliationETL
+from src.tasks.onboarding import resume_unfinished_onboardings
+from src.tasks.rate_budget import strava_priority
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+
+def reconcile_all_athletes():
+    db = Database(
+        connection_string=settings.postgres_connection_string,
+        encryption_key=settings.encryption_key,
+    )
+    auth_uuids = db.get_auth_uuids()
+    logger.info(f"Reconciling activities of {len(auth_uuids)} athletes")
+
+    # reconciliation yields the rate limit budget to live webhook processing
+    with strava_priority("backfill"):
+        for auth_uuid in auth_uuids:
+            try:
+                ActivityReconciliationETL(settings=settings, auth_uuid=auth_uuid).run()
+            except Exception:
+                logger.exception(
+                    f"Error reconciling activities | auth_uuid: {auth_uuid}"
+                )
+
+        resume_unfinished_onboardings(settings=settings, db=db)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    reconcile_all_athletes()
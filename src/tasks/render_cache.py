@@ -0,0 +1,57 @@
+"""Reuse of rendered activity stream plots.
+
+Rendering the streams PNG is the most expensive part of `SingleActivityETL`.
+The rendered image is stored on the activity (`stream_data`) together with a
+key of the render config it was rendered with (`stream_data_hash`). Streams
+don't change when an activity is updated, so the webhook pipeline planner
+keeps the stored plot (and skips the streams request and the render) as long
+as it was rendered with the current render config, see `is_current_render`.
+
+Kept plots are counted as hits and renders as misses of the `stream_render`
+cache on /metrics.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Callable
+
+import pandas as pd
+
+from src.metrics_registry import Counters
+from src.tasks.instrumentation import stage_span
+
+logger = logging.getLogger(__name__)
+
+render_counters = Counters("stream_render")
+
+
+def render_config_key(render_config: dict) -> str:
+    digest = hashlib.sha256(
+        json.dumps(render_config, sort_keys=True, default=str).encode()
+    )
+    return digest.hexdigest()[:16]
+
+
+def is_current_render(stream_data_hash: str | None, render_config: dict) -> bool:
+    """Whether a stored plot was rendered with `render_config`."""
+    if not stream_data_hash:
+        return False
+    # plots stored before only the config key was kept have "<key>:<digest>"
+    return stream_data_hash.split(":", 1)[0] == render_config_key(render_config)
+
+
+def record_kept_plot():
+    """Count a stored plot the planner keeps instead of rendering it again."""
+    render_counters.incr("hits")
+
+
+def render_stream_plot(
+    streams_df: pd.DataFrame,
+    render_config: dict,
+    render: Callable[[pd.DataFrame], bytes | None],
+) -> tuple[bytes | None, str]:
+    """Render the stream plot of an activity and return it with its config key."""
+    render_counters.incr("misses")
+    with stage_span("render.stream_plot"):
+        return render(streams_df), render_config_key(render_config)
@@ -1,25 +1,198 @@
 """Module for interacting with the Strava API."""
 
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import requests
+from requests.adapters import HTTPAdapter
 from stravalib import Client
 
+from src.app.config import Settings
+from src.database.adapter import Database
+from src.database.models import Auth
+from src.metrics_registry import Counters
+from src.tasks.instrumentation import stage_span
+from src.tasks.profiling import sampled_thread
+from src.tasks.rate_budget import rate_budget
+
+logger = logging.getLogger(__name__)
+
+# Access tokens expiring within this many seconds are refreshed before use
+TOKEN_REFRESH_MARGIN_SECONDS = 5 * 60
+
+token_counters = Counters("strava_tokens")
+
+# Shared by all webhook jobs; the requests of one job are independent reads
+# that only wait on the network.
+_fetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="strava-fetch")
+
+
+class StravaTokenManager:
+    """Hands out access tokens, refreshing them only when they are about to expire.
+
+    Refreshed tokens are saved through `Database.add_auth`. Refreshes are
+    single-flight per athlete: concurrent jobs for the same athlete wait for
+    the first refresh and then pick up the saved tokens.
+    """
+
+    _locks: dict[str, threading.Lock] = {}
+    _locks_lock = threading.Lock()
+
+    def __init__(
+        self,
+        db: Database,
+        strava_client_id: int,
+        strava_client_secret: str,
+        margin_seconds: int = TOKEN_REFRESH_MARGIN_SECONDS,
+    ):
+        self.db = db
+        self.strava_client_id = strava_client_id
+        self.strava_client_secret = strava_client_secret
+        self.margin_seconds = margin_seconds
+
+    def is_expiring(self, auth: Auth) -> bool:
+        return auth.expires_at is None or (
+            auth.expires_at - time.time() <= self.margin_seconds
+        )
+
+    def _lock_for(self, auth_uuid) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(str(auth_uuid), threading.Lock())
+
+    def ensure_fresh(self, auth: Auth) -> Auth:
+        """Return auth with an access token that is valid for at least the margin."""
+        if not self.is_expiring(auth):
+            token_counters.incr("reused")
+            return auth
+
+        with self._lock_for(auth.uuid):
+            # another job may have refreshed the tokens while we were waiting
+            current = self.db.get_auth(auth.uuid)
+            if not self.is_expiring(current):
+                token_counters.incr("reused")
+                return current
+
+            token_response = Client(
+                requests_session=client_pool.session
+            ).refresh_access_token(
+                client_id=self.strava_client_id,
+                client_secret=self.strava_client_secret,
+                refresh_token=current.refresh_token,
+            )
+            token_counters.incr("refreshed")
+            logger.info(f"Refreshed Strava access token for auth {current.uuid}")
+
+            refreshed = dict(
+                uuid=current.uuid,
+                access_token=token_response["access_token"],
+                refresh_token=token_response["refresh_token"],
+                expires_at=token_response["expires_at"],
+                scope=current.scope,
+            )
+            # add_auth encrypts the tokens of the instance it is given
+            self.db.add_auth(Auth(**refreshed))
+            return Auth(**refreshed)
+
+
+class StravaClientPool:
+    """Keeps one Strava client per athlete for the lifetime of the process.
+
+    All clients share a single keep-alive HTTP session, so requests reuse open
+    connections to the Strava API instead of paying a TLS handshake each.
+    """
+
+    def __init__(self, pool_maxsize: int = 16):
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session.mount("https://", self._adapter)
+
+        self._clients: dict[str, Client] = {}
+        self._lock = threading.Lock()
+        self.counters = Counters("strava_client_pool")
+
+    def get(self, auth: Auth, db: Database, settings: Settings) -> Client:
+        auth = StravaTokenManager(
+            db=db,
+            strava_client_id=settings.strava_client_id,
+            strava_client_secret=settings.strava_client_secret,
+        ).ensure_fresh(auth)
+
+        with self._lock:
+            client = self._clients.get(str(auth.uuid))
+            if client is None:
+                client = Client(
+                    access_token=auth.access_token,
+                    refresh_token=auth.refresh_token,
+                    token_expires=auth.expires_at,
+                    requests_session=self.session,
+                    rate_limiter=rate_budget,
+                )
+                self._clients[str(auth.uuid)] = client
+                self.counters.incr("clients_created")
+            else:
+                self.counters.incr("clients_reused")
+
+            if client.access_token != auth.access_token:
+                client.access_token = auth.access_token
+                client.refresh_token = auth.refresh_token
+                client.token_expires = auth.expires_at
+
+        return client
+
+    def connection_stats(self) -> dict[str, float]:
+        """Connections opened versus requests sent over the shared session."""
+        pools = self._adapter.poolmanager.pools
+        connections = requests_sent = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+
+        return {
+            "connections_opened": connections,
+            "requests": requests_sent,
+            "connection_reuse_ratio": (
+                1 - connections / requests_sent if requests_sent else 0.0
+            ),
+        }
+
+
+client_pool = StravaClientPool()
+
+
+def get_strava_client(auth: Auth, db: Database, settings: Settings) -> Client:
+    """Get the pooled Strava client for the athlete of the given (decrypted) auth."""
+    return client_pool.get(auth=auth, db=db, settings=settings)
+
+
+def _timed(stage: str, call: Callable[[], Any]) -> Callable[[], Any]:
+    def timed_call():
+        with stage_span(stage), sampled_thread():
+            return call()
+
+    return timed_call
+
+
+def fetch_concurrently(**calls: Callable[[], Any]) -> dict[str, Any]:
+    """Run independent Strava requests concurrently and return their results by name.
+
+    The requests should share one client so they reuse its HTTP session. Lazy
+    results such as `get_activity_laps` must be materialised inside the
+    callable, otherwise the request happens when the result is iterated.
+    """
+    calls = {name: _timed(f"strava.{name}", call) for name, call in calls.items()}
+    if len(calls) == 1:
+        ((name, call),) = calls.items()
+        return {name: call()}
 
-def get_strava_client(
-    access_token: str,
-    refresh_token: str,
-    expires_at: int,
-    strava_client_id: int,
-    strava_client_secret: str,
-) -> Client:
-    """Get a Strava client with the given credentials."""
-    client = Client(
-        access_token=access_token,
-        refresh_token=refresh_token,
-        token_expires=expires_at,
-    )
-    client.refresh_access_token(
-        client_id=strava_client_id,
-        client_secret=strava_client_secret,
-        refresh_token=refresh_token,
-    )
-
-    return client
+    futures = {
+        name: _fetch_executor.submit(contextvars.copy_context().run, call)
+        for name, call in calls.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
@@ -1,14 +1,250 @@
+"""Telegram notifications.
+
+`TelegramBot` sends one message. `TelegramNotifier` sends them from a
+background thread so that notifying never delays the pipeline: messages are
+put on a bounded queue, retried with backoff, and bursts of messages with the
+same digest key (e.g. a wave of new users) are sent as one digest message.
+"""
+
+import atexit
+import logging
+import queue
+import re
+import threading
+import time
+
 import requests
 
+from src.metrics_registry import Counters
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects longer messages
+MAX_MESSAGE_LENGTH = 4096
+
+SEND_MAX_ATTEMPTS = 4
+SEND_RETRY_BASE_DELAY = 1.0
+SEND_TIMEOUT = 10
+
+# Messages waiting to be sent; more are dropped
+NOTIFIER_QUEUE_SIZE = 1000
+
+# Seconds a message waits for others with the same digest key
+DIGEST_WINDOW = 5.0
+
+telegram_counters = Counters("telegram")
+
+# Tags, entities and single characters of a message in the HTML parse mode,
+# the places a line too long for one message can be cut at
+_HTML_TOKEN = re.compile(r"<[^>]*>|&#?\w+;|.", re.DOTALL)
+_HTML_TAG = re.compile(r"<(/?)([\w-]+)[^>]*>")
+
 
 class TelegramBot:
     def __init__(self, token: str, chat_id: str, parse_mode: str = "HTML"):
         self.token = token
         self.chat_id = chat_id
         self.parse_mode = parse_mode
+        self.session = requests.Session()
 
     def send_message(self, message: str):
-        url = f"https://api.telegram.org/bot{self.token}/sendMessage?chat_id={self.chat_id}&text={message}&parse_mode={self.parse_mode}"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
+        """Send a message, retrying rate limited and failed requests."""
+        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        payload = {
+            "chat_id": self.chat_id,
+            "text": message,
+            "parse_mode": self.parse_mode,
+        }
+        for attempt in range(1, SEND_MAX_ATTEMPTS + 1):
+            delay = SEND_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            try:
+                response = self.session.post(url, json=payload, timeout=SEND_TIMEOUT)
+            except requests.RequestException:
+                if attempt == SEND_MAX_ATTEMPTS:
+                    raise
+                time.sleep(delay)
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == SEND_MAX_ATTEMPTS:
+                    response.raise_for_status()
+                if response.status_code == 429:
+                    delay = max(delay, _retry_after(response))
+                time.sleep(delay)
+                continue
+
+            # other client errors (e.g. invalid HTML) fail the same way again
+            response.raise_for_status()
+            return response.json()
+
+
+def _retry_after(response: requests.Response) -> float:
+    """The wait Telegram asks for in a rate limited response."""
+    try:
+        return response.json().get("parameters", {}).get("retry_after") or 0
+    except ValueError:
+        return 0
+
+
+def split_message(message: str, limit: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """Split a message at line breaks into parts of at most `limit` characters."""
+    parts = []
+    current = ""
+    for line in message.splitlines(keepends=True):
+        if len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            *pieces, line = _split_line(line, limit)
+            parts.extend(pieces)
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return [part.strip("\n") for part in parts if part.strip()]
+
+
+def _split_line(line: str, limit: int) -> list[str]:
+    """Cut a line longer than `limit` between its tags and entities.
+
+    Tags open at a cut are closed at the end of the part and opened again at
+    the start of the next one, so that every part is valid HTML on its own.
+    """
+    pieces = []
+    current = ""
+    # (name, opening tag) of the tags open at the end of `current`
+    open_tags: list[tuple[str, str]] = []
+    for token in _HTML_TOKEN.findall(line):
+        next_open_tags = open_tags
+        if tag := _HTML_TAG.fullmatch(token):
+            closing, name = tag.groups()
+            if not closing:
+                next_open_tags = [*open_tags, (name, token)]
+            elif open_tags and open_tags[-1][0] == name:
+                next_open_tags = open_tags[:-1]
+
+        length = len(current) + len(token) + len(_closing_tags(next_open_tags))
+        if current and length > limit:
+            pieces.append(current + _closing_tags(open_tags))
+            current = "".join(opening for _, opening in open_tags)
+        current += token
+        open_tags = next_open_tags
+    pieces.append(current)
+    return pieces
+
+
+def _closing_tags(open_tags: list[tuple[str, str]]) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(open_tags))
+
+
+def digest_messages(digest_key: str, messages: list[str]) -> str:
+    if len(messages) == 1:
+        return messages[0]
+    return f"<b>{digest_key} ({len(messages)})</b>\n\n" + "\n\n".join(messages)
+
+
+class TelegramNotifier:
+    """Sends messages from a background thread.
+
+    Messages with a digest key are held for `DIGEST_WINDOW` seconds and sent
+    together with the other messages with the same key queued meanwhile.
+    """
+
+    def __init__(self, bot: TelegramBot, digest_window: float = DIGEST_WINDOW):
+        self.bot = bot
+        self.digest_window = digest_window
+        self._queue: queue.Queue = queue.Queue(maxsize=NOTIFIER_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def notify(self, message: str, digest_key: str | None = None):
+        """Queue a message; never blocks."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((digest_key, message))
+        except queue.Full:
+            telegram_counters.incr("dropped")
+            logger.warning("Telegram notification queue is full, dropping message")
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until all queued messages are sent, returning False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="telegram-notifier", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        # digest key -> (send at, messages)
+        pending: dict[str, tuple[float, list[str]]] = {}
+        while True:
+            timeout = None
+            if pending:
+                next_due = min(due for due, _ in pending.values())
+                timeout = max(next_due - time.monotonic(), 0)
+            try:
+                digest_key, message = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                if digest_key is None:
+                    self._send(message, count=1)
+                else:
+                    due, messages = pending.setdefault(
+                        digest_key, (time.monotonic() + self.digest_window, [])
+                    )
+                    messages.append(message)
+
+            now = time.monotonic()
+            for digest_key in [k for k, (due, _) in pending.items() if due <= now]:
+                _, messages = pending.pop(digest_key)
+                if len(messages) > 1:
+                    telegram_counters.incr("digested", len(messages))
+                self._send(digest_messages(digest_key, messages), count=len(messages))
+
+    def _send(self, message: str, count: int):
+        try:
+            for part in split_message(message):
+                self.bot.send_message(message=part)
+            telegram_counters.incr("sent", count)
+        except Exception:
+            telegram_counters.incr("failed", count)
+            logger.exception("Failed to send telegram message")
+        finally:
+            for _ in range(count):
+                self._queue.task_done()
+
+
+_notifiers: dict[tuple[str, str], TelegramNotifier] = {}
+_notifiers_lock = threading.Lock()
+
+
+def get_telegram_notifier(token: str, chat_id: str) -> TelegramNotifier:
+    """The process-wide notifier for a bot and chat."""
+    with _notifiers_lock:
+        notifier = _notifiers.get((token, chat_id))
+        if notifier is None:
+            notifier = TelegramNotifier(
+                TelegramBot(token=token, chat_id=chat_id, parse_mode="HTML")
+            )
+            _notifiers[(token, chat_id)] = notifier
+        return notifier
+
+
+@atexit.register
+def _flush_notifiers():
+    for notifier in list(_notifiers.values()):
+        notifier.flush(timeout=SEND_TIMEOUT)
@@ -0,0 +1,50 @@
+"""Coalescing and deduplication of queued webhook events.
+
+Strava often sends a create followed by several updates for the same
+activity within seconds, and redelivers events it did not see acknowledged in
+time. Events are queued with a short debounce; an event for an object that
+still has a pending job is merged into that job instead of queuing another
+pipeline run, and exact redeliveries are dropped.
+"""
+
+import datetime
+
+from src.app.schemas.webhook_post_request import WebhookPostRequest
+from src.database.models import UserType
+from src.metrics_registry import Counters
+from src.tasks.pipeline_plan import plan_activity_event
+
+# Queued events wait this long for more events of the same object
+WEBHOOK_DEBOUNCE = datetime.timedelta(seconds=5)
+
+# An object receiving a steady stream of events is processed at least this
+# long after its first event
+WEBHOOK_MAX_DEBOUNCE = datetime.timedelta(seconds=60)
+
+coalescing_counters = Counters("webhook_coalescing")
+
+
+def record_enqueue(outcome: str, content: WebhookPostRequest):
+    """Count the queue outcome of an event and the work a dropped run saved.
+
+    The saving is estimated with the pipeline planner, assuming the activity
+    is already stored with its streams by the time the event would have run
+    and, to keep the webhook response free of lookups, that the athlete is a
+    NeuralTag user. The LLM runs saved are therefore an upper bound.
+    """
+    coalescing_counters.incr("events")
+    if outcome == "queued":
+        return
+    coalescing_counters.incr(outcome)
+
+    if content.object_type != "activity" or content.aspect_type == "delete":
+        return
+    plan = plan_activity_event(
+        content=content,
+        user_type=UserType.NEURALTAG.value,
+        has_activity=True,
+        has_current_plot=True,
+        last_rename=None,
+    )
+    coalescing_counters.incr("saved_strava_calls", plan.strava_calls)
+    coalescing_counters.incr("saved_llm_runs", int(plan.name))
@@ -0,0 +1,255 @@
+"""Workers processing the queued Strava webhook events.
+
+Webhook events are stored in the `webhook_job` table and processed here, so
+they survive restarts and bursts are worked off at a controlled rate. Jobs of
+one athlete run one at a time, jobs of different athletes in parallel.
+Failed jobs are retried with exponential backoff.
+
+A worker refreshes the lock of the job it runs every `HEARTBEAT_INTERVAL`;
+a job whose lock is older than `JOB_LOCK_TIMEOUT` belonged to a worker that
+died and is claimed again. Every worker has a stable id (`WEBHOOK_WORKER_ID`,
+by default the host name) and requeues the jobs it left running when it
+starts again.
+
+The app runs `WEBHOOK_WORKER_THREADS` workers in-process; more can be run
+separately with `make worker`.
+"""
+
+import argparse
+import datetime
+import logging
+import contextlib
+import os
+import signal
+import socket
+import threading
+import traceback
+
+import logfire
+from dotenv import load_dotenv
+
+from src.app.config import Settings
+from src.app.schemas.webhook_post_request import WebhookPostRequest
+from src.database.adapter import Database
+from src.database.models import WebhookJob
+from src.metrics_registry import Counters
+from src.tasks.post_event import process_post_request
+from src.tasks.profiling import maybe_profile
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# Worker threads started by the app itself
+WEBHOOK_WORKER_THREADS = int(os.environ.get("WEBHOOK_WORKER_THREADS", "2"))
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = datetime.timedelta(seconds=30)
+
+# Running jobs whose lock wasn't refreshed for this long are reclaimed (their
+# worker died)
+JOB_LOCK_TIMEOUT = datetime.timedelta(minutes=5)
+
+# Seconds between refreshes of the lock of a running job
+HEARTBEAT_INTERVAL = 30.0
+
+# Prefix of the worker ids; must differ between processes on the same host
+WORKER_ID = os.environ.get("WEBHOOK_WORKER_ID", socket.gethostname())
+
+# Seconds an idle worker waits before looking for jobs again
+POLL_INTERVAL = 1.0
+
+# Processed jobs are kept this long
+DONE_JOB_RETENTION = datetime.timedelta(days=7)
+
+worker_counters = Counters("webhook_worker")
+
+
+def retry_delay(attempts: int) -> datetime.timedelta:
+    return RETRY_BASE_DELAY * 2 ** (attempts - 1)
+
+
+class WebhookWorker:
+    def __init__(self, settings: Settings, stop: threading.Event, worker_id: str):
+        self.settings = settings
+        self.stop = stop
+        self.worker_id = worker_id
+        self.db = Database(
+            connection_string=settings.postgres_connection_string,
+            encryption_key=settings.encryption_key,
+        )
+
+    def run_once(self) -> bool:
+        """Process the next due job, returning False when there was none."""
+        job = self.db.claim_webhook_job(
+            lock_timeout=JOB_LOCK_TIMEOUT, worker_id=self.worker_id
+        )
+        if job is None:
+            return False
+
+        worker_counters.incr("claimed")
+        try:
+            with self.heartbeat(job):
+                self.process(job)
+        except Exception:
+            self.fail(job, error=traceback.format_exc())
+        else:
+            self.db.complete_webhook_job(job.uuid)
+            worker_counters.incr("done")
+        return True
+
+    def process(self, job: WebhookJob):
+        logger.info(
+            f"Processing webhook job {job.uuid} (attempt {job.attempts}) | athlete: {job.owner_id}"
+        )
+        content = WebhookPostRequest(**job.payload)
+        with maybe_profile(
+            db=self.db,
+            athlete_id=job.owner_id,
+            name=f"athlete-{job.owner_id}-job-{job.uuid}",
+        ):
+            process_post_request(content, settings=self.settings)
+
+    @contextlib.contextmanager
+    def heartbeat(self, job: WebhookJob):
+        """Refresh the lock of `job` in the background while it runs."""
+        done = threading.Event()
+
+        def refresh():
+            while not done.wait(HEARTBEAT_INTERVAL):
+                try:
+                    if not self.db.heartbeat_webhook_job(job.uuid, self.worker_id):
+                        worker_counters.incr("lock_lost")
+                        logger.warning(f"Lost the lock of webhook job {job.uuid}")
+                        return
+                except Exception:
+                    logger.exception(
+                        f"Could not refresh the lock of webhook job {job.uuid}"
+                    )
+
+        thread = threading.Thread(
+            target=refresh,
+            name=f"{threading.current_thread().name}-heartbeat",
+            daemon=True,
+        )
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def release_own_jobs(self):
+        """Requeue the jobs this worker was running when its process stopped."""
+        released = self.db.release_webhook_jobs(self.worker_id)
+        if released:
+            worker_counters.incr("released", released)
+            logger.info(
+                f"Requeued {released} webhook jobs left running by {self.worker_id}"
+            )
+
+    def fail(self, job: WebhookJob, error: str):
+        if job.attempts >= MAX_ATTEMPTS:
+            logger.error(
+                f"Webhook job {job.uuid} failed {job.attempts} times, giving up:\n{error}"
+            )
+            self.db.fail_webhook_job(job.uuid, error=error, retry_at=None)
+            worker_counters.incr("failed")
+            return
+
+        retry_at = datetime.datetime.now() + retry_delay(job.attempts)
+        logger.warning(
+            f"Webhook job {job.uuid} failed, retrying at {retry_at:%H:%M:%S}:\n{error}"
+        )
+        self.db.fail_webhook_job(job.uuid, error=error, retry_at=retry_at)
+        worker_counters.incr("retried")
+
+    def run(self):
+        try:
+            self.release_own_jobs()
+        except Exception:
+            logger.exception(f"Could not requeue the jobs of {self.worker_id}")
+        while not self.stop.is_set():
+            try:
+                if not self.run_once():
+                    self.stop.wait(POLL_INTERVAL)
+            except Exception:
+                # e.g. the database is unreachable; keep the worker alive
+                logger.exception("Error in webhook worker")
+                self.stop.wait(POLL_INTERVAL)
+
+
+def purge_done_jobs(settings: Settings, stop: threading.Event):
+    db = Database(
+        connection_string=settings.postgres_connection_string,
+        encryption_key=settings.encryption_key,
+    )
+    while not stop.is_set():
+        try:
+            deleted = db.delete_done_webhook_jobs(
+                before=datetime.datetime.now() - DONE_JOB_RETENTION
+            )
+            if deleted:
+                logger.info(f"Deleted {deleted} processed webhook jobs")
+        except Exception:
+            logger.exception("Error deleting processed webhook jobs")
+        stop.wait(60 * 60)
+
+
+def start_workers(
+    settings: Settings, threads: int, stop: threading.Event, role: str = "app"
+) -> list[threading.Thread]:
+    """Start the workers, with ids `<WORKER_ID>/<role>-<idx>`."""
+    workers = [
+        threading.Thread(
+            target=WebhookWorker(
+                settings=settings, stop=stop, worker_id=f"{WORKER_ID}/{role}-{idx}"
+            ).run,
+            name=f"webhook-worker-{idx}",
+            daemon=True,
+        )
+        for idx in range(threads)
+    ]
+    workers.append(
+        threading.Thread(
+            target=purge_done_jobs,
+            args=(settings, stop),
+            name="webhook-job-purge",
+            daemon=True,
+        )
+    )
+    for worker in workers:
+        worker.start()
+    logger.info(f"Started {threads} webhook workers")
+    return workers
+
+
+def main():
+    from src.app.config import settings
+
+    parser = argparse.ArgumentParser(description="Process queued webhook events")
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # the app configures logfire itself, standalone workers send their spans too
+    logfire.configure()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    workers = start_workers(
+        settings=settings, threads=args.threads, stop=stop, role="worker"
+    )
+    stop.wait()
+    logger.info("Stopping webhook workers")
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
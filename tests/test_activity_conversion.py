@@ -0,0 +1,104 @@
+import datetime
+import math
+
+import numpy as np
+import polyline
+import pytest
+from stravalib.model import SummaryActivity
+
+from src.tasks.data import (
+    decode_polylines,
+    summary_activities_to_columns,
+    summary_activity_to_activity_model,
+)
+
+# (lat, lng) outlines of activity routes
+LOOP = [
+    (51.50070, -0.12460),
+    (51.50310, -0.12180),
+    (51.50560, -0.12510),
+    (51.50480, -0.13020),
+    (51.50190, -0.13110),
+    (51.49980, -0.12870),
+]
+ROUTE = [
+    (-33.91920, 18.42330),
+    (-33.92170, 18.41850),
+    (-33.92640, 18.41210),
+    (-33.93120, 18.40740),
+    (-33.92880, 18.40110),
+    (-33.92210, 18.39860),
+    (-33.91540, 18.40390),
+    (-33.91610, 18.41560),
+]
+
+POLYLINES = {
+    "empty": "",
+    "one point": polyline.encode(LOOP[:1]),
+    "two points": polyline.encode(LOOP[:2]),
+    "out and back": polyline.encode([LOOP[0], LOOP[1], LOOP[2], LOOP[1], LOOP[0]]),
+    "straight line": polyline.encode([(51.5, -0.1), (51.501, -0.1), (51.502, -0.1)]),
+    "same point": polyline.encode([LOOP[0]] * 4),
+    "closed loop": polyline.encode(LOOP + LOOP[:1]),
+    "open loop": polyline.encode(LOOP),
+    "route": polyline.encode(ROUTE),
+    "self-crossing": polyline.encode([(0, 0), (0.01, 0.01), (0.01, 0), (0, 0.01)]),
+    "google example": "_p~iF~ps|U_ulLnnqC_mqNvxq`@",
+}
+
+MAP_COLUMNS = ["map_centroid_lat", "map_centroid_lon", "map_area"]
+
+
+def summary_activity(activity_id: int, summary_polyline: str) -> SummaryActivity:
+    start = datetime.datetime(2025, 6, 1, 7, 30)
+    return SummaryActivity(
+        id=activity_id,
+        name="Morning Run",
+        sport_type="Run",
+        type="Run",
+        distance=5000.0,
+        moving_time=1500,
+        elapsed_time=1600,
+        start_date=start,
+        start_date_local=start,
+        athlete={"id": 7},
+        map={"summary_polyline": summary_polyline},
+    )
+
+
+def test_decode_polylines_matches_polyline():
+    encoded = list(POLYLINES.values())
+    points, offsets = decode_polylines(encoded)
+
+    assert len(offsets) == len(encoded) + 1
+    for idx, summary_polyline in enumerate(encoded):
+        expected = np.array(polyline.decode(summary_polyline)).reshape(-1, 2)
+        np.testing.assert_allclose(points[offsets[idx] : offsets[idx + 1]], expected)
+
+
+def test_decode_polylines_without_points():
+    points, offsets = decode_polylines(["", ""])
+    assert points.shape == (0, 2)
+    assert offsets.tolist() == [0, 0, 0]
+
+
+@pytest.mark.parametrize("name", POLYLINES)
+def test_batch_conversion_matches_single_activity(name):
+    summary_activities = [
+        summary_activity(idx, summary_polyline)
+        for idx, summary_polyline in enumerate(POLYLINES.values())
+    ]
+    # each polyline once on its own and once between the others
+    idx = list(POLYLINES).index(name)
+    for batch in (summary_activities[idx : idx + 1], summary_activities):
+        columns = summary_activities_to_columns(batch)
+        position = columns["activity_id"].index(idx)
+        expected = summary_activity_to_activity_model(summary_activities[idx])
+        for column in MAP_COLUMNS:
+            value = columns[column][position]
+            expected_value = getattr(expected, column)
+            if expected_value is None or math.isnan(expected_value):
+                assert value is None, column
+            else:
+                assert value == pytest.approx(expected_value, rel=1e-9, abs=1e-12)
+        assert columns["map_summary_polyline"][position] == expected.map_summary_polyline
@@ -0,0 +1,130 @@
+import datetime
+
+from src.database.models import ActivitySyncCheckpoint
+from src.tasks.etl.historic_activities_etl import (
+    SYNC_WATERMARK_OVERLAP,
+    has_sync_gap,
+    is_window_synced,
+    paced,
+    stored_window,
+    sync_windows,
+)
+from src.tasks.rate_budget import rate_budget, strava_priority
+
+DAY = datetime.timedelta(days=1)
+NOW = datetime.datetime(2025, 9, 1, 12, 0)
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def checkpoint(after: datetime.datetime, before: datetime.datetime):
+    return ActivitySyncCheckpoint(window_after=after, window_before=before)
+
+
+def synced(after: datetime.datetime, before: datetime.datetime, window_days=90):
+    return [checkpoint(*window) for window in sync_windows(after, before, window_days)]
+
+
+def test_sync_windows_are_epoch_aligned_and_clipped():
+    windows = sync_windows(NOW - 200 * DAY, NOW, 90)
+
+    assert windows[0][0] == NOW - 200 * DAY
+    assert windows[-1][1] == NOW
+    for (_, before), (after, _) in zip(windows, windows[1:]):
+        assert before == after
+        assert (after - EPOCH) % (90 * DAY) == datetime.timedelta(0)
+
+
+def test_sync_windows_line_up_between_runs():
+    first = sync_windows(NOW - 365 * DAY, NOW, 90)
+    later = sync_windows(NOW - 300 * DAY, NOW + 10 * DAY, 90)
+
+    # windows that are full in both runs are the same
+    full = [window for window in first[1:-1] if window[0] >= later[0][1]]
+    assert full and set(full) <= set(later)
+
+
+def test_window_synced_by_the_union_of_checkpoints():
+    window = (NOW - 10 * DAY, NOW)
+
+    assert is_window_synced(
+        window,
+        [checkpoint(NOW - 10 * DAY, NOW - 5 * DAY), checkpoint(NOW - 5 * DAY, NOW)],
+    )
+    assert is_window_synced(window, [checkpoint(NOW - 20 * DAY, NOW + DAY)])
+
+
+def test_window_with_a_hole_is_not_synced():
+    window = (NOW - 10 * DAY, NOW)
+
+    assert not is_window_synced(window, [])
+    assert not is_window_synced(
+        window,
+        [checkpoint(NOW - 10 * DAY, NOW - 6 * DAY), checkpoint(NOW - 5 * DAY, NOW)],
+    )
+    assert not is_window_synced(window, [checkpoint(NOW - 10 * DAY, NOW - DAY)])
+
+
+def test_no_gap_without_checkpoints():
+    assert not has_sync_gap([], NOW, 90)
+
+
+def test_complete_history_has_no_gap_after_newer_webhook_activities():
+    checkpoints = synced(NOW - 3 * 365 * DAY, NOW)
+
+    assert not has_sync_gap(checkpoints, NOW, 90)
+    # the watermark is a webhook activity stored after the sync
+    assert not has_sync_gap(checkpoints, NOW + 3 * DAY, 90)
+
+
+def test_unfinished_sync_has_a_gap():
+    checkpoints = synced(NOW - 3 * 365 * DAY, NOW)
+    del checkpoints[3]
+
+    assert has_sync_gap(checkpoints, NOW + 3 * DAY, 90)
+
+
+def test_stored_window_after_the_checkpoints():
+    checkpoints = synced(NOW - 365 * DAY, NOW)
+    newest = NOW + 100 * DAY
+
+    assert stored_window(checkpoints, NOW - 365 * DAY, newest, 90) == (
+        NOW,
+        newest - SYNC_WATERMARK_OVERLAP,
+    )
+
+
+def test_stored_window_of_athletes_synced_before_checkpoints():
+    oldest, newest = NOW - 3 * 365 * DAY, NOW
+
+    assert stored_window([], oldest, newest, 90) == (
+        oldest,
+        newest - SYNC_WATERMARK_OVERLAP,
+    )
+
+
+def test_no_stored_window_with_a_gap_or_without_activities():
+    checkpoints = synced(NOW - 365 * DAY, NOW)
+    del checkpoints[1]
+
+    assert stored_window(checkpoints, NOW - 365 * DAY, NOW + 100 * DAY, 90) is None
+    assert stored_window([], None, None, 90) is None
+
+
+def test_backfill_waits_for_capacity_before_every_page(monkeypatch):
+    events = []
+    monkeypatch.setattr(
+        rate_budget, "wait_for_backfill_capacity", lambda: events.append("wait")
+    )
+
+    def requested_pages():
+        for page in ([1, 2], [3]):
+            events.append("request")
+            yield page
+
+    with strava_priority("backfill"):
+        assert list(paced(requested_pages())) == [[1, 2], [3]]
+    assert events == ["wait", "request", "wait", "request", "wait"]
+
+    events.clear()
+    assert list(paced(requested_pages())) == [[1, 2], [3]]
+    assert events == ["request", "request"]
@@ -0,0 +1,59 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+# Seconds `import src.app.main` may take, the bulk of the app's restart time
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", "3.0"))
+
+# Only needed once a webhook or login is processed, imported on first use
+LAZY_MODULES = ["matplotlib", "pandas", "pydantic_ai", "shapely", "stravalib"]
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# the settings are read on import
+SETTINGS_ENV = {
+    "STRAVA_CLIENT_ID": "1",
+    "STRAVA_CLIENT_SECRET": "secret",
+    "STRAVA_VERIFY_TOKEN": "token",
+    "APPLICATION_URL": "http://localhost",
+    "POSTGRES_CONNECTION_STRING": "postgresql://localhost/neuraltag",
+    "GEMINI_API_KEY": "key",
+    "PUSHBULLET_API_KEY": "key",
+    "ENCRYPTION_KEY": "key",
+    "TELEGRAM_BOT_TOKEN": "token",
+    "TELEGRAM_CHAT_ID": "chat",
+    "LOGFIRE_TOKEN": "token",
+}
+
+
+def import_app(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env={**SETTINGS_ENV, **os.environ},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_app_import_time_within_budget():
+    result = import_app("import src.app.main")
+
+    # import time:  self [us] | cumulative | imported package
+    match = re.search(r"import time:\s+\d+ \|\s+(\d+) \| src\.app\.main$", result.stderr, re.M)
+    assert match, result.stderr[-2000:]
+    seconds = int(match.group(1)) / 1e6
+    assert seconds <= IMPORT_TIME_BUDGET, (
+        f"importing the app took {seconds:.2f}s, the budget is {IMPORT_TIME_BUDGET}s"
+    )
+
+
+def test_app_import_leaves_heavy_modules_lazy():
+    result = import_app(
+        "import sys, src.app.main; "
+        f"print([m for m in {LAZY_MODULES!r} if m in sys.modules])"
+    )
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,64 @@
+from stravalib.model import Lap
+
+from src.tasks.laps import summarize_laps
+
+
+def lap(distance: float, speed: float, elevation_gain: float = 0) -> Lap:
+    return Lap(
+        distance=distance,
+        average_speed=speed,
+        elapsed_time=round(distance / speed),
+        total_elevation_gain=elevation_gain,
+    )
+
+
+def test_steady_auto_lapped_run_is_uninformative():
+    speeds = [3.30, 3.34, 3.28, 3.36, 3.31, 3.33, 3.29, 3.35, 3.32, 3.30]
+    laps = [lap(1000, speed) for speed in speeds] + [lap(420, 3.4)]
+
+    assert summarize_laps(laps, "Run") is None
+
+
+def test_hilly_auto_lapped_run_is_not_intervals():
+    # up and down hill kilometres alternate, 20% apart
+    speeds = [3.4, 2.8, 3.3, 2.75, 3.35, 2.8, 3.4, 2.85]
+    laps = [lap(1000, speed, 40 if speed < 3 else 0) for speed in speeds]
+    laps.append(lap(560, 3.2))
+
+    assert summarize_laps(laps, "Run") is None
+
+
+def test_fartlek_auto_lapped_run_is_not_intervals():
+    # a big contrast, but fast kilometres don't take turns with easy ones
+    speeds = [2.8, 4.2, 4.1, 2.9, 2.85, 4.2, 2.8, 2.9]
+    laps = [lap(1000, speed) for speed in speeds] + [lap(300, 3.0)]
+
+    assert summarize_laps(laps, "Run") is None
+
+
+def test_manual_lap_interval_session():
+    laps = [lap(2000, 3.0)]
+    for _ in range(6):
+        laps += [lap(800, 4.7), lap(400, 2.5)]
+    laps.append(lap(1500, 2.9))
+
+    summary = summarize_laps(laps, "Run")
+
+    assert summary.startswith("Intervals: 6 x 800 m at 3:33 /km with 2:40 recoveries")
+    assert "Lap 2 (work): 800 m" in summary
+    assert "Lap 3 (easy): 400 m" in summary
+
+
+def test_equal_distance_repeats_are_intervals():
+    # 8 x 400 m with 400 m jogs
+    laps = []
+    for _ in range(8):
+        laps += [lap(400, 5.5), lap(400, 2.6)]
+
+    summary = summarize_laps(laps, "Run")
+
+    assert summary.startswith("Intervals: 8 x 400 m")
+
+
+def test_too_few_laps_are_uninformative():
+    assert summarize_laps([lap(5000, 3.0), lap(800, 4.5)], "Run") is None
@@ -0,0 +1,43 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.app.config import settings
+from src.app.dependencies import get_db
+from src.app.routes import metrics
+
+
+class QueueStats:
+    def get_webhook_queue_stats(self):
+        return {
+            "jobs": {"pending": 2},
+            "oldest_age_seconds": {"pending": 3.0},
+            "due_jobs": 1,
+            "max_due_lag_seconds": 0.5,
+        }
+
+
+def client() -> TestClient:
+    app = FastAPI()
+    app.include_router(metrics.router)
+    app.dependency_overrides[get_db] = QueueStats
+    return TestClient(app)
+
+
+def test_metrics_require_the_bearer_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+
+    assert client().get("/metrics").status_code == 401
+    wrong = {"Authorization": "Bearer other-token"}
+    assert client().get("/metrics", headers=wrong).status_code == 401
+
+    token = {"Authorization": "Bearer scrape-token"}
+    response = client().get("/metrics", headers=token)
+    assert response.status_code == 200
+    assert 'neuraltag_webhook_jobs{status="pending"} 2' in response.text
+
+
+def test_metrics_are_disabled_without_a_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", None)
+
+    response = client().get("/metrics", headers={"Authorization": "Bearer "})
+    assert response.status_code == 404
@@ -0,0 +1,137 @@
+import datetime
+
+from src.app.schemas.webhook_post_request import WebhookPostRequest
+from src.database.models import RenameHistory, UserType
+from src.tasks.pipeline_plan import (
+    RENAME_ECHO_WINDOW,
+    PipelinePlan,
+    is_rename_echo,
+    pipeline_counters,
+    plan_activity_event,
+    record_plan,
+)
+
+NOW = datetime.datetime(2025, 9, 1, 12, 0)
+NEURALTAG = UserType.NEURALTAG.value
+
+
+class StrategyV1:
+    stream_types: list[str] = []
+    uses_laps = False
+
+
+class StrategyV2:
+    stream_types = ["time", "velocity_smooth", "heartrate", "altitude", "cadence"]
+    uses_laps = True
+
+
+def event(aspect_type: str, updates: dict | None = None) -> WebhookPostRequest:
+    return WebhookPostRequest(
+        object_type="activity",
+        object_id=1,
+        aspect_type=aspect_type,
+        owner_id=7,
+        subscription_id=1,
+        event_time=100,
+        updates=updates or {},
+    )
+
+
+def renamed(minutes_ago: float, now: datetime.datetime = NOW) -> RenameHistory:
+    return RenameHistory(
+        activity_id=1,
+        old_name="Rename",
+        new_name="Morning Tempo",
+        created_at=now - datetime.timedelta(minutes=minutes_ago),
+    )
+
+
+def just_renamed() -> RenameHistory:
+    # the planner checks the echo window against the current time
+    return renamed(1, now=datetime.datetime.now())
+
+
+def plan(content: WebhookPostRequest, last_rename=None, **stored) -> PipelinePlan:
+    return plan_activity_event(
+        content=content,
+        user_type=stored.pop("user_type", NEURALTAG),
+        has_activity=stored.pop("has_activity", True),
+        has_current_plot=stored.pop("has_current_plot", True),
+        last_rename=last_rename,
+        **stored,
+    )
+
+
+def test_echo_of_our_rename_inside_the_window():
+    assert is_rename_echo({"title": "Morning Tempo"}, renamed(1), now=NOW)
+    assert is_rename_echo(
+        {"title": "Morning Tempo"},
+        renamed(RENAME_ECHO_WINDOW.total_seconds() / 60),
+        now=NOW,
+    )
+
+
+def test_title_update_outside_the_window_is_not_an_echo():
+    assert not is_rename_echo({"title": "Morning Tempo"}, renamed(16), now=NOW)
+    assert not is_rename_echo({"title": "Morning Tempo"}, None, now=NOW)
+    assert not is_rename_echo({"title": "Rename"}, renamed(1), now=NOW)
+
+
+def test_mixed_update_is_not_an_echo():
+    updates = {"title": "Morning Tempo", "type": "Run"}
+
+    assert not is_rename_echo(updates, renamed(1), now=NOW)
+
+
+def test_title_only_update_skips_the_pipeline():
+    echo = plan(
+        event("update", {"title": "Morning Tempo"}), last_rename=just_renamed()
+    )
+
+    assert echo == PipelinePlan(reason="echo of published rename")
+
+
+def test_mixed_update_refreshes_the_activity_without_naming():
+    update = plan(
+        event("update", {"title": "Morning Tempo", "type": "Run"}),
+        last_rename=just_renamed(),
+    )
+
+    assert update.fetch_activity
+    assert not update.fetch_streams
+    assert not update.name
+
+
+def test_rename_request_names_with_the_stored_plot():
+    rename = plan(event("update", {"title": "Rename"}))
+
+    assert rename.fetch_activity and rename.name
+    assert not rename.fetch_streams
+
+
+def test_create_fetches_streams_without_a_stored_plot():
+    create = plan(event("create"), has_activity=False, has_current_plot=False)
+
+    assert create.fetch_activity and create.fetch_streams and create.name
+
+
+def test_delete_runs_no_stages():
+    delete = plan(event("delete"))
+
+    assert delete == PipelinePlan(reason="delete")
+
+
+def test_skipped_work_is_counted_against_the_naming_strategy():
+    kept_plot = PipelinePlan(fetch_activity=True)
+    pipeline_counters.reset()
+
+    # v2 skips the laps and streams reads and the render
+    record_plan(kept_plot, naming_strategy=StrategyV2)
+    assert pipeline_counters.get("skipped_strava_calls") == 2
+    assert pipeline_counters.get("skipped_renders") == 1
+
+    # v1 never reads laps or streams, so keeping the plot skips nothing
+    record_plan(kept_plot, naming_strategy=StrategyV1)
+    assert pipeline_counters.get("skipped_strava_calls") == 2
+    assert pipeline_counters.get("skipped_renders") == 1
+    assert pipeline_counters.get("events") == 2
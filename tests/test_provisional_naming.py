@@ -0,0 +1,128 @@
+import datetime
+
+from src.database.models import Activity
+from src.tasks.provisional_naming import (
+    MIN_HISTORY,
+    is_same_route,
+    suggest_provisional_name,
+)
+
+# a Monday
+MONDAY = datetime.datetime(2025, 9, 1, 7, 30)
+DAY = datetime.timedelta(days=1)
+
+HOME = (-33.92, 18.42)
+PARK = (-33.95, 18.47)
+
+
+def activity(
+    activity_id: int,
+    start_date_local: datetime.datetime,
+    distance: float = 10_000,
+    total_elevation_gain: float = 50,
+    name: str = "Morning Run",
+    route: tuple | None = None,
+) -> Activity:
+    start, end = route or ((None, None), (None, None))
+    return Activity(
+        activity_id=activity_id,
+        name=name,
+        sport_type="Run",
+        start_date_local=start_date_local,
+        distance=distance,
+        total_elevation_gain=total_elevation_gain,
+        start_lat=start[0],
+        start_lng=start[1],
+        end_lat=end[0],
+        end_lng=end[1],
+    )
+
+
+def daily_history(count: int) -> list[Activity]:
+    # spread over the weekdays, so that no weekday is a habit, and around 10 km
+    return [
+        activity(100 + i, MONDAY - i * DAY, distance=8_000 + 500 * i)
+        for i in range(count)
+    ]
+
+
+def test_name_the_athlete_gives_a_route_is_reused():
+    loop = (HOME, HOME)
+    history = daily_history(8) + [
+        activity(1, MONDAY - 14 * DAY, name="Table Mountain Loop", route=loop),
+        activity(2, MONDAY - 21 * DAY, name="Table Mountain Loop", route=loop),
+    ]
+
+    suggestion = suggest_provisional_name(
+        activity(3, MONDAY + 3 * DAY, route=loop), history
+    )
+
+    assert suggestion.name == "Table Mountain Loop"
+
+
+def test_route_name_used_once_is_not_reused():
+    loop = (HOME, HOME)
+    history = daily_history(8) + [
+        activity(1, MONDAY - 14 * DAY, name="Table Mountain Loop", route=loop),
+        activity(2, MONDAY - 21 * DAY, route=loop),
+    ]
+
+    suggestion = suggest_provisional_name(
+        activity(3, MONDAY + 3 * DAY, route=loop), history
+    )
+
+    assert suggestion.name == "Run · 10 km"
+
+
+def test_weekday_habit_names_the_weekday():
+    sundays = [
+        activity(100 + i, MONDAY - (1 + 7 * i) * DAY, distance=8_000 + 500 * i)
+        for i in range(6)
+    ]
+
+    suggestion = suggest_provisional_name(activity(1, MONDAY + 6 * DAY), sundays)
+
+    assert suggestion.name == "Sunday Run · 10 km"
+
+
+def test_long_short_and_hilly_against_the_history():
+    history = [
+        activity(100 + i, MONDAY - i * DAY, distance=5_000 + 1_000 * i)
+        for i in range(10)
+    ]
+    thursday = MONDAY + 3 * DAY
+
+    long_climb = activity(1, thursday, distance=20_000, total_elevation_gain=400)
+    short = activity(2, thursday, distance=3_000, total_elevation_gain=0)
+
+    assert suggest_provisional_name(long_climb, history).name == (
+        "Long Hilly Run · 20 km"
+    )
+    assert suggest_provisional_name(short, history).name == "Short Run · 3.0 km"
+
+
+def test_too_little_history_earns_no_adjectives_or_weekday():
+    sundays = [
+        activity(100 + i, MONDAY - (1 + 7 * i) * DAY, distance=5_000)
+        for i in range(MIN_HISTORY - 1)
+    ]
+    long_climb = activity(
+        1, MONDAY + 6 * DAY, distance=20_000, total_elevation_gain=400
+    )
+
+    assert suggest_provisional_name(long_climb, sundays).name == "Run · 20 km"
+
+    enough = sundays + [activity(99, MONDAY - 50 * DAY, distance=5_000)]
+    assert suggest_provisional_name(long_climb, enough).name == (
+        "Sunday Long Hilly Run · 20 km"
+    )
+
+
+def test_same_route_is_symmetric():
+    shorter = activity(1, MONDAY, distance=10_000, route=(HOME, PARK))
+    longer = activity(2, MONDAY, distance=11_050, route=(HOME, PARK))
+    too_long = activity(3, MONDAY, distance=11_200, route=(HOME, PARK))
+
+    assert is_same_route(shorter, longer) and is_same_route(longer, shorter)
+    assert not is_same_route(shorter, too_long)
+    assert not is_same_route(too_long, shorter)
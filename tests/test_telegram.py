@@ -0,0 +1,44 @@
+import html
+import re
+
+from src.tasks.telegram import split_message
+
+ENTITY = re.compile(r"&#?\w+;")
+TAG = re.compile(r"<(/?)(\w+)[^>]*>")
+
+
+def is_balanced(part: str) -> bool:
+    open_tags = []
+    for closing, name in TAG.findall(part):
+        if not closing:
+            open_tags.append(name)
+        elif not open_tags or open_tags.pop() != name:
+            return False
+    return not open_tags
+
+
+def test_short_lines_are_kept_together():
+    message = "first line\nsecond line\nthird line"
+
+    assert split_message(message, limit=24) == ["first line\nsecond line", "third line"]
+
+
+def test_oversized_escaped_line_is_cut_between_tags_and_entities():
+    text = html.escape("Tom & Jerry's <3 intervals ") * 20
+    line = f'<b>Athlete</b> <a href="https://www.strava.com/athletes/1">{text}</a>'
+    message = f"<b>New name</b>\n{line}\nend"
+
+    parts = split_message(message, limit=100)
+
+    assert len(parts) > 2
+    for part in parts:
+        assert len(part) <= 100
+        assert is_balanced(part)
+        # no entity is cut in two
+        assert "&" not in ENTITY.sub("", part)
+        assert not re.search(r"<[^>]*$|^[^<]*>", part)
+
+    def text(message: str) -> str:
+        return html.unescape(TAG.sub("", message)).replace("\n", "")
+
+    assert "".join(text(part) for part in parts) == text(message)
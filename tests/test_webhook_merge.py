@@ -0,0 +1,56 @@
+from src.database.webhook_merge import event_key, merge_webhook_events
+
+
+def event(aspect_type: str, event_time: int, updates: dict | None = None) -> dict:
+    return {
+        "object_type": "activity",
+        "object_id": 1,
+        "owner_id": 7,
+        "aspect_type": aspect_type,
+        "event_time": event_time,
+        "updates": updates or {},
+    }
+
+
+def test_redelivered_event_has_the_same_key():
+    pending_keys = [event_key(event("create", 100))]
+
+    assert event_key(event("create", 100)) in pending_keys
+    assert event_key(event("update", 100, {"title": "Rename"})) not in pending_keys
+    assert event_key(event("create", 101)) not in pending_keys
+
+
+def test_updates_are_merged_into_the_pending_create():
+    pending = event("create", 100)
+    pending = merge_webhook_events(pending, event("update", 101, {"title": "A"}))
+    merged = merge_webhook_events(pending, event("update", 102, {"type": "Run"}))
+
+    assert merged["aspect_type"] == "create"
+    assert merged["event_time"] == 102
+    assert merged["updates"] == {"title": "A", "type": "Run"}
+
+
+def test_newer_update_values_win_whatever_the_arrival_order():
+    newer = event("update", 102, {"title": "B"})
+    older = event("update", 101, {"title": "A", "private": "true"})
+
+    merged = merge_webhook_events(newer, older)
+
+    assert merged["aspect_type"] == "update"
+    assert merged["updates"] == {"title": "B", "private": "true"}
+
+
+def test_delete_supersedes_the_pending_update():
+    pending = event("update", 101, {"title": "A"})
+
+    merged = merge_webhook_events(pending, event("delete", 102))
+
+    assert merged["aspect_type"] == "delete"
+    assert merged["updates"] == {}
+
+
+def test_create_after_delete_starts_over():
+    merged = merge_webhook_events(event("delete", 101), event("create", 102))
+
+    assert merged["aspect_type"] == "create"
+    assert merged["event_time"] == 102